@@ -0,0 +1,114 @@
+"""
+Dropoff address normalization and delivery-area validation.
+
+Addresses are normalized first: NFKC (full-width digits, letters and spaces
+to ASCII), a leading postal code and 東京都 dropped, 1丁目2番3号 written as
+1-2-3, hyphen look-alikes between digits turned into "-", and spaces before
+the block number removed. The result is then walked through a trie of every
+allowed city + town (三鷹市下連雀, 武蔵野市境南町, ...), taking the longest
+match, and must continue with a block number.
+
+check_address() is cached, so an address seen before (bulk batches repeat
+the same few thousand addresses) costs one dict lookup. check_addresses()
+validates a whole batch, checking each distinct address once.
+
+Every town here needs a centroid in data/geocodes.csv, which geo.Geocoder
+falls back to (via town_of) for addresses without an exact entry, so that
+accepted requests show up in nearest-request search and route ordering.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import ADDRESS_CACHE_SIZE
+
+DELIVERY_AREAS = {
+    "三鷹市": ("井口", "井の頭", "大沢", "上連雀", "北野", "下連雀", "新川", "深大寺", "中原", "野崎", "牟礼"),
+    "武蔵野市": (
+        "吉祥寺東町", "吉祥寺南町", "吉祥寺本町", "吉祥寺北町", "御殿山", "中町", "西久保",
+        "緑町", "八幡町", "関前", "境", "境南町", "桜堤",
+    ),
+}
+
+_PREFIX = re.compile(r"^(?:〒?\s*\d{3}-?\d{4}\s*)?(?:東京都\s*)?")
+_CHOME = re.compile(r"(\d+)\s*丁目\s*(?:(\d+)\s*(?:番地?|-)\s*(?:(\d+)\s*号?)?)?")
+_DASHES = re.compile(r"(?<=\d)\s*[‐‑‒–—―−ー]\s*(?=\d)")
+_SPACES = re.compile(r"\s+")
+_BLOCK = re.compile(r"\d+(?:-\d+){0,3}")
+
+_END = ""  # trie key marking a complete city or city + town
+
+
+def _build_trie(areas: Dict[str, Tuple[str, ...]]) -> dict:
+    trie = {}
+    entries = [(city, (city, None)) for city in areas]
+    entries += [(city + town, (city, town)) for city, towns in areas.items() for town in towns]
+    for text, value in entries:
+        node = trie
+        for char in text:
+            node = node.setdefault(char, {})
+        node[_END] = value
+    return trie
+
+
+AREA_TRIE = _build_trie(DELIVERY_AREAS)
+
+
+def _longest_area(address: str) -> Tuple[Optional[Tuple[str, Optional[str]]], int]:
+    """(city, town or None) of the longest trie match at the start of address, and its length."""
+    node, found, end = AREA_TRIE, None, 0
+    for position, char in enumerate(address):
+        node = node.get(char)
+        if node is None:
+            break
+        if _END in node:
+            found, end = node[_END], position + 1
+    return found, end
+
+
+def town_of(address: str) -> Optional[str]:
+    """The allowed city + town a normalized address starts with (e.g. 三鷹市下連雀), if any."""
+    area, _ = _longest_area(address)
+    return area[0] + area[1] if area and area[1] else None
+
+
+def _chome(match: re.Match) -> str:
+    return "-".join(part for part in match.groups() if part)
+
+
+def normalize_address(address: str) -> str:
+    text = unicodedata.normalize("NFKC", address).strip()
+    text = _PREFIX.sub("", text)
+    text = _CHOME.sub(_chome, text)
+    text = _DASHES.sub("-", text)
+    text = _SPACES.sub(" ", text)
+    # No spaces inside the city, town and block number; a building name may follow one
+    digit = re.search(r"\d", text)
+    if digit:
+        text = text[: digit.start()].replace(" ", "") + text[digit.start():]
+    return text
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def check_address(address: str) -> Tuple[Optional[str], Optional[str]]:
+    """(normalized address, None) if deliverable, else (None, reason)."""
+    if not isinstance(address, str) or not address.strip():
+        return None, "missing dropoff_address"
+    normalized = normalize_address(address)
+    area, end = _longest_area(normalized)
+    if area is None:
+        return None, f"outside the delivery area ({', '.join(DELIVERY_AREAS)})"
+    city, town = area
+    if town is None:
+        return None, f"unknown town in {city}"
+    if not _BLOCK.match(normalized, end):
+        return None, "missing block number (e.g. 1-2-3)"
+    return normalized, None
+
+
+def check_addresses(addresses: Iterable[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """check_address for a batch, in order; each distinct address is checked once."""
+    addresses = list(addresses)
+    results = {address: check_address(address) for address in dict.fromkeys(addresses)}
+    return [results[address] for address in addresses]
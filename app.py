@@ -1,10 +1,30 @@
-from flask import Flask, request, session, redirect, url_for, render_template, flash
+from flask import Flask, request, session, redirect, url_for, render_template, flash, jsonify, g, Response, abort
 from routes.auth import auth
 from routes.delivery import delivery
-from models import User, get_connection, return_connection
+from models import User, get_connection, return_connection, release_request_connection, conn_pool, user_cache, DRIVER_NAME
 from routes.stock import stock
+from routes.stats import stats
+from routes.api import api
+from routes.export import export
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from config import SECRET_KEY
+from config import (
+    SECRET_KEY,
+    METRICS_TOKEN,
+    SLOW_QUERY_MS,
+    ADMIN_DRIVER_IDS,
+    RATE_LIMIT_ACCEPT_PER_DRIVER,
+    RATE_LIMIT_ACCEPT_PER_IP,
+    RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER,
+    RATE_LIMIT_DELIVERY_UPDATE_PER_IP,
+    RATE_LIMIT_UNASSIGNED_PER_DRIVER,
+    RATE_LIMIT_UNASSIGNED_PER_IP,
+)
+from dispatch import start_background_dispatcher
+from partitions import start_background_maintenance
+from metrics import REQUEST_SECONDS, registry, start_flusher
+from query_profiler import recent_samples
+import prepared
+from rate_limits import limit_per_driver_and_ip, limiter
 from models import (
     register_driver,
     # login_driver,
@@ -19,9 +39,9 @@ from models import (
 import psycopg2
 import logging
 from datetime import timedelta
+import hmac
 import os
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+import time
 
 
 logging.basicConfig(filename="security.log", level=logging.WARNING)
@@ -40,25 +60,46 @@ app.config.update(
 app.register_blueprint(auth)
 app.register_blueprint(delivery)
 app.register_blueprint(stock)
+app.register_blueprint(stats)
+app.register_blueprint(api)
+app.register_blueprint(export)
 
 # Initialize Flask-Login
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
+# One pooled connection per request, shared by every model call and released here
+app.teardown_request(release_request_connection)
+
+# Per-driver and per-IP limits on the hot endpoints, counted across workers
+limiter.init_app(app)
+
+# Periodic batch dispatch (disabled unless DISPATCH_INTERVAL_SECONDS is set)
+start_background_dispatcher()
+# Monthly order_tracking partitions: always create ahead; archiving expired ones is opt-in
+start_background_maintenance()
+# Per-process metric snapshots for /metrics (only with METRICS_DIR)
+start_flusher()
+
 
 # User loader callback for Flask-Login
 @login_manager.user_loader
 def load_user(driver_id):
-    """Load a user from the database by driver_id."""
+    """Load a user by driver_id, from the user cache when possible."""
+    name = user_cache.get(driver_id)
+    if name is not None:
+        return User(driver_id, name)
+
     conn = get_connection()
     if not conn:
         return None
 
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT name FROM drivers WHERE driver_id = %s", (driver_id,))
+            DRIVER_NAME.execute(cur, (driver_id,))
             result = cur.fetchone()
             if result:
+                user_cache.set(driver_id, result[0])
                 return User(driver_id, result[0])  # Return a User object
             return None
     except psycopg2.Error as e:
@@ -82,12 +123,35 @@ def register():
         name = request.form["name"]
         password = request.form["password"]
         if register_driver(driver_id, name, password):
+            user_cache.invalidate(driver_id)
             flash("Registration successful!", "success")
             return redirect(url_for("auth.login"))
         flash("Registration failed. Please check your inputs.", "error")
     return render_template("register.html")
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_time(exc):
+    # Runs after a streamed response has finished, so streamed pages are timed in full
+    started = g.pop("request_started", None)
+    if started is not None:
+        status = g.pop("response_status", 500 if exc else 0)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request.endpoint or "unmatched", request.method, str(status)
+        )
+
+
 @app.before_request
 def clear_session():
     if not hasattr(app, "session_cleared"):
@@ -121,12 +185,54 @@ def clear_session():
 #     return redirect(url_for("index"))
 
 
+@app.route("/pool_stats")
+@login_required
+def pool_stats():
+    """Connection pool usage for monitoring"""
+    return jsonify(conn_pool.stats())
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint, aggregated over all worker processes"""
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        abort(401)
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/slow_queries")
+@login_required
+def slow_queries():
+    """Sampled slow statements with EXPLAIN ANALYZE plans captured by this worker"""
+    if current_user.id not in ADMIN_DRIVER_IDS:
+        abort(403)
+    return jsonify({"enabled": SLOW_QUERY_MS > 0, "threshold_ms": SLOW_QUERY_MS, "samples": recent_samples()})
+
+
+@app.route("/prepared_stats")
+@login_required
+def prepared_stats():
+    """Prepared statement counts for monitoring"""
+    return jsonify(prepared.stats())
+
+
+@app.route("/cache_stats")
+@login_required
+def cache_stats():
+    """User cache hit/miss counters for monitoring"""
+    return jsonify(user_cache.stats())
+
+
 @app.route("/dashboard")
 @login_required
 def dashboard():
     if "driver_id" not in session:
         return redirect(url_for("login"))
     stock = view_my_stock(session["driver_id"])  # Call the function here
+    if stock is None:
+        flash("Could not load your stock; please try again.", "error")
     return render_template("dashboard.html", driver_name=session["driver_name"], stock=stock)
 
 
@@ -143,11 +249,14 @@ def update_stock_route():
 
 
 @app.route("/view_unassigned_requests")
+@limit_per_driver_and_ip(RATE_LIMIT_UNASSIGNED_PER_DRIVER, RATE_LIMIT_UNASSIGNED_PER_IP)
 def view_unassigned_requests_route():
     if "driver_id" not in session:
         return redirect(url_for("login"))
     requests = view_unassigned_requests(current_user.id)
-    return render_template("unassigned_requests.html", requests=requests)
+    if requests is None:
+        flash("Could not load requests; please try again.", "error")
+    return render_template("unassigned_requests.html", requests=requests or [])
 
 
 @app.route("/view_active_deliveries")
@@ -163,10 +272,14 @@ def view_my_deliveries_route():
     if "driver_id" not in session:
         return redirect(url_for("login"))
     my_deliveries = view_my_deliveries(session["driver_id"])
+    if my_deliveries is None:
+        flash("Could not load your deliveries; please try again.", "error")
+        my_deliveries = []
     return render_template("my_deliveries.html", my_deliveries=my_deliveries)
 
 
 @app.route("/accept_delivery/<int:request_id>")
+@limit_per_driver_and_ip(RATE_LIMIT_ACCEPT_PER_DRIVER, RATE_LIMIT_ACCEPT_PER_IP)
 def accept_delivery_route(request_id):
     if "driver_id" not in session:
         return redirect(url_for("login"))
@@ -178,6 +291,7 @@ def accept_delivery_route(request_id):
 
 
 @app.route("/complete_delivery/<int:request_id>")
+@limit_per_driver_and_ip(RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER, RATE_LIMIT_DELIVERY_UPDATE_PER_IP)
 def complete_delivery_route(request_id):
     if "driver_id" not in session:
         return redirect(url_for("login"))
@@ -0,0 +1,250 @@
+"""
+ASGI entry point: the Flask app plus async-native endpoints for idle clients.
+
+Every route of the Flask app, blueprints included, is served through
+asgiref's WsgiToAsgi, one worker thread per request as under a WSGI server.
+The two endpoints whose clients mostly wait are handled natively on the
+event loop instead, so an idle client costs a coroutine and a queue rather
+than a thread and a pooled connection:
+
+    /events         Server-Sent Events, as routes.delivery.order_events
+    /api/v1/poll    long poll: returns the driver's stock and deliveries as
+                    soon as their data version differs from ?version=, or
+                    204 after ASYNC_POLL_TIMEOUT_SECONDS
+
+Both read the Flask-Login user from the signed session cookie, so a driver
+logged in through the Flask pages is recognised here as well. Queries run
+through models_async, whose pool is opened on lifespan startup.
+
+Usage:
+    uvicorn asgi:application --host 127.0.0.1 --port 8000 [--workers 4]
+"""
+import asyncio
+import json
+import logging
+import time
+from http.cookies import SimpleCookie
+from typing import Optional
+from urllib.parse import parse_qs
+
+import psycopg
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+import models_async
+from app import app
+from config import ASYNC_POLL_TIMEOUT_SECONDS, EVENTS_CLIENT_QUEUE_SIZE, EVENTS_HEARTBEAT_SECONDS
+from events import CHANNEL, DataVersions
+from metrics import REQUEST_SECONDS
+from routes.api import API_VERSION, json_default
+
+flask_app = WsgiToAsgi(app)
+
+
+class AsyncEventHub:
+    """Event-loop counterpart of events.EventHub: one LISTEN connection, asyncio subscriber queues."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._task = None
+        self.connected = False
+        self.versions = DataVersions()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def subscribe(self) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=EVENTS_CLIENT_QUEUE_SIZE)
+        self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._subscribers.discard(q)
+
+    def _broadcast(self, payload: str) -> None:
+        self.versions.observe(payload)
+        for q in list(self._subscribers):
+            try:
+                q.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Same policy as the threaded hub: drop the backlog, ask the client to resync
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(json.dumps({"type": "resync"}))
+
+    async def _listen_forever(self) -> None:
+        reconnecting = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(models_async.pool.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    if reconnecting:
+                        self._broadcast(json.dumps({"type": "resync"}))
+                    reconnecting = True
+                    self.connected = True
+                    async for notify in conn.notifies():
+                        self._broadcast(notify.payload)
+            except psycopg.Error as e:
+                logging.error(f"Async order event listener error: {e}")
+            finally:
+                self.connected = False
+            await asyncio.sleep(5)  # back off before reconnecting
+
+
+hub = AsyncEventHub()
+
+
+def session_driver_id(scope) -> Optional[str]:
+    """Driver id of the Flask-Login user in the request's session cookie, if valid."""
+    cookie = SimpleCookie()
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookie.load(value.decode("latin-1"))
+    morsel = cookie.get(app.config["SESSION_COOKIE_NAME"])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if morsel is None or serializer is None:
+        return None
+    try:
+        session = serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return session.get("_user_id")
+
+
+def query_param(scope, name: str) -> Optional[str]:
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(name)
+    return values[0] if values else None
+
+
+async def send_json(send, status: int, data=None) -> None:
+    body = b"" if data is None else json.dumps(data, separators=(",", ":"), default=json_default).encode("utf-8")
+    headers = [(b"cache-control", b"private, no-cache")]
+    if data is not None:
+        headers.append((b"content-type", b"application/json"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def order_events(scope, receive, send) -> None:
+    """Server-Sent Events feed of order changes, without a thread per client."""
+    if session_driver_id(scope) is None:
+        await send_json(send, 401, {"error": "login required"})
+        return
+    q = hub.subscribe()
+    disconnected = asyncio.create_task(wait_for_disconnect(receive))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(q.get())
+            await asyncio.wait({next_event, disconnected}, timeout=EVENTS_HEARTBEAT_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                frame = f"data: {next_event.result()}\n\n"
+            else:
+                next_event.cancel()
+                if disconnected.done():
+                    break
+                frame = ": heartbeat\n\n"
+            await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+    finally:
+        hub.unsubscribe(q)
+        disconnected.cancel()
+
+
+async def poll(scope, receive, send) -> None:
+    """Long poll for the driver's own data; answers as soon as their data version moves."""
+    started = time.perf_counter()
+    driver_id = session_driver_id(scope)
+    if driver_id is None:
+        await send_json(send, 401, {"error": "login required"})
+        return
+    seen = query_param(scope, "version")
+    q = hub.subscribe()
+    try:
+        deadline = time.monotonic() + ASYNC_POLL_TIMEOUT_SECONDS
+        # Without the listener versions are meaningless, so answer right away
+        while hub.connected and hub.versions.current(driver_id) == seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                await send_json(send, 204)
+                return
+            try:
+                await asyncio.wait_for(q.get(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        hub.unsubscribe(q)
+
+    version = hub.versions.current(driver_id)
+    stock, deliveries = await asyncio.gather(
+        models_async.view_my_stock(driver_id), models_async.view_my_deliveries(driver_id)
+    )
+    if stock is None or deliveries is None:
+        await send_json(send, 503, {"error": "database unavailable"})
+        status = 503
+    else:
+        await send_json(send, 200, {
+            "version": version,
+            "stock": stock,
+            "deliveries": {
+                "columns": ["request_id", "dropoff_address", "quantity", "ordered_at"],
+                "rows": [list(row) for row in deliveries],
+            },
+        })
+        status = 200
+    REQUEST_SECONDS.observe(time.perf_counter() - started, "asgi.poll", scope["method"], str(status))
+
+
+NATIVE_ROUTES = {
+    "/events": order_events,
+    f"/api/v{API_VERSION}/poll": poll,
+}
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await models_async.open_pool()
+                hub.start()
+            except Exception as e:  # reported to the server, which refuses to start
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await hub.stop()
+            await models_async.close_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    handler = NATIVE_ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+    if handler is not None and scope["method"] == "GET":
+        await handler(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
@@ -0,0 +1,173 @@
+"""
+Concurrency benchmark for models.accept_delivery.
+
+N threads, each acting as a different driver, race to accept the same set of
+pending requests. Each accepted delivery is completed and the driver
+restocked right away, so the delivery cap and stock never turn the rest of
+the run into rejections and the numbers are sustained accept throughput.
+Reports successful and rejected accepts separately (a rejection here means
+another driver got the request first), the mean accept latency, and
+verifies that no request was assigned twice and no driver went over
+MAX_ACTIVE_DELIVERIES. Completions add to the bench city's rows in
+city_daily_stats, which cleanup leaves alone.
+
+Usage (from the repository root, against a disposable database):
+    python -m benchmarks.accept_delivery --threads 32 --requests 500
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+
+import models
+from config import DB_CONFIG
+from helpers import MAX_ACTIVE_DELIVERIES
+
+BENCH_DRIVER_PREFIX = "B"
+BENCH_ADDRESS = "三鷹市下連雀1-1-1"
+
+
+def bench_driver_ids(count: int) -> list:
+    return [f"{BENCH_DRIVER_PREFIX}{i:03d}" for i in range(count)]
+
+
+def setup(conn, driver_ids: list, request_ids: list, stock: int) -> None:
+    with conn.cursor() as cur:
+        cleanup(cur, driver_ids, request_ids)
+        for driver_id in driver_ids:
+            cur.execute(
+                "INSERT INTO drivers (driver_id, name, password_hash, current_stock) VALUES (%s, %s, %s, %s)",
+                (driver_id, f"bench {driver_id}", b"", stock),
+            )
+        for request_id in request_ids:
+            cur.execute(
+                """
+                INSERT INTO delivery_requests (request_id, dropoff_address, quantity, status, ordered_at)
+                VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
+                """,
+                (request_id, BENCH_ADDRESS, random.randint(1, 3)),
+            )
+    conn.commit()
+
+
+def cleanup(cur, driver_ids: list, request_ids: list) -> None:
+    cur.execute("DELETE FROM order_tracking WHERE request_id = ANY(%s)", (request_ids,))
+    cur.execute("DELETE FROM driver_daily_stats WHERE driver_id = ANY(%s)", (driver_ids,))
+    cur.execute("DELETE FROM delivery_requests WHERE request_id = ANY(%s)", (request_ids,))
+    cur.execute("DELETE FROM drivers WHERE driver_id = ANY(%s)", (driver_ids,))
+
+
+def worker(
+    driver_id: str,
+    request_ids: list,
+    stock: int,
+    successes: list,
+    rejections: Counter,
+    accept_seconds: Counter,
+    failures: list,
+    start: threading.Event,
+) -> None:
+    order = request_ids[:]
+    random.shuffle(order)
+    start.wait()
+    for request_id in order:
+        began = time.perf_counter()
+        accepted = models.accept_delivery(driver_id, request_id)
+        accept_seconds[driver_id] += time.perf_counter() - began
+        if not accepted:
+            rejections[driver_id] += 1
+            continue
+        successes.append((driver_id, request_id))
+        # Free the slot and the stock again so the next accept is judged on the race alone
+        if not models.complete_delivery(driver_id, request_id):
+            failures.append(f"driver {driver_id} could not complete request {request_id}")
+        if models.restock_drivers([(driver_id, stock)]) is None:
+            failures.append(f"driver {driver_id} could not be restocked")
+
+
+def verify(conn, driver_ids: list, request_ids: list, successes: list) -> list:
+    problems = []
+    per_request = Counter(request_id for _, request_id in successes)
+    problems += [f"request {r} accepted {n} times" for r, n in per_request.items() if n > 1]
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT assigned_driver_id, COUNT(*)
+            FROM delivery_requests
+            WHERE request_id = ANY(%s) AND status = 'in-progress'
+            GROUP BY assigned_driver_id
+            """,
+            (request_ids,),
+        )
+        for driver_id, active in cur.fetchall():
+            if active > MAX_ACTIVE_DELIVERIES:
+                problems.append(f"driver {driver_id} holds {active} active deliveries")
+        cur.execute("SELECT driver_id FROM drivers WHERE driver_id = ANY(%s) AND current_stock < 0", (driver_ids,))
+        problems += [f"driver {row[0]} has negative stock" for row in cur.fetchall()]
+    conn.rollback()
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="pending requests to fight over")
+    parser.add_argument("--request-id-base", type=int, default=900_000_000)
+    parser.add_argument("--stock", type=int, default=9, help="starting stock per bench driver")
+    parser.add_argument("--keep", action="store_true", help="do not delete bench rows afterwards")
+    args = parser.parse_args()
+
+    driver_ids = bench_driver_ids(args.threads)
+    request_ids = list(range(args.request_id_base, args.request_id_base + args.requests))
+
+    admin = psycopg2.connect(**DB_CONFIG)
+    setup(admin, driver_ids, request_ids, args.stock)
+
+    # Every worker thread needs its own connection
+    models.conn_pool.maxconn = args.threads
+
+    successes, rejections, accept_seconds, failures = [], Counter(), Counter(), []
+    start = threading.Event()
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(driver_id, request_ids, args.stock, successes, rejections, accept_seconds, failures, start),
+        )
+        for driver_id in driver_ids
+    ]
+    for t in threads:
+        t.start()
+    began = time.perf_counter()
+    start.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    rejected = sum(rejections.values())
+    total_attempts = len(successes) + rejected
+    problems = failures + verify(admin, driver_ids, request_ids, successes)
+    print(f"threads:            {args.threads}")
+    print(f"attempts:           {total_attempts}")
+    print(f"accepted:           {len(successes)} ({len(successes) / elapsed:.0f}/sec)")
+    print(f"rejected:           {rejected} ({rejected / elapsed:.0f}/sec)")
+    print(f"accept latency:     {sum(accept_seconds.values()) / max(total_attempts, 1) * 1000:.2f} ms mean")
+    print(f"elapsed:            {elapsed:.3f}s (includes completing and restocking)")
+    print(f"double assignments: {sum(1 for p in problems if 'accepted' in p)}")
+    print(f"pool:               {models.conn_pool.stats()}")
+    for problem in problems:
+        print(f"  PROBLEM: {problem}")
+
+    if not args.keep:
+        with admin.cursor() as cur:
+            cleanup(cur, driver_ids, request_ids)
+        admin.commit()
+    admin.close()
+    models.conn_pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark for dispatch.plan_assignments on synthetic data (no database).
+
+Usage (from the repository root):
+    python -m benchmarks.dispatch --requests 10000 --drivers 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from dispatch import MAX_ACTIVE_DELIVERIES, plan_assignments
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--drivers", type=int, default=1_000)
+    parser.add_argument("--resigned", type=float, default=0.05, help="fraction of resigned requests")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    quantities = rng.integers(1, 4, size=args.requests)
+    priorities = rng.uniform(0, 86_400, size=args.requests)
+    driver_stock = rng.integers(0, 10, size=args.drivers)
+    driver_slots = MAX_ACTIVE_DELIVERIES - rng.integers(0, MAX_ACTIVE_DELIVERIES + 1, size=args.drivers)
+    resigned = rng.random(args.requests) < args.resigned
+    excluded = {int(i): [int(rng.integers(args.drivers))] for i in np.flatnonzero(resigned)}
+
+    timings = []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        assignments = plan_assignments(quantities, priorities, driver_stock, driver_slots, excluded)
+        timings.append(time.perf_counter() - started)
+
+    # Sanity check the plan against the acceptance rules
+    used_stock = np.zeros(args.drivers, dtype=np.int64)
+    used_slots = np.zeros(args.drivers, dtype=np.int64)
+    for req, drv in assignments:
+        used_stock[drv] += quantities[req]
+        used_slots[drv] += 1
+        assert drv not in excluded.get(req, ())
+    assert (used_stock <= driver_stock).all() and (used_slots <= driver_slots).all()
+
+    print(f"requests x drivers: {args.requests} x {args.drivers}")
+    print(f"assigned:           {len(assignments)}")
+    print(f"best / median:      {min(timings) * 1000:.1f} ms / {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
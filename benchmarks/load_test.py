@@ -0,0 +1,232 @@
+"""
+End-to-end load test for the driver routes.
+
+Simulates a fleet of drivers. Each one logs in, then loops: poll the
+unassigned requests, accept one, check its deliveries, complete or resign,
+and now and then open the order tracking page, with random think times in
+between. Reports per-route throughput, p50/p95/p99 latency and error rates
+as JSON so runs can be diffed.
+
+Drivers log in as G000000, G000001, ... with the password used by
+delivery_requests.py, so seed the database with that script first.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --drivers 50 --seconds 60 --output run.json
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --drivers 200
+    python -m benchmarks.load_test --drivers 50 --compare baseline.json
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from delivery_requests import DEFAULT_PASSWORD, driver_id_for
+
+ACCEPT_LINK = re.compile(r"/accept_delivery/(\d+)")
+COMPLETE_LINK = re.compile(r"/complete_delivery/(\d+)")
+ROUTE_IDS = re.compile(r"/\d+")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One driver's cookie session against a running server."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            _NoRedirect, urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method: str, path: str, data: dict = None) -> tuple:
+        body = urllib.parse.urlencode(data).encode() if data else None
+        req = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                return resp.status, resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+
+class TestClientSession:
+    """One driver's session through the Flask test client (no server needed)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, data: dict = None) -> tuple:
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, resp.get_data(as_text=True)
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, session, method: str, path: str, data: dict = None, expect: int = None) -> tuple:
+        """Issue one request; it counts as an error on 4xx/5xx, or if `expect` is given and not met."""
+        route = f"{method} {ROUTE_IDS.sub('/<id>', path)}"
+        started = time.perf_counter()
+        try:
+            status, body = session.request(method, path, data)
+        except Exception:  # connection failures count as errors for the route
+            status, body = 0, ""
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if status == 0 or status >= 400 or (expect and status != expect):
+                self.errors[route] += 1
+        return status, body
+
+
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def simulate_driver(index: int, make_session, recorder: Recorder, stop: threading.Event, args) -> None:
+    rng = random.Random(args.seed + index)
+
+    def think():
+        stop.wait(rng.expovariate(1 / args.think) if args.think > 0 else 0)
+
+    session = make_session()
+    status, _ = recorder.timed(
+        session, "POST", "/login", {"driver_id": driver_id_for(index), "password": args.password}, expect=302
+    )
+    if status != 302:
+        return
+
+    while not stop.is_set():
+        _, body = recorder.timed(session, "GET", "/unassigned_requests")
+        candidates = ACCEPT_LINK.findall(body)
+        think()
+        if candidates and not stop.is_set():
+            recorder.timed(session, "GET", f"/accept_delivery/{rng.choice(candidates)}")
+            think()
+
+        _, body = recorder.timed(session, "GET", "/my_deliveries")
+        mine = COMPLETE_LINK.findall(body)
+        think()
+        if mine and not stop.is_set():
+            request_id = rng.choice(mine)
+            if rng.random() < args.resign_rate:
+                recorder.timed(session, "GET", f"/resign_delivery/{request_id}")
+            else:
+                recorder.timed(session, "GET", f"/complete_delivery/{request_id}")
+            think()
+
+        if rng.random() < args.tracking_rate and not stop.is_set():
+            recorder.timed(session, "GET", "/order_tracking")
+            think()
+
+
+def build_report(recorder: Recorder, elapsed: float, args) -> dict:
+    routes = {}
+    for route in sorted(recorder.latencies):
+        ordered = sorted(recorder.latencies[route])
+        count = len(ordered)
+        routes[route] = {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+            "error_rate": round(recorder.errors[route] / count, 4) if count else 0.0,
+        }
+    return {
+        "config": {
+            "target": args.url or "test-client",
+            "drivers": args.drivers,
+            "seconds": args.seconds,
+            "think_s": args.think,
+            "resign_rate": args.resign_rate,
+            "tracking_rate": args.tracking_rate,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "routes": routes,
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Print per-route changes against an earlier report."""
+    print(f"{'route':32} {'rps':>16} {'p95 ms':>18} {'p99 ms':>18} {'errors':>14}")
+    for route, now in report["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            print(f"{route:32} (new)")
+            continue
+
+        def cell(key):
+            return f"{before[key]:>7} → {now[key]:<7}"
+
+        print(f"{route:32} {cell('throughput_rps')} {cell('p95_ms')} {cell('p99_ms')} {cell('error_rate')}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="server base URL; default runs in-process via the Flask test client")
+    parser.add_argument("--drivers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--think", type=float, default=0.5, help="mean think time between actions, seconds")
+    parser.add_argument("--resign-rate", type=float, default=0.1)
+    parser.add_argument("--tracking-rate", type=float, default=0.2, help="chance per loop of opening order tracking")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    args = parser.parse_args()
+
+    if args.url:
+        def make_session():
+            return HttpSession(args.url)
+    else:
+        from app import app
+
+        app.config["SESSION_COOKIE_SECURE"] = False  # the test client talks plain http
+
+        def make_session():
+            return TestClientSession(app)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=simulate_driver, args=(i, make_session, recorder, stop, args), daemon=True)
+        for i in range(args.drivers)
+    ]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=60)
+    report = build_report(recorder, time.perf_counter() - began, args)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Login storm benchmark against a running server.
+
+Many threads log in as the same driver while a probe thread keeps hitting a
+cheap page. Reports logins/sec and the probe's latency percentiles, which
+show whether bcrypt work is starving other routes.
+
+Usage (start the app first, e.g. `python app.py`):
+    python -m benchmarks.login_storm --url http://127.0.0.1:5000 \
+        --driver-id D001 --password secret_pw1 --threads 50 --seconds 20
+"""
+import argparse
+import http.cookiejar
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def login_once(url: str, driver_id: str, password: str) -> bool:
+    opener = urllib.request.build_opener(
+        _NoRedirect, urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+    )
+    data = urllib.parse.urlencode({"driver_id": driver_id, "password": password}).encode()
+    try:
+        opener.open(f"{url}/login", data=data, timeout=30)
+        return False  # A successful login redirects to the dashboard
+    except urllib.error.HTTPError as e:
+        return e.code == 302 and "dashboard" in e.headers.get("Location", "")
+    except urllib.error.URLError:
+        return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--driver-id", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--probe-path", default="/login", help="cheap page timed during the storm")
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    results = {"ok": 0, "failed": 0}
+    lock = threading.Lock()
+    probe_latencies = []
+
+    def storm():
+        while not stop.is_set():
+            ok = login_once(args.url, args.driver_id, args.password)
+            with lock:
+                results["ok" if ok else "failed"] += 1
+
+    def probe():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(f"{args.url}{args.probe_path}", timeout=30).read()
+            except urllib.error.URLError:
+                pass
+            probe_latencies.append(time.perf_counter() - started)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=storm) for _ in range(args.threads)]
+    threads.append(threading.Thread(target=probe))
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    print(f"logins ok/failed:   {results['ok']}/{results['failed']}")
+    print(f"logins/sec:         {results['ok'] / elapsed:.1f}")
+    print(f"probe requests:     {len(probe_latencies)}")
+    for pct in (50, 95, 99):
+        print(f"probe p{pct}:          {percentile(probe_latencies, pct) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
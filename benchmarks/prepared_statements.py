@@ -0,0 +1,90 @@
+"""
+Planning overhead of the hot models queries, sent as text vs. prepared.
+
+Seeds the same scratch schema as benchmarks.unassigned_requests, then for
+each statement compares:
+  - planning time reported by EXPLAIN ANALYZE for the text query and for
+    EXECUTE of the prepared statement (after --warmup executions, by which
+    point Postgres may have switched to a cached generic plan),
+  - wall time per call over --calls round trips, including the client.
+
+Usage (from the repository root):
+    python -m benchmarks.prepared_statements --rows 200000 --calls 2000
+"""
+import argparse
+import json
+import time
+
+import psycopg2
+
+from benchmarks.unassigned_requests import SCHEMA, seed
+from config import DB_CONFIG, UNASSIGNED_REQUESTS_LIMIT
+from models import ACTIVE_DELIVERY, ACTIVE_DELIVERY_COUNT, MY_DELIVERIES, UNASSIGNED_REQUESTS
+
+DRIVER_ID = "D001"
+
+
+def cases(limit: int) -> list:
+    return [
+        (UNASSIGNED_REQUESTS, {"driver_id": DRIVER_ID, "limit": limit, "request_ids": None}),
+        (MY_DELIVERIES, (DRIVER_ID,)),
+        (ACTIVE_DELIVERY_COUNT, (DRIVER_ID,)),
+        (ACTIVE_DELIVERY, (1, "D001")),
+    ]
+
+
+def planning_ms(cur, query: str, params) -> float:
+    cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+    plan = cur.fetchone()[0]
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    return plan["Planning Time"]
+
+
+def wall_us(cur, query: str, params, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        cur.execute(query, params)
+        cur.fetchall()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=10, help="prepared executions before measuring")
+    parser.add_argument("--limit", type=int, default=UNASSIGNED_REQUESTS_LIMIT)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            print(f"seeding {args.rows} requests into schema {SCHEMA} ...")
+            seed(cur, args.rows, 0.2, 500)
+
+            print(f"{'statement':24} {'plan ms text':>13} {'plan ms prep':>13} {'us/call text':>13} {'us/call prep':>13}")
+            for statement, params in cases(args.limit):
+                positional = statement._args(params)
+                cur.execute(statement.prepare_sql)
+                for _ in range(args.warmup):
+                    cur.execute(statement.execute_sql, positional)
+                    cur.fetchall()
+                text_plan = planning_ms(cur, statement.sql, params)
+                prepared_plan = planning_ms(cur, statement.execute_sql, positional)
+                text_wall = wall_us(cur, statement.sql, params, args.calls)
+                prepared_wall = wall_us(cur, statement.execute_sql, positional, args.calls)
+                print(
+                    f"{statement.name:24} {text_plan:13.3f} {prepared_plan:13.3f} "
+                    f"{text_wall:13.1f} {prepared_wall:13.1f}"
+                )
+                cur.execute(f"DEALLOCATE {statement.name}")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
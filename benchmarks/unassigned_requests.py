@@ -0,0 +1,221 @@
+"""
+Before/after EXPLAIN timings for models.view_unassigned_requests.
+
+Seeds a scratch schema (never the real tables) with --rows delivery requests
+(10% pending), resigned rows for a share of those and --rows completed history
+rows, then times:
+  1. the old two-query version plus the Python merge,
+  2. the single anti-join query without indexes,
+  3. the same query with the partial indexes from migrations/v0001_initial_schema.py.
+
+Usage (from the repository root):
+    python -m benchmarks.unassigned_requests --rows 1000000 [--plans]
+
+Results with --rows 1000000 on PostgreSQL 16.2 (driver D001, limit 200):
+
+    variant                         EXPLAIN ms   wall ms     rows
+    old: 2 queries + merge               355.9     977.4   100000
+    new: anti-join, no index           23275.5   21708.8      200
+    new: anti-join, partial idx            1.7       2.0      200
+
+Plan shapes (EXPLAIN ANALYZE, COSTS OFF):
+  old, pending: Seq Scan on delivery_requests with a hashed NOT IN subplan
+    (Parallel Seq Scan on order_tracking), 100000 rows returned, 191 ms;
+  old, resigned: Parallel Seq Scan on order_tracking, 19854 rows, 155 ms;
+    both results are then shipped to Python, merged and sorted there.
+  new, no index: Limit -> Nested Loop Left Join over a Gather Merge/Sort of
+    the pending requests, but each of the 200 outer rows drives a Seq Scan of
+    order_tracking (106 ms x 200 loops), 21.5 s - the anti-join is only
+    faster with the indexes, so migration v0001 must have run.
+  new, partial idx: Limit -> Nested Loop Left Join, Index Scan using
+    delivery_requests_pending_idx (already in ordered_at order, no sort) and
+    Index Scan using order_tracking_resigned_idx per row, 0.8 ms.
+"""
+import argparse
+import json
+import time
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+from config import DB_CONFIG, UNASSIGNED_REQUESTS_LIMIT
+from models import UNASSIGNED_REQUESTS_QUERY
+
+SCHEMA = "bench_unassigned"
+
+OLD_PENDING_QUERY = """
+    SELECT request_id, NULL AS driver_id, dropoff_address, quantity, ordered_at, 'pending' AS status
+    FROM delivery_requests
+    WHERE status = 'pending'
+    AND request_id NOT IN (
+        SELECT request_id FROM order_tracking WHERE status = 'pending(*)' AND driver_id = %s
+    )
+"""
+
+OLD_RESIGNED_QUERY = """
+    SELECT request_id, driver_id, dropoff_address, quantity, ordered_at, 'pending(*)' AS status
+    FROM order_tracking
+    WHERE status = 'pending(*)' AND driver_id != %s
+"""
+
+INDEXES = [
+    """
+    CREATE INDEX delivery_requests_pending_idx
+        ON delivery_requests (ordered_at, request_id) WHERE status = 'pending'
+    """,
+    """
+    CREATE INDEX order_tracking_resigned_idx
+        ON order_tracking (request_id, driver_id) WHERE status = 'pending(*)'
+    """,
+]
+
+
+def seed(cur, rows: int, resigned_share: float, drivers: int) -> None:
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path TO {SCHEMA}")
+    cur.execute(
+        """
+        CREATE TABLE delivery_requests (
+            request_id INTEGER PRIMARY KEY,
+            dropoff_address TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            assigned_driver_id VARCHAR(4),
+            ordered_at TIMESTAMP NOT NULL,
+            start_time TIMESTAMP
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE order_tracking (
+            history_id SERIAL PRIMARY KEY,
+            request_id INTEGER NOT NULL,
+            driver_id VARCHAR(4),
+            dropoff_address TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            ordered_at TIMESTAMP NOT NULL,
+            completed_at TIMESTAMP,
+            status VARCHAR(20) NOT NULL
+        )
+        """
+    )
+    # 10% pending, the rest in progress; history carries completed rows too
+    cur.execute(
+        """
+        INSERT INTO delivery_requests (request_id, dropoff_address, quantity, status, assigned_driver_id, ordered_at)
+        SELECT i, '三鷹市下連雀' || (i %% 3 + 1) || '-1-1', i %% 3 + 1,
+               CASE WHEN i %% 10 = 0 THEN 'pending' ELSE 'in-progress' END,
+               CASE WHEN i %% 10 = 0 THEN NULL ELSE 'D' || lpad((i %% %(drivers)s)::text, 3, '0') END,
+               TIMESTAMP '2025-01-01' + (i || ' seconds')::interval
+        FROM generate_series(1, %(rows)s) AS i
+        """,
+        {"rows": rows, "drivers": drivers},
+    )
+    cur.execute(
+        """
+        INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
+        SELECT request_id, 'D' || lpad((request_id %% %(drivers)s)::text, 3, '0'), dropoff_address, quantity,
+               ordered_at, NULL, 'pending(*)'
+        FROM delivery_requests
+        WHERE status = 'pending' AND random() < %(share)s
+        """,
+        {"drivers": drivers, "share": resigned_share},
+    )
+    cur.execute(
+        """
+        INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
+        SELECT i + %(rows)s, 'D' || lpad((i %% %(drivers)s)::text, 3, '0'), '武蔵野市境1-11-11', 1,
+               TIMESTAMP '2024-01-01' + (i || ' seconds')::interval,
+               TIMESTAMP '2024-01-01' + (i || ' seconds')::interval + interval '1 hour', 'completed'
+        FROM generate_series(1, %(rows)s) AS i
+        """,
+        {"rows": rows, "drivers": drivers},
+    )
+    cur.execute("ANALYZE delivery_requests")
+    cur.execute("ANALYZE order_tracking")
+
+
+def explain_ms(cur, query: str, params) -> float:
+    cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+    plan = cur.fetchone()[0]
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    return plan["Planning Time"] + plan["Execution Time"]
+
+
+def plan_text(cur, query: str, params) -> str:
+    cur.execute(f"EXPLAIN (ANALYZE, COSTS OFF) {query}", params)
+    return "\n".join(row[0] for row in cur.fetchall())
+
+
+def time_old(cur, driver_id: str) -> tuple:
+    explain = explain_ms(cur, OLD_PENDING_QUERY, (driver_id,)) + explain_ms(cur, OLD_RESIGNED_QUERY, (driver_id,))
+    started = time.perf_counter()
+    cur.execute(OLD_PENDING_QUERY, (driver_id,))
+    rows = cur.fetchall()
+    cur.execute(OLD_RESIGNED_QUERY, (driver_id,))
+    rows += cur.fetchall()
+    unique = {}
+    for req in rows:
+        if req["request_id"] not in unique or req["status"] == "pending(*)":
+            unique[req["request_id"]] = req
+    return explain, (time.perf_counter() - started) * 1000, len(unique)
+
+
+def time_new(cur, driver_id: str, limit: int) -> tuple:
+    params = {"driver_id": driver_id, "limit": limit, "request_ids": None}
+    explain = explain_ms(cur, UNASSIGNED_REQUESTS_QUERY, params)
+    started = time.perf_counter()
+    cur.execute(UNASSIGNED_REQUESTS_QUERY, params)
+    rows = cur.fetchall()
+    return explain, (time.perf_counter() - started) * 1000, len(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--resigned-share", type=float, default=0.2)
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=UNASSIGNED_REQUESTS_LIMIT)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    parser.add_argument("--plans", action="store_true", help="also print EXPLAIN ANALYZE plans")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    driver_id = "D001"
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            print(f"seeding {args.rows} requests into schema {SCHEMA} ...")
+            seed(cur, args.rows, args.resigned_share, args.drivers)
+
+            new_params = {"driver_id": driver_id, "limit": args.limit, "request_ids": None}
+            plans = []
+            results = [("old: 2 queries + merge", *time_old(cur, driver_id))]
+            plans.append(("old: pending query", plan_text(cur, OLD_PENDING_QUERY, (driver_id,))))
+            plans.append(("old: resigned query", plan_text(cur, OLD_RESIGNED_QUERY, (driver_id,))))
+            results.append(("new: anti-join, no index", *time_new(cur, driver_id, args.limit)))
+            plans.append(("new: anti-join, no index", plan_text(cur, UNASSIGNED_REQUESTS_QUERY, new_params)))
+            for ddl in INDEXES:
+                cur.execute(ddl)
+            cur.execute("ANALYZE delivery_requests")
+            cur.execute("ANALYZE order_tracking")
+            results.append(("new: anti-join, partial idx", *time_new(cur, driver_id, args.limit)))
+            plans.append(("new: anti-join, partial idx", plan_text(cur, UNASSIGNED_REQUESTS_QUERY, new_params)))
+
+            if args.plans:
+                for name, plan in plans:
+                    print(f"-- {name}\n{plan}\n")
+
+            print(f"{'variant':30} {'EXPLAIN ms':>11} {'wall ms':>9} {'rows':>8}")
+            for name, explain, wall, rows in results:
+                print(f"{name:30} {explain:11.1f} {wall:9.1f} {rows:8d}")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,105 @@ DB_CONFIG = {
 }
 
 SECRET_KEY = os.getenv("SECRET_KEY")
+
+# Connection pool
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))  # seconds
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))  # seconds
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))  # idle seconds
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "600"))  # close idle connections beyond DB_POOL_MIN
+# Server-side prepared statements for the hot queries (see prepared.py); off behind transaction pooling
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "True").lower() == "true"
+
+# Order tracking pagination
+ORDER_TRACKING_PAGE_SIZE = int(os.getenv("ORDER_TRACKING_PAGE_SIZE", "100"))
+ORDER_TRACKING_MAX_PAGE_SIZE = int(os.getenv("ORDER_TRACKING_MAX_PAGE_SIZE", "500"))
+
+# Batch auto-dispatch
+DISPATCH_INTERVAL_SECONDS = float(os.getenv("DISPATCH_INTERVAL_SECONDS", "0"))  # 0 disables the background job
+DISPATCH_BATCH_LIMIT = int(os.getenv("DISPATCH_BATCH_LIMIT", "10000"))
+DISPATCH_RESIGN_BOOST_SECONDS = float(os.getenv("DISPATCH_RESIGN_BOOST_SECONDS", "1800"))
+
+# Flask-Login user cache
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))  # seconds
+USER_CACHE_SHARED_PATH = os.getenv("USER_CACHE_SHARED_PATH")  # SQLite file shared by workers; unset = per-process only
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # changing this rehashes passwords on next login
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))  # 0 hashes on the request thread
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+PASSWORD_TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", "10"))  # seconds
+
+# Unassigned requests page
+UNASSIGNED_REQUESTS_LIMIT = int(os.getenv("UNASSIGNED_REQUESTS_LIMIT", "200"))
+
+# Live order events (Server-Sent Events)
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_CLIENT_QUEUE_SIZE = int(os.getenv("EVENTS_CLIENT_QUEUE_SIZE", "256"))
+
+# Geocoding and nearest-request lookup
+GEOCODES_PATH = os.getenv("GEOCODES_PATH", os.path.join(os.path.dirname(__file__), "data", "geocodes.csv"))
+GEO_CELL_METERS = float(os.getenv("GEO_CELL_METERS", "250"))
+GEO_INDEX_TTL = float(os.getenv("GEO_INDEX_TTL", "10"))  # seconds before the pending index is rebuilt
+NEAREST_REQUESTS_DEFAULT = int(os.getenv("NEAREST_REQUESTS_DEFAULT", "20"))
+NEAREST_REQUESTS_MAX = int(os.getenv("NEAREST_REQUESTS_MAX", "200"))
+
+# Route planning for active deliveries
+DISTANCE_MATRIX_PATH = os.getenv("DISTANCE_MATRIX_PATH", os.path.join(os.path.dirname(__file__), "data", "distances.npy"))
+ROUTE_EXACT_MAX_STOPS = int(os.getenv("ROUTE_EXACT_MAX_STOPS", "7"))  # more stops fall back to nearest-neighbour
+
+# order_tracking partitions and archival
+ORDER_TRACKING_PARTITIONS_AHEAD = int(os.getenv("ORDER_TRACKING_PARTITIONS_AHEAD", "3"))  # months
+ORDER_TRACKING_RETENTION_MONTHS = int(os.getenv("ORDER_TRACKING_RETENTION_MONTHS", "24"))
+ORDER_TRACKING_ARCHIVE_DIR = os.getenv("ORDER_TRACKING_ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "data", "archive"))
+PARTITION_CREATE_INTERVAL_SECONDS = float(os.getenv("PARTITION_CREATE_INTERVAL_SECONDS", "21600"))  # months ahead; 0 disables
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "0"))  # archival, e.g. 21600; 0 disables
+
+# Delivery statistics (daily rollups)
+STATS_DEFAULT_DAYS = int(os.getenv("STATS_DEFAULT_DAYS", "7"))
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "366"))
+STATS_TOP_DRIVERS = int(os.getenv("STATS_TOP_DRIVERS", "100"))
+
+# Metrics (/metrics, Prometheus text format)
+METRICS_DIR = os.getenv("METRICS_DIR", "")  # shared snapshot directory for multi-process servers; clear it on start
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # if set, scrapes must send "Authorization: Bearer <token>"
+
+# Slow-query capture (off unless SLOW_QUERY_MS > 0)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.05"))  # fraction re-run under EXPLAIN ANALYZE
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+ADMIN_DRIVER_IDS = [d for d in os.getenv("ADMIN_DRIVER_IDS", "").split(",") if d]  # may open /admin pages
+
+# Async data layer and ASGI entry point (asgi.py)
+ASYNC_DB_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", "1"))
+ASYNC_DB_POOL_MAX = int(os.getenv("ASYNC_DB_POOL_MAX", "20"))
+ASYNC_POLL_TIMEOUT_SECONDS = float(os.getenv("ASYNC_POLL_TIMEOUT_SECONDS", "25"))  # longest /api/v1/poll wait
+
+# Rate limits ("<count>/<period>" per Flask-Limiter; an empty string disables one)
+RATE_LIMIT_STORAGE_URI = os.getenv(
+    "RATE_LIMIT_STORAGE_URI", "mmap://" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ratelimits.bin")
+)  # shared by the workers on this host; "memory://" counts per process
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+RATE_LIMIT_ACCEPT_PER_DRIVER = os.getenv("RATE_LIMIT_ACCEPT_PER_DRIVER", "30/minute")
+RATE_LIMIT_ACCEPT_PER_IP = os.getenv("RATE_LIMIT_ACCEPT_PER_IP", "300/minute")
+RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER = os.getenv("RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER", "30/minute")  # resign, complete
+RATE_LIMIT_DELIVERY_UPDATE_PER_IP = os.getenv("RATE_LIMIT_DELIVERY_UPDATE_PER_IP", "300/minute")
+RATE_LIMIT_UNASSIGNED_PER_DRIVER = os.getenv("RATE_LIMIT_UNASSIGNED_PER_DRIVER", "60/minute")  # also nearest_requests
+RATE_LIMIT_UNASSIGNED_PER_IP = os.getenv("RATE_LIMIT_UNASSIGNED_PER_IP", "600/minute")
+
+# Driver stock
+# Bags a driver may carry. Not an env setting: the drivers_stock_range CHECK
+# (migrations/v0001) is built from it, so changing it needs a migration too.
+MAX_STOCK = 9
+RESTOCK_MAX_DRIVERS = int(os.getenv("RESTOCK_MAX_DRIVERS", "5000"))  # per /api/v1/restock request
+
+# Exports (export.py, /export)
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))  # per process; each holds its own connection
+EXPORT_PARQUET_BLOCK_BYTES = int(os.getenv("EXPORT_PARQUET_BLOCK_BYTES", str(8 << 20)))  # CSV per Parquet row group
+
+# Bulk order intake (intake.py, POST /api/v1/requests)
+ADDRESS_CACHE_SIZE = int(os.getenv("ADDRESS_CACHE_SIZE", "65536"))  # normalized addresses kept per process
+INTAKE_MAX_ROWS = int(os.getenv("INTAKE_MAX_ROWS", "100000"))  # per POST
@@ -0,0 +1,267 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+# Upper bounds (seconds) of the acquire latency histogram buckets
+ACQUIRE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    - Connections are created lazily on first use, so importing the module
+      never touches the database and forked workers start with a fresh pool.
+      The first checkout in a process starts a background top-up to
+      `minconn` connections.
+    - Idle connections are health-checked before being handed out and
+      recycled once they exceed `max_lifetime`; connections beyond `minconn`
+      idle for more than `idle_timeout` are closed.
+    - The lock only guards the pool's bookkeeping: connecting, health checks,
+      rollbacks and closes all run outside it, so one slow server round trip
+      never stalls other threads' checkouts and returns.
+    - `stats()` reports connections in use, waiting threads and an acquire
+      latency histogram.
+    """
+
+    def __init__(
+        self,
+        dsn_kwargs: dict,
+        minconn: int = 1,
+        maxconn: int = 10,
+        acquire_timeout: float = 5.0,
+        max_lifetime: float = 3600.0,
+        health_check_after: float = 30.0,
+        idle_timeout: float = 600.0,
+    ):
+        self._dsn_kwargs = dsn_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._reset()
+
+    def _reset(self) -> None:
+        """Start from an empty pool owned by the current process."""
+        self._pid = os.getpid()
+        self._idle = []  # [(conn, created_at, returned_at)], most recently returned last
+        self._in_use = {}  # id(conn) -> (conn, created_at)
+        self._waiting = 0
+        self._connecting = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._acquire_counts = [0] * len(ACQUIRE_BUCKETS)
+        self._acquire_sum = 0.0
+        self._warm_up_started = False
+
+    def _check_fork(self) -> None:
+        # Connections inherited from the parent share its sockets; drop them
+        # without closing, which would terminate the parent's sessions.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._connecting
+
+    def _needs_check(self, conn, created_at: float, returned_at: float) -> Optional[bool]:
+        """False if the connection is unusable, True if it must be pinged first, None if fine as is."""
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        return True if now - returned_at >= self.health_check_after else None
+
+    @staticmethod
+    def _ping(conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error as e:
+            logging.error(f"Failed to close discarded connection: {e}")
+
+    def _trim_idle(self) -> list:
+        """Under the lock: take idle connections past idle_timeout, keeping minconn; caller closes them."""
+        now = time.monotonic()
+        stale = []
+        for entry in list(self._idle):  # oldest returned first
+            if self._size() <= self.minconn or now - entry[2] <= self.idle_timeout:
+                break
+            self._idle.remove(entry)
+            self._discarded += 1
+            stale.append(entry[0])
+        return stale
+
+    def _record_acquire(self, seconds: float) -> None:
+        self._acquire_sum += seconds
+        for i, bound in enumerate(ACQUIRE_BUCKETS):
+            if seconds <= bound:
+                self._acquire_counts[i] += 1
+                break
+
+    def getconn(self, timeout: Optional[float] = None) -> extensions.connection:
+        """Check out a connection, waiting up to `timeout` seconds for one to be free."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            candidate = None
+            with self._available:
+                self._check_fork()
+                if not self._warm_up_started and self.minconn > 0:
+                    self._warm_up_started = True
+                    threading.Thread(target=self.warm_up, name="db-pool-warm-up", daemon=True).start()
+                while True:
+                    if self._idle:
+                        conn, created_at, returned_at = self._idle.pop()
+                        # Counted as in use while it is checked outside the lock
+                        self._in_use[id(conn)] = (conn, created_at)
+                        candidate = (conn, self._needs_check(conn, created_at, returned_at))
+                        break
+
+                    if self._size() < self.maxconn:
+                        # Reserve the slot, then connect outside the lock
+                        self._connecting += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+                    self._waiting += 1
+                    try:
+                        self._available.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if candidate is None:
+                break
+            conn, check = candidate
+            if check is None or (check and self._ping(conn)):
+                with self._available:
+                    self._record_acquire(time.monotonic() - started)
+                return conn
+            self._close(conn)
+            with self._available:
+                self._in_use.pop(id(conn), None)
+                self._discarded += 1
+                self._available.notify()
+
+        try:
+            conn = psycopg2.connect(**self._dsn_kwargs)
+        except psycopg2.Error:
+            with self._available:
+                self._connecting -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._connecting -= 1
+            self._created += 1
+            self._in_use[id(conn)] = (conn, time.monotonic())
+            self._record_acquire(time.monotonic() - started)
+        return conn
+
+    def putconn(self, conn: extensions.connection) -> None:
+        """Return a connection, rolling back any open transaction."""
+        with self._available:
+            if self._pid != os.getpid():
+                return
+            entry = self._in_use.get(id(conn))
+            if entry is None:
+                logging.error("Returned a connection that does not belong to this pool.")
+                return
+            created_at = entry[1]
+
+        # Still counted as in use until it is back in the idle list
+        usable = not conn.closed and time.monotonic() - created_at <= self.max_lifetime
+        if usable and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                usable = False
+
+        with self._available:
+            self._in_use.pop(id(conn), None)
+            keep = usable and self._pid == os.getpid() and len(self._idle) < self.maxconn
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            elif not conn.closed:
+                self._discarded += 1
+            stale = self._trim_idle()
+            self._available.notify()
+        if not keep and not conn.closed:
+            self._close(conn)
+        for idle in stale:
+            self._close(idle)
+
+    def warm_up(self) -> None:
+        """Open idle connections until the pool holds `minconn`; errors are logged, not raised."""
+        while True:
+            with self._available:
+                self._check_fork()
+                if self._size() >= min(self.minconn, self.maxconn):
+                    return
+                self._connecting += 1
+            try:
+                conn = psycopg2.connect(**self._dsn_kwargs)
+            except psycopg2.Error as e:
+                logging.error(f"Failed to warm up connection pool: {e}")
+                with self._available:
+                    self._connecting -= 1
+                    self._available.notify()
+                return
+            with self._available:
+                self._connecting -= 1
+                self._created += 1
+                now = time.monotonic()
+                self._idle.append((conn, now, now))
+                self._available.notify()
+
+    def closeall(self) -> None:
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._discarded += len(idle)
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage for monitoring."""
+        with self._lock:
+            self._check_fork()
+            total = sum(self._acquire_counts)
+            return {
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "max": self.maxconn,
+                "created": self._created,
+                "discarded": self._discarded,
+                "timeouts": self._timeouts,
+                "acquire_count": total,
+                "acquire_seconds_sum": round(self._acquire_sum, 6),
+                "acquire_seconds_buckets": {
+                    ("+Inf" if bound == float("inf") else str(bound)): count
+                    for bound, count in zip(ACQUIRE_BUCKETS, self._acquire_counts)
+                },
+            }
@@ -1,96 +1,32 @@
-# import csv
-# # from datetime import datetime
-# import random
-
-# # Define addresses in both cities
-# MITAKA_ADDRESSES = [
-#     "三鷹市下連雀1-1-1",
-#     "三鷹市下連雀2-2-2",
-#     "三鷹市下連雀3-3-3",
-#     "三鷹市井の頭1-4-4",
-#     "三鷹市井の頭2-5-5",
-#     "三鷹市牟礼1-6-6",
-#     "三鷹市牟礼2-7-7",
-#     "三鷹市北野1-8-8",
-#     "三鷹市北野2-9-9",
-#     "三鷹市新川1-10-10",
-#     "三鷹市新川2-11-11",
-#     "三鷹市中原1-12-12",
-#     "三鷹市中原2-13-13",
-#     "三鷹市深大寺1-14-14",
-#     "三鷹市深大寺2-15-15",
-# ]
-
-# MUSASHINO_ADDRESSES = [
-#     "武蔵野市吉祥寺本町1-1-1",
-#     "武蔵野市吉祥寺本町2-2-2",
-#     "武蔵野市吉祥寺南町1-3-3",
-#     "武蔵野市吉祥寺南町2-4-4",
-#     "武蔵野市中町1-5-5",
-#     "武蔵野市中町2-6-6",
-#     "武蔵野市御殿山1-7-7",
-#     "武蔵野市御殿山2-8-8",
-#     "武蔵野市桜堤1-9-9",
-#     "武蔵野市桜堤2-10-10",
-#     "武蔵野市境1-11-11",
-#     "武蔵野市境2-12-12",
-#     "武蔵野市境南町1-13-13",
-#     "武蔵野市境南町2-14-14",
-#     "武蔵野市関前1-15-15",
-# ]
-
-
-# # Generate random datetime on 2025-02-13
-# def random_datetime():
-#     hour = random.randint(0, 23)
-#     minute = random.randint(0, 59)
-#     second = random.randint(0, 59)
-#     microsecond = random.randint(0, 999999)
-#     return f"2025-02-13 {hour:02d}:{minute:02d}:{second:02d}.{microsecond:06d}"
-
-
-# # Write to CSV with explicit NULL values
-# with open("delivery_requests.csv", "w", newline="", encoding="utf-8") as f:
-#     writer = csv.writer(f)
-#     # Write header
-#     writer.writerow(
-#         [
-#             "request_id",
-#             "dropoff_address",
-#             "quantity",
-#             "status",
-#             "assigned_driver_id",
-#             "ordered_at",
-#             "start_time",
-#         ]
-#     )
-
-#     # Write 30 requests
-#     for i in range(1, 31):
-#         writer.writerow(
-#             [
-#                 i,  # request_id
-#                 random.choice(MITAKA_ADDRESSES + MUSASHINO_ADDRESSES),  # dropoff_address
-#                 random.randint(1, 3),  # quantity
-#                 "pending",  # status
-#                 "NULL",  # assigned_driver_id
-#                 random_datetime(),  # ordered_at
-#                 "NULL",  # start_time
-#             ]
-#         )
-
-# print("delivery_requests.csv has been generated successfully!")
-
-
+"""
+Synthetic data generator for sizing and load testing.
+
+Streams drivers, delivery requests and order history into the database with
+COPY FROM STDIN. Rows are produced by generators and encoded on the fly, so
+memory stays flat no matter how many rows are loaded. Connection settings
+come from config.DB_CONFIG.
+
+Usage:
+    python delivery_requests.py --drivers 2000 --requests 1000000 --history 10000000
+    python delivery_requests.py --requests 30 --truncate      # small demo data set
+"""
+import argparse
+import io
 import random
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
 import psycopg2
 
+from config import DB_CONFIG, BCRYPT_ROUNDS
+from partitions import ensure_partitions, is_partitioned
+
 # Define addresses in both cities
 MITAKA_ADDRESSES = [
     "三鷹市下連雀1-1-1",
     "三鷹市下連雀2-2-2",
-    "三鷷市下連雀3-3-3",
+    "三鷹市下連雀3-3-3",
     "三鷹市井の頭1-4-4",
     "三鷹市井の頭2-5-5",
     "三鷹市牟礼1-6-6",
@@ -123,53 +59,179 @@ MUSASHINO_ADDRESSES = [
     "武蔵野市関前1-15-15",
 ]
 
+ALL_ADDRESSES = MITAKA_ADDRESSES + MUSASHINO_ADDRESSES
+
+# Relative order volume per hour of day: quiet nights, lunch and evening peaks
+HOURLY_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 14, 16, 12, 9, 8, 9, 12, 16, 15, 11, 7, 4, 2]
+_CUMULATIVE_HOURS = [sum(HOURLY_WEIGHTS[: i + 1]) for i in range(24)]
+
+DEFAULT_PASSWORD = "password_1"
+
+NULL = "\\N"  # COPY text format NULL marker
+
 
-def random_datetime():
-    hour = random.randint(0, 23)
-    minute = random.randint(0, 59)
-    second = random.randint(0, 59)
-    microsecond = random.randint(0, 999999)
-    return datetime(2025, 2, 13, hour, minute, second, microsecond)
+class IteratorStream(io.RawIOBase):
+    """Read-only file object over an iterator of text lines, for copy_expert."""
 
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+        self.rows = 0
 
-try:
-    # Connect to the database
-    conn = psycopg2.connect(
-        dbname="taxi", user="postgres", password="kakashka3kakashka4", host="localhost", port="5432"
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            self._buffer += line.encode("utf-8")
+            self.rows += 1
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def random_datetime(rng: random.Random, start: datetime, days: int) -> datetime:
+    """Random order time in [start, start + days), weighted toward busy hours."""
+    hour = rng.choices(range(24), cum_weights=_CUMULATIVE_HOURS)[0]
+    return start + timedelta(
+        days=rng.randrange(days), hours=hour, seconds=rng.randrange(3600), microseconds=rng.randrange(1_000_000)
     )
-    cur = conn.cursor()
-
-    # First, clear existing data (optional)
-    cur.execute("TRUNCATE TABLE delivery_requests RESTART IDENTITY")
-
-    # Insert 30 requests
-    for i in range(1, 31):
-        cur.execute(
-            """
-            INSERT INTO delivery_requests
-            (request_id, dropoff_address, quantity, status, assigned_driver_id, ordered_at, start_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """,
-            (
-                i,  # request_id
-                random.choice(MITAKA_ADDRESSES + MUSASHINO_ADDRESSES),  # dropoff_address
-                random.randint(1, 3),  # quantity
-                "pending",  # status
-                None,  # assigned_driver_id
-                random_datetime(),  # ordered_at
-                None,  # start_time
-            ),
+
+
+def driver_id_for(index: int) -> str:
+    return f"G{index:06d}"
+
+
+def driver_lines(count: int, first_driver: int, password_hash: bytes, seed: int):
+    rng = random.Random(seed)
+    hex_hash = "\\\\x" + password_hash.hex()
+    for i in range(first_driver, first_driver + count):
+        yield f"{driver_id_for(i)}\tDriver {i}\t{rng.randint(0, 9)}\t{hex_hash}\n"
+
+
+def request_rows(count: int, first_id: int, drivers: int, first_driver: int, pending_share: float,
+                 start: datetime, days: int, seed: int):
+    """
+    Yield (request_id, address, quantity, status, driver_id, ordered_at) for live requests.
+    In-progress requests go three to a generated driver, like the real cap;
+    once every driver is full the rest stay pending.
+    """
+    rng = random.Random(seed)
+    active = 0
+    for i in range(count):
+        ordered_at = random_datetime(rng, start, days)
+        address = rng.choice(ALL_ADDRESSES)
+        quantity = rng.randint(1, 3)
+        if rng.random() >= pending_share and active < 3 * drivers:
+            driver_id = driver_id_for(first_driver + active // 3)
+            active += 1
+            yield first_id + i, address, quantity, "in-progress", driver_id, ordered_at
+        else:
+            yield first_id + i, address, quantity, "pending", None, ordered_at
+
+
+def request_lines(rows):
+    for request_id, address, quantity, status, driver_id, ordered_at in rows:
+        yield f"{request_id}\t{address}\t{quantity}\t{status}\t{driver_id or NULL}\t{ordered_at}\t{NULL}\n"
+
+
+def history_lines(request_rows_replay, count: int, first_id: int, drivers: int, first_driver: int,
+                  resigned_share: float, start: datetime, days: int, seed: int):
+    """Resigned `pending(*)` rows for some pending requests, then `count` completed rows."""
+    rng = random.Random(seed + 1)
+    if drivers:
+        for request_id, address, quantity, status, _, ordered_at in request_rows_replay:
+            if status == "pending" and rng.random() < resigned_share:
+                driver_id = driver_id_for(first_driver + rng.randrange(drivers))
+                yield f"{request_id}\t{driver_id}\t{address}\t{quantity}\t{ordered_at}\t{NULL}\tpending(*)\n"
+    for i in range(count):
+        ordered_at = random_datetime(rng, start, days)
+        completed_at = ordered_at + timedelta(minutes=rng.randint(10, 180))
+        driver_id = driver_id_for(first_driver + rng.randrange(drivers)) if drivers else NULL
+        yield (
+            f"{first_id + i}\t{driver_id}\t{rng.choice(ALL_ADDRESSES)}\t{rng.randint(1, 3)}\t"
+            f"{ordered_at}\t{completed_at}\tcompleted\n"
         )
 
-    # Commit the transaction
-    conn.commit()
-    print("Successfully inserted 30 delivery requests into the database!")
-
-except psycopg2.Error as e:
-    print(f"Database error: {e}")
-    conn.rollback()
-finally:
-    if "cur" in locals():
-        cur.close()
-    if "conn" in locals():
+
+def copy(cur, table: str, columns: str, lines) -> int:
+    stream = IteratorStream(lines)
+    started = time.perf_counter()
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", stream, size=1 << 16)
+    elapsed = time.perf_counter() - started
+    print(f"{table:18} {stream.rows:>12,} rows in {elapsed:7.1f}s ({stream.rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return stream.rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000, help="live delivery_requests rows")
+    parser.add_argument("--history", type=int, default=10000, help="completed order_tracking rows")
+    parser.add_argument("--pending-share", type=float, default=0.3, help="share of live requests still pending")
+    parser.add_argument("--resigned-share", type=float, default=0.1, help="share of pending requests resigned once")
+    parser.add_argument("--days", type=int, default=30, help="ordered_at spread, ending today")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="password for every generated driver")
+    parser.add_argument("--truncate", action="store_true", help="empty the tables first")
+    args = parser.parse_args()
+
+    start = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=args.days - 1)
+    password_hash = bcrypt.hashpw(args.password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            if args.truncate:
+                cur.execute("TRUNCATE TABLE order_tracking, delivery_requests, drivers RESTART IDENTITY")
+            cur.execute(
+                "SELECT GREATEST((SELECT MAX(request_id) FROM delivery_requests), "
+                "(SELECT MAX(request_id) FROM order_tracking), 0) + 1"
+            )
+            first_id = cur.fetchone()[0]
+            # Generated driver ids continue after those of earlier runs
+            cur.execute("SELECT COUNT(*) FROM drivers WHERE driver_id ~ '^G[0-9]{6}$'")
+            first_driver = cur.fetchone()[0]
+
+            if is_partitioned(cur):
+                # History is spread over past months that may predate the oldest partition
+                ensure_partitions(cur, start, datetime.now().date())
+
+            copy(cur, "drivers", "driver_id, name, current_stock, password_hash",
+                 driver_lines(args.drivers, first_driver, password_hash, args.seed))
+
+            def live_rows():
+                return request_rows(args.requests, first_id, args.drivers, first_driver, args.pending_share,
+                                    start, args.days, args.seed)
+
+            copy(cur, "delivery_requests",
+                 "request_id, dropoff_address, quantity, status, assigned_driver_id, ordered_at, start_time",
+                 request_lines(live_rows()))
+            # Resigned rows replay the same seeded request stream instead of keeping it in memory
+            copy(cur, "order_tracking",
+                 "request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status",
+                 history_lines(live_rows(), args.history, first_id + args.requests, args.drivers, first_driver,
+                               args.resigned_share, start, args.days, args.seed))
+
+            # Explicit ids bypass the sequence; move it past them
+            cur.execute(
+                "SELECT setval(pg_get_serial_sequence('delivery_requests', 'request_id'), "
+                "GREATEST((SELECT MAX(request_id) FROM delivery_requests), "
+                "(SELECT MAX(request_id) FROM order_tracking), 1))"
+            )
+        conn.commit()
+        print("Done.")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        conn.rollback()
+    finally:
         conn.close()
+
+
+if __name__ == "__main__":
+    main()
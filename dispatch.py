@@ -0,0 +1,325 @@
+"""
+Batch auto-dispatch: assign pending delivery requests to drivers in bulk.
+
+One dispatch round locks a batch of pending requests, reads every driver
+with stock without locking them, and plans a global assignment with
+vectorized NumPy cost arithmetic. Only the drivers the plan uses are then
+locked (in driver_id order, like restocks) and re-checked, dropping any
+assignment a concurrent accept or restock made infeasible, and the batch is
+committed in the same transaction. Interactive accepts for other drivers are
+never blocked by a round. The rules are the ones in helpers.can_accept_delivery:
+at most MAX_ACTIVE_DELIVERIES active deliveries and enough stock for the order. Older orders are served first, and resigned
+`pending(*)` orders get a priority boost but are never handed back to the
+driver who resigned them.
+
+Usage:
+    python dispatch.py                  # one round
+    python dispatch.py --every 30       # run a round every 30 seconds
+    python dispatch.py --dry-run        # plan and report without writing
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import (
+    DISPATCH_BATCH_LIMIT,
+    DISPATCH_INTERVAL_SECONDS,
+    DISPATCH_RESIGN_BOOST_SECONDS,
+)
+from helpers import MAX_ACTIVE_DELIVERIES
+from models import get_connection, return_connection
+
+# Arbitrary key for pg_try_advisory_xact_lock so only one round runs at a time
+DISPATCH_LOCK_KEY = 72_640_001
+
+# Cost weights: prefer the tightest stock fit, then the least loaded driver
+SLACK_WEIGHT = 1.0
+LOAD_WEIGHT = 4.0
+
+
+def plan_assignments(
+    quantities: np.ndarray,
+    priorities: np.ndarray,
+    driver_stock: np.ndarray,
+    driver_slots: np.ndarray,
+    excluded: Optional[Dict[int, List[int]]] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Plan a batch of assignments.
+
+    quantities/priorities are per request, driver_stock/driver_slots per
+    driver (slots = deliveries the driver can still take). `excluded` maps a
+    request index to driver indexes that must not get it. Requests are served
+    in descending priority; each goes to the feasible driver with the lowest
+    cost. Returns (request_index, driver_index) pairs.
+    """
+    excluded = excluded or {}
+    stock = driver_stock.astype(np.int64, copy=True)
+    slots = driver_slots.astype(np.int64, copy=True)
+    load = (MAX_ACTIVE_DELIVERIES - slots).astype(np.float64)
+    # Base cost per driver; the slack term is added per request below
+    base_cost = LOAD_WEIGHT * load + SLACK_WEIGHT * stock
+
+    assignments = []
+    free_capacity = int(np.minimum(slots, stock).clip(min=0).sum())
+    for req in np.argsort(-priorities, kind="stable"):
+        if free_capacity <= 0:
+            break
+        quantity = quantities[req]
+        cost = np.where((stock >= quantity) & (slots > 0), base_cost, np.inf)
+        banned = excluded.get(int(req))
+        if banned:
+            cost[banned] = np.inf
+        driver = int(np.argmin(cost))
+        if cost[driver] == np.inf:
+            continue
+
+        assignments.append((int(req), driver))
+        stock[driver] -= quantity
+        slots[driver] -= 1
+        base_cost[driver] += LOAD_WEIGHT - SLACK_WEIGHT * quantity
+        free_capacity -= 1
+    return assignments
+
+
+def _active_counts(cur, driver_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    cur.execute(
+        """
+        SELECT assigned_driver_id, COUNT(*)
+        FROM delivery_requests
+        WHERE status = 'in-progress'
+        AND (%s::text[] IS NULL OR assigned_driver_id = ANY(%s::text[]))
+        GROUP BY assigned_driver_id
+        """,
+        (driver_ids, driver_ids),
+    )
+    return dict(cur.fetchall())
+
+
+def _snapshot(cur, limit: int):
+    """Read drivers with stock (unlocked) and lock a batch of pending requests."""
+    cur.execute(
+        """
+        SELECT d.driver_id, d.current_stock
+        FROM drivers d
+        WHERE d.current_stock > 0
+        ORDER BY d.driver_id
+        """
+    )
+    drivers = cur.fetchall()
+    active = _active_counts(cur)
+
+    cur.execute(
+        """
+        SELECT r.request_id, r.quantity, r.ordered_at,
+               ARRAY(
+                   SELECT o.driver_id FROM order_tracking o
+                   WHERE o.request_id = r.request_id AND o.ordered_at = r.ordered_at
+                   AND o.status = 'pending(*)'
+               ) AS resigned_by
+        FROM delivery_requests r
+        WHERE r.status = 'pending'
+        ORDER BY r.ordered_at
+        LIMIT %s
+        FOR UPDATE OF r SKIP LOCKED
+        """,
+        (limit,),
+    )
+    requests = cur.fetchall()
+    return drivers, active, requests
+
+
+def _lock_and_recheck(cur, batch: List[Tuple[int, str, int]]) -> List[Tuple[int, str, int]]:
+    """
+    Lock the drivers a planned batch uses and keep, in plan order, the
+    assignments their current stock and active count still allow.
+    """
+    driver_ids = sorted({driver_id for _, driver_id, _ in batch})
+    cur.execute(
+        "SELECT driver_id, current_stock FROM drivers WHERE driver_id = ANY(%s) ORDER BY driver_id FOR UPDATE",
+        (driver_ids,),
+    )
+    stock = dict(cur.fetchall())
+    # Counted after the driver locks are held, so concurrent accepts are visible
+    active = _active_counts(cur, driver_ids)
+    slots = {driver_id: MAX_ACTIVE_DELIVERIES - active.get(driver_id, 0) for driver_id in stock}
+    kept = []
+    for request_id, driver_id, quantity in batch:
+        if stock.get(driver_id, 0) >= quantity and slots.get(driver_id, 0) > 0:
+            stock[driver_id] -= quantity
+            slots[driver_id] -= 1
+            kept.append((request_id, driver_id, quantity))
+    return kept
+
+
+def _apply(cur, assignments: List[Tuple[int, str, int]]) -> None:
+    """Write a planned batch: (request_id, driver_id, quantity) triples."""
+    execute_values(
+        cur,
+        """
+        UPDATE delivery_requests r
+        SET status = 'in-progress', assigned_driver_id = v.driver_id
+        FROM (VALUES %s) AS v(request_id, driver_id)
+        WHERE r.request_id = v.request_id AND r.status = 'pending'
+        """,
+        [(request_id, driver_id) for request_id, driver_id, _ in assignments],
+        page_size=1000,
+    )
+    per_driver = {}
+    for _, driver_id, quantity in assignments:
+        per_driver[driver_id] = per_driver.get(driver_id, 0) + quantity
+    execute_values(
+        cur,
+        """
+        UPDATE drivers d
+        SET current_stock = d.current_stock - v.quantity
+        FROM (VALUES %s) AS v(driver_id, quantity)
+        WHERE d.driver_id = v.driver_id
+        """,
+        list(per_driver.items()),
+        page_size=1000,
+    )
+    request_ids = [request_id for request_id, _, _ in assignments]
+    cur.execute(
+        """
+        DELETE FROM order_tracking o
+        USING delivery_requests r
+        WHERE r.request_id = ANY(%s)
+        AND o.request_id = r.request_id AND o.ordered_at = r.ordered_at
+        AND o.status = 'pending(*)'
+        """,
+        (request_ids,),
+    )
+    # One accepted event per assignment, delivered when the batch commits
+    cur.execute(
+        """
+        SELECT pg_notify('order_events', json_build_object(
+            'type', 'accepted', 'request_id', a.request_id, 'driver_id', a.driver_id, 'txid', txid_current()
+        )::text)
+        FROM unnest(%s::int[], %s::text[]) AS a(request_id, driver_id)
+        """,
+        (request_ids, [driver_id for _, driver_id, _ in assignments]),
+    )
+
+
+def dispatch_round(limit: int = DISPATCH_BATCH_LIMIT, dry_run: bool = False) -> Optional[dict]:
+    """
+    Run one dispatch round in a single transaction.
+    Returns a summary dict, or None if the database was unavailable.
+    """
+    conn = get_connection()
+    if not conn:
+        logging.error("Failed to get database connection in dispatch_round")
+        return None
+
+    started = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (DISPATCH_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return {"skipped": True, "assigned": 0}
+
+            drivers, active, requests = _snapshot(cur, limit)
+            if not drivers or not requests:
+                conn.rollback()
+                return {"skipped": False, "assigned": 0, "pending": len(requests), "drivers": len(drivers)}
+
+            driver_ids = [row[0] for row in drivers]
+            driver_index = {driver_id: i for i, driver_id in enumerate(driver_ids)}
+            driver_stock = np.fromiter((row[1] for row in drivers), dtype=np.int64, count=len(drivers))
+            driver_slots = np.fromiter(
+                (MAX_ACTIVE_DELIVERIES - active.get(driver_id, 0) for driver_id in driver_ids),
+                dtype=np.int64,
+                count=len(drivers),
+            )
+
+            now = datetime.now()
+            quantities = np.fromiter((row[1] for row in requests), dtype=np.int64, count=len(requests))
+            priorities = np.fromiter(
+                (
+                    (now - ordered_at).total_seconds() + (DISPATCH_RESIGN_BOOST_SECONDS if resigned_by else 0)
+                    for _, _, ordered_at, resigned_by in requests
+                ),
+                dtype=np.float64,
+                count=len(requests),
+            )
+            excluded = {
+                i: [driver_index[d] for d in row[3] if d in driver_index]
+                for i, row in enumerate(requests)
+                if row[3]
+            }
+
+            planned = plan_assignments(quantities, priorities, driver_stock, driver_slots, excluded)
+            batch = [
+                (requests[req][0], driver_ids[drv], int(quantities[req]))
+                for req, drv in planned
+            ]
+            planned_count = len(batch)
+            if batch:
+                batch = _lock_and_recheck(cur, batch)
+            if batch and not dry_run:
+                _apply(cur, batch)
+                conn.commit()
+            else:
+                conn.rollback()
+
+            summary = {
+                "skipped": False,
+                "assigned": len(batch),
+                "dropped": planned_count - len(batch),
+                "pending": len(requests),
+                "drivers": len(drivers),
+                "seconds": round(time.perf_counter() - started, 4),
+                "dry_run": dry_run,
+            }
+            logging.info(f"Dispatch round: {summary}")
+            return summary
+    except psycopg2.Error as e:
+        logging.error(f"Dispatch error: {e}")
+        conn.rollback()
+        return None
+    finally:
+        return_connection(conn)
+
+
+def run_forever(interval: float, stop: Optional[threading.Event] = None) -> None:
+    """Run dispatch rounds every `interval` seconds until `stop` is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        dispatch_round()
+        stop.wait(interval)
+
+
+def start_background_dispatcher(interval: float = DISPATCH_INTERVAL_SECONDS) -> Optional[threading.Thread]:
+    """Start the periodic dispatcher in a daemon thread if an interval is configured."""
+    if interval <= 0:
+        return None
+    thread = threading.Thread(target=run_forever, args=(interval,), name="dispatcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds")
+    parser.add_argument("--limit", type=int, default=DISPATCH_BATCH_LIMIT, help="max pending requests per round")
+    parser.add_argument("--dry-run", action="store_true", help="plan without writing")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    if args.every > 0:
+        run_forever(args.every)
+    else:
+        print(dispatch_round(limit=args.limit, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
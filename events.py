@@ -0,0 +1,194 @@
+"""
+Live order events: Postgres LISTEN/NOTIFY fanned out to Server-Sent Events.
+
+Writers publish compact JSON events with pg_notify inside their own
+transaction, so an event is delivered only if the change commits. Each
+worker process runs one listener thread on a dedicated connection and
+copies every event into the queues of its connected SSE clients.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import select
+import threading
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from config import DB_CONFIG, EVENTS_CLIENT_QUEUE_SIZE, EVENTS_HEARTBEAT_SECONDS
+
+# Also spelled out in SQL that notifies from inside a statement (models.accept_delivery,
+# dispatch, the delivery_requests insert trigger)
+CHANNEL = "order_events"
+
+
+def notify_args(event_type: str, request_id: Optional[int], driver_id: Optional[str] = None, **extra) -> tuple:
+    """(sql, params) for publishing an event; shared with the async models."""
+    payload = {"type": event_type, "request_id": request_id, "driver_id": driver_id, **extra}
+    # txid tells apart events that would otherwise repeat (accept, resign, accept again)
+    return (
+        "SELECT pg_notify(%s, (%s::jsonb || jsonb_build_object('txid', txid_current()))::text)",
+        (CHANNEL, json.dumps(payload, default=str)),
+    )
+
+
+def publish(cur, event_type: str, request_id: Optional[int], driver_id: Optional[str] = None, **extra) -> None:
+    """Queue an event on the cursor's transaction; it is sent when the transaction commits."""
+    cur.execute(*notify_args(event_type, request_id, driver_id, **extra))
+
+
+class DataVersions:
+    """
+    Data versions for conditional GETs, advanced by the order events this process receives.
+
+    A version is a fingerprint of the last event that touched the data, so
+    every worker that received the same events agrees on it without asking
+    the database. `global` covers lists shared by all drivers; each driver
+    also has their own version for their deliveries and stock. Until the
+    first event after startup or a reconnect, versions fall back to a
+    per-process token, so an ETag from another worker simply misses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._base = f"p{os.getpid()}-{os.urandom(4).hex()}"
+        self._global = None
+        self._drivers = {}
+
+    def observe(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if event.get("type") == "resync":
+            with self._lock:
+                self._reset()
+            return
+        fingerprint = str(event["txid"]) if "txid" in event else hashlib.sha1(payload.encode()).hexdigest()[:16]
+        with self._lock:
+            self._global = fingerprint
+            if event.get("driver_id"):
+                self._drivers[event["driver_id"]] = fingerprint
+
+    def current(self, driver_id: Optional[str] = None) -> str:
+        """Version of the shared lists, or of one driver's own data when driver_id is given."""
+        with self._lock:
+            version = self._drivers.get(driver_id) if driver_id else self._global
+            return version or self._base
+
+
+class EventHub:
+    """Per-process LISTEN connection that fans notifications out to subscriber queues."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._pid = None
+        self.connected = False
+        self.versions = DataVersions()
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=EVENTS_CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._ensure_listener()
+            self._subscribers.add(q)
+        return q
+
+    def start(self) -> None:
+        """Make sure this process is listening, without subscribing a queue."""
+        with self._lock:
+            self._ensure_listener()
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _ensure_listener(self) -> None:
+        # A forked worker inherits neither the thread nor a usable connection
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._subscribers = set()
+            self._thread = None
+            self.connected = False
+            self.versions = DataVersions()
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._listen_forever, name="order-events", daemon=True)
+        self._thread.start()
+
+    def _broadcast(self, payload: str) -> None:
+        self.versions.observe(payload)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # A client that stopped reading gets a reset marker instead of unbounded memory
+                self._drop_backlog(q)
+
+    @staticmethod
+    def _drop_backlog(q: queue.Queue) -> None:
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(json.dumps({"type": "resync"}))
+
+    def _listen_forever(self) -> None:
+        reconnecting = False
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                if reconnecting:
+                    # Clients may have missed events while we were disconnected
+                    self._broadcast(json.dumps({"type": "resync"}))
+                reconnecting = True
+                self.connected = True
+                while True:
+                    if select.select([conn], [], [], EVENTS_HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._broadcast(conn.notifies.pop(0).payload)
+            except psycopg2.Error as e:
+                logging.error(f"Order event listener error: {e}")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            threading.Event().wait(5)  # back off before reconnecting
+
+
+hub = EventHub()
+
+
+def sse_stream(q: queue.Queue):
+    """Yield SSE frames from a subscriber queue, with comment heartbeats to keep proxies open."""
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                payload = q.get(timeout=EVENTS_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            yield f"data: {payload}\n\n"
+    finally:
+        hub.unsubscribe(q)
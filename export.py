@@ -0,0 +1,270 @@
+"""
+Streaming exports of order history with COPY ... TO STDOUT.
+
+COPY output is pulled from the server in chunks (psycopg 3's copy iterator)
+and handed on as it arrives, to a file or to an HTTP response (/export), so
+memory stays flat however many rows match. Each export runs on its own
+short-lived connection rather than a pooled one, since a large export can
+take minutes.
+
+CSV is passed through from the server untouched. Parquet output converts the
+same CSV stream block by block with pyarrow (in requirements.txt; an install
+without it answers format=parquet with 501), writing one row group per EXPORT_PARQUET_BLOCK_BYTES of
+CSV, so it streams in constant memory too. drivers never includes password
+hashes.
+
+Usage:
+    python export.py order_tracking [--since 2025-01-01] [--until 2025-02-01]
+                     [--driver D001] [--status completed]
+                     [--format csv|parquet] [-o order_tracking.csv.gz]
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+
+from config import DB_CONFIG, EXPORT_MAX_CONCURRENT, EXPORT_PARQUET_BLOCK_BYTES
+
+try:
+    import pyarrow
+    from pyarrow import csv as pyarrow_csv
+    from pyarrow import parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+
+class ExportTable(NamedTuple):
+    columns: Tuple[Tuple[str, str], ...]  # (column, Arrow type alias)
+    driver_column: str
+    time_column: Optional[str]
+    statuses: Tuple[str, ...]
+
+
+TABLES = {
+    "order_tracking": ExportTable(
+        (
+            ("history_id", "int32"),
+            ("request_id", "int32"),
+            ("driver_id", "string"),
+            ("dropoff_address", "string"),
+            ("quantity", "int32"),
+            ("ordered_at", "timestamp[us]"),
+            ("completed_at", "timestamp[us]"),
+            ("status", "string"),
+        ),
+        "driver_id",
+        "ordered_at",
+        ("completed", "pending(*)"),
+    ),
+    "delivery_requests": ExportTable(
+        (
+            ("request_id", "int32"),
+            ("dropoff_address", "string"),
+            ("quantity", "int32"),
+            ("status", "string"),
+            ("assigned_driver_id", "string"),
+            ("ordered_at", "timestamp[us]"),
+            ("start_time", "timestamp[us]"),
+        ),
+        "assigned_driver_id",
+        "ordered_at",
+        ("pending", "in-progress"),
+    ),
+    "drivers": ExportTable(
+        (("driver_id", "string"), ("name", "string"), ("current_stock", "int32")),
+        "driver_id",
+        None,
+        (),
+    ),
+}
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "parquet": "application/vnd.apache.parquet"}
+
+# Exports hold a connection and a server backend each; cap them per process
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def copy_statement(
+    table: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    driver_id: Optional[str] = None,
+    status: Optional[str] = None,
+    header: bool = True,
+) -> sql.Composed:
+    """COPY (SELECT ...) TO STDOUT for one table; `until` is exclusive. Raises ValueError on bad filters."""
+    spec = TABLES.get(table)
+    if spec is None:
+        raise ValueError(f"unknown table {table!r}")
+    if status and status not in spec.statuses:
+        raise ValueError(f"status must be one of {', '.join(spec.statuses) or 'nothing for ' + table}")
+    if (since or until) and not spec.time_column:
+        raise ValueError(f"{table} cannot be filtered by date")
+
+    conditions = []
+    if since:
+        conditions.append(sql.SQL("{} >= {}").format(sql.Identifier(spec.time_column), sql.Literal(since)))
+    if until:
+        conditions.append(sql.SQL("{} < {}").format(sql.Identifier(spec.time_column), sql.Literal(until)))
+    if driver_id:
+        conditions.append(sql.SQL("{} = {}").format(sql.Identifier(spec.driver_column), sql.Literal(driver_id)))
+    if status:
+        conditions.append(sql.SQL("status = {}").format(sql.Literal(status)))
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    return sql.SQL("COPY (SELECT {} FROM {}{}) TO STDOUT WITH (FORMAT csv, HEADER {})").format(
+        sql.SQL(", ").join(sql.Identifier(column) for column, _ in spec.columns),
+        sql.Identifier(table),
+        where,
+        sql.SQL("true" if header else "false"),
+    )
+
+
+def copy_chunks(statement: sql.Composed) -> Iterator[bytes]:
+    """Yield COPY output as the server sends it, from a dedicated read-only connection."""
+    conninfo = make_conninfo(**{key: value for key, value in DB_CONFIG.items() if value})
+    with psycopg.connect(conninfo) as conn:
+        conn.read_only = True
+        with conn.cursor() as cur:
+            with cur.copy(statement) as copy:
+                for chunk in copy:
+                    yield bytes(chunk)
+        conn.rollback()
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file over an iterator of byte chunks, for pyarrow's streaming CSV reader."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that keeps what the Parquet writer produced until it is drained."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_chunks(table: str, csv_chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Convert headerless COPY CSV to Parquet, one row group per CSV block."""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    columns = TABLES[table].columns
+    schema = pyarrow.schema([(column, pyarrow.type_for_alias(alias)) for column, alias in columns])
+    reader = pyarrow_csv.open_csv(
+        io.BufferedReader(_ChunkReader(csv_chunks), buffer_size=1 << 20),
+        read_options=pyarrow_csv.ReadOptions(column_names=schema.names, block_size=EXPORT_PARQUET_BLOCK_BYTES),
+        convert_options=pyarrow_csv.ConvertOptions(
+            column_types=schema,
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,  # COPY quotes empty strings, leaves NULL bare
+        ),
+    )
+    sink = _Drain()
+    with parquet.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()  # footer
+
+
+def export_chunks(table: str, fmt: str = "csv", **filters) -> Iterator[bytes]:
+    """The export as a stream of bytes in `fmt` (csv or parquet)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    statement = copy_statement(table, header=fmt == "csv", **filters)
+    chunks = copy_chunks(statement)
+    return chunks if fmt == "csv" else parquet_chunks(table, chunks)
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """ISO date or timestamp from a CLI or query argument; ValueError if malformed."""
+    return datetime.fromisoformat(value) if value else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("--since", type=parse_time, help="first ordered_at to include (YYYY-MM-DD[THH:MM])")
+    parser.add_argument("--until", type=parse_time, help="first ordered_at to exclude")
+    parser.add_argument("--driver", dest="driver_id")
+    parser.add_argument("--status")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("-o", "--output", default="-", help="file to write (.gz compresses CSV); - for stdout")
+    args = parser.parse_args()
+
+    try:
+        chunks = export_chunks(
+            args.table, args.format, since=args.since, until=args.until, driver_id=args.driver_id, status=args.status
+        )
+    except (ValueError, RuntimeError) as e:
+        raise SystemExit(str(e))
+
+    if args.output == "-":
+        out = sys.stdout.buffer
+    elif args.output.endswith(".gz") and args.format == "csv":
+        out = gzip.open(f"{args.output}.tmp", "wb")
+    else:
+        out = open(f"{args.output}.tmp", "wb")
+    written = 0
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    except psycopg.Error as e:
+        raise SystemExit(f"Export failed: {e}")
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if out is not sys.stdout.buffer:
+        os.replace(f"{args.output}.tmp", args.output)
+        print(f"Wrote {written:,} bytes to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Geocoding of dropoff addresses and nearest-pending-request lookup.
+
+Addresses are mapped to coordinates from data/geocodes.csv (there is no
+network geocoder). Exact chome/block addresses are looked up first, then the
+town (e.g. 三鷹市下連雀) centroid, found with the same town trie and
+normalization that intake validates addresses with (addresses.py). Pending requests are kept in an in-memory
+uniform grid, rebuilt from the database at most every GEO_INDEX_TTL seconds,
+and queried for the k nearest to a point. A stale grid keeps being served
+while one background thread rebuilds it; only the very first build blocks.
+"""
+import csv
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+
+from addresses import normalize_address, town_of
+from config import GEO_CELL_METERS, GEO_INDEX_TTL, GEOCODES_PATH
+from models import get_connection, return_connection
+
+METERS_PER_DEGREE_LAT = 110_540.0
+METERS_PER_DEGREE_LON_EQUATOR = 111_320.0
+
+
+class Geocoder:
+    """Address -> (lat, lon) lookup table loaded from a local CSV file."""
+
+    def __init__(self, path: str = GEOCODES_PATH):
+        self._table: Dict[str, Tuple[float, float]] = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self._table[row["address"].strip()] = (float(row["lat"]), float(row["lon"]))
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def addresses(self) -> List[str]:
+        return list(self._table)
+
+    def resolve(self, address: str) -> Optional[str]:
+        """The table entry used for `address`: itself, or its town."""
+        address = address.strip()
+        if address in self._table:
+            return address
+        town = town_of(address) or town_of(normalize_address(address))
+        return town if town in self._table else None
+
+    def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        key = self.resolve(address)
+        return self._table[key] if key is not None else None
+
+
+class GridIndex:
+    """
+    Uniform grid over points projected to local meters.
+    Points are bucketed by cell; a k-nearest query searches rings of cells
+    outward from the query cell until no unvisited cell can hold a closer point.
+    """
+
+    def __init__(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, cell_meters: float = GEO_CELL_METERS):
+        self.cell = cell_meters
+        self.lat0 = float(lat.mean()) if len(lat) else 35.7
+        self._lon_scale = METERS_PER_DEGREE_LON_EQUATOR * math.cos(math.radians(self.lat0))
+        x, y = self._project(lat, lon)
+        cx = np.floor(x / self.cell).astype(np.int64)
+        cy = np.floor(y / self.cell).astype(np.int64)
+        # Stable sort keeps the input order (oldest first) within a cell
+        order = np.lexsort((cy, cx))
+        self.ids, self.x, self.y = ids[order], x[order], y[order]
+        cx, cy = cx[order], cy[order]
+
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if len(order):
+            boundaries = np.flatnonzero((np.diff(cx) != 0) | (np.diff(cy) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self._cells[(int(cx[start]), int(cy[start]))] = (start, end)
+            self._min_cx, self._max_cx = int(cx[0]), int(cx[-1])
+            self._min_cy, self._max_cy = int(cy.min()), int(cy.max())
+        else:
+            self._min_cx = self._max_cx = self._min_cy = self._max_cy = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _project(self, lat, lon):
+        return np.asarray(lon, dtype=np.float64) * self._lon_scale, np.asarray(lat, dtype=np.float64) * METERS_PER_DEGREE_LAT
+
+    def _ring(self, qx: int, qy: int, r: int) -> Iterable[Tuple[int, int]]:
+        if r == 0:
+            yield qx, qy
+            return
+        for dx in range(-r, r + 1):
+            yield qx + dx, qy - r
+            yield qx + dx, qy + r
+        for dy in range(-r + 1, r):
+            yield qx - r, qy + dy
+            yield qx + r, qy + dy
+
+    def _candidates(self, positions: np.ndarray, x: float, y: float, excluded: Optional[np.ndarray]):
+        if excluded is not None:
+            positions = positions[~np.isin(self.ids[positions], excluded)]
+        return positions, np.hypot(self.x[positions] - x, self.y[positions] - y)
+
+    def nearest(self, lat: float, lon: float, k: int, exclude: Optional[set] = None) -> List[Tuple[int, float]]:
+        """Up to k (id, distance_m) pairs, nearest first; ties keep insertion order."""
+        if not len(self.ids) or k <= 0:
+            return []
+        x, y = self._project(lat, lon)
+        qx, qy = int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+        excluded = np.fromiter(exclude, dtype=np.int64) if exclude else None
+        max_ring = max(abs(qx - self._min_cx), abs(qx - self._max_cx), abs(qy - self._min_cy), abs(qy - self._max_cy))
+
+        if max_ring * max_ring > len(self._cells) * 4:
+            # Far outside the grid (or a sparse grid): scanning every point is cheaper than rings
+            positions, dist = self._candidates(np.arange(len(self.ids)), x, y, excluded)
+        else:
+            slices = []
+            positions = dist = None
+            for r in range(max_ring + 1):
+                added = False
+                for key in self._ring(qx, qy, r):
+                    bounds = self._cells.get(key)
+                    if bounds:
+                        slices.append(np.arange(*bounds))
+                        added = True
+                if not added and r < max_ring:
+                    continue
+                positions, dist = self._candidates(np.concatenate(slices), x, y, excluded)
+                # Anything outside ring r is at least r cells away
+                if len(dist) >= k and np.partition(dist, k - 1)[k - 1] <= r * self.cell:
+                    break
+
+        best = np.argsort(dist, kind="stable")[:k]
+        return [(int(self.ids[positions[i]]), float(dist[i])) for i in best]
+
+
+class PendingRequestIndex:
+    """
+    Grid of pending requests, rebuilt from the database when older than `ttl`
+    seconds. `_lock` is held by whoever is building, so at most one rebuild runs.
+    """
+
+    def __init__(self, geocoder: Geocoder, ttl: float = GEO_INDEX_TTL):
+        self.geocoder = geocoder
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._grid: Optional[GridIndex] = None
+        self._built_at = 0.0
+        self.ungeocoded = 0
+
+    def _build(self) -> Optional[GridIndex]:
+        conn = get_connection()
+        if not conn:
+            logging.error("Failed to get database connection in PendingRequestIndex")
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT request_id, dropoff_address
+                    FROM delivery_requests
+                    WHERE status = 'pending'
+                    ORDER BY ordered_at, request_id
+                    """
+                )
+                rows = cur.fetchall()
+            conn.rollback()
+        except psycopg2.Error as e:
+            logging.error(f"Pending request index error: {e}")
+            conn.rollback()
+            return None
+        finally:
+            return_connection(conn)
+
+        coords = {}
+        ids, lats, lons = [], [], []
+        ungeocoded = 0
+        for request_id, address in rows:
+            if address not in coords:
+                coords[address] = self.geocoder.geocode(address)
+            point = coords[address]
+            if point is None:
+                ungeocoded += 1
+                continue
+            ids.append(request_id)
+            lats.append(point[0])
+            lons.append(point[1])
+        self.ungeocoded = ungeocoded
+        return GridIndex(np.array(ids, dtype=np.int64), np.array(lats), np.array(lons))
+
+    def _rebuild(self) -> None:
+        grid = self._build()
+        if grid is not None:
+            self._grid, self._built_at = grid, time.monotonic()
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            self._rebuild()
+        finally:
+            self._lock.release()
+
+    def grid(self) -> Optional[GridIndex]:
+        grid = self._grid
+        if grid is not None and time.monotonic() - self._built_at <= self.ttl:
+            return grid
+        if grid is None:
+            # Nothing to serve yet: the first caller builds, the others wait for it
+            with self._lock:
+                if self._grid is None:
+                    self._rebuild()
+                return self._grid
+        # Stale: serve it as is and let one thread rebuild on its own connection
+        if self._lock.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._rebuild_in_background, name="geo-index-rebuild", daemon=True).start()
+            except RuntimeError:
+                self._lock.release()
+                raise
+        return grid
+
+    def nearest(self, lat: float, lon: float, k: int, exclude: Optional[set] = None) -> List[Tuple[int, float]]:
+        grid = self.grid()
+        return grid.nearest(lat, lon, k, exclude) if grid else []
+
+
+_index = None
+_index_pid = None
+
+
+def pending_index() -> PendingRequestIndex:
+    """The process-wide pending request index, created on first use."""
+    global _index, _index_pid
+    if _index is None or _index_pid != os.getpid():
+        _index = PendingRequestIndex(Geocoder())
+        _index_pid = os.getpid()
+    return _index
@@ -3,6 +3,12 @@ from flask import flash, session, redirect, url_for
 import logging
 from typing import Optional, Callable, Any
 import re
+from datetime import datetime
+from config import MAX_STOCK
+from addresses import check_address
+
+# Deliveries a driver may have in progress at once; also enforced by accept and dispatch SQL
+MAX_ACTIVE_DELIVERIES = 3
 
 
 # Flash message helpers
@@ -47,8 +53,8 @@ def validate_stock_update(current_stock: int, new_stock: int) -> tuple[bool, Opt
     """
     if new_stock <= 0:
         return False, "Please enter a number greater than 0."
-    if current_stock + new_stock > 9:
-        return False, "The total stock cannot exceed 9."
+    if current_stock + new_stock > MAX_STOCK:
+        return False, f"The total stock cannot exceed {MAX_STOCK}."
     return True, None
 
 
@@ -86,10 +92,36 @@ def format_success_response(data: Any = None, message: str = "") -> dict:
 def validate_address(address: str) -> bool:
     """
     Validate that address is in allowed areas
-    (三鷹市 or 武蔵野市)
+    (a known town of 三鷹市 or 武蔵野市, with a block number; see addresses)
+    """
+    return check_address(address)[1] is None
+
+
+# Pagination helpers
+def parse_tracking_cursor(
+    before: Optional[str], before_id: Optional[str], before_source: Optional[str] = None, before_row: Optional[str] = None
+) -> Optional[tuple[datetime, int, int, int]]:
     """
-    allowed_areas = ["三鷹市", "武蔵野市"]
-    return any(area in address for area in allowed_areas)
+    Parse an order tracking keyset cursor from query string values.
+    Returns (ordered_at, request_id, source, history_id) or None if missing or
+    malformed. A cursor without source and row (older links) continues after
+    every row with its (ordered_at, request_id).
+    """
+    if not before or not before_id:
+        return None
+    try:
+        return datetime.fromisoformat(before), int(before_id), int(before_source or 0), int(before_row or 0)
+    except ValueError:
+        return None
+
+
+def clamp_page_size(value: Optional[str], default: int, maximum: int) -> int:
+    """Parse a requested page size, falling back to default and capping at maximum."""
+    try:
+        size = int(value) if value else default
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
 
 
 # Delivery helpers
@@ -100,8 +132,8 @@ def can_accept_delivery(
     Check if a driver can accept a delivery.
     Returns (can_accept, error_message)
     """
-    if active_deliveries >= 3:
-        return False, "You can only handle up to 3 deliveries at a time."
+    if active_deliveries >= MAX_ACTIVE_DELIVERIES:
+        return False, f"You can only handle up to {MAX_ACTIVE_DELIVERIES} deliveries at a time."
     if stock < required_stock:
         return False, "Insufficient stock for this delivery."
     return True, None
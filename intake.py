@@ -0,0 +1,156 @@
+"""
+Bulk intake of new delivery requests.
+
+Takes a batch in the delivery_requests.csv format (a header row naming at
+least dropoff_address and quantity; request_id is ignored, status must be
+empty or pending, assigned_driver_id empty, ordered_at optional and
+defaulting to now) or the same rows as a JSON list of objects. ordered_at
+must fall within the order_tracking partition window (retention months back
+to the months created ahead), since a completed or resigned request is
+copied there; the batch's months are created before loading if missing. Addresses are
+normalized and checked in one pass over the distinct addresses
+(addresses.check_addresses); rows that fail any check are reported with a
+reason and the rest are loaded with one COPY in one transaction
+(models.load_delivery_requests). The same code backs POST /api/v1/requests.
+
+Usage:
+    python intake.py orders.csv [--dry-run]
+    python intake.py orders.json [--dry-run]
+"""
+import argparse
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+
+from addresses import check_addresses
+from config import MAX_STOCK
+from models import load_delivery_requests
+from partitions import ensure_months, partition_window
+
+REQUIRED_COLUMNS = ("dropoff_address", "quantity")
+
+Order = Tuple[str, int, Optional[datetime]]
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() in ("", "NULL"))
+
+
+def read_csv(text: str) -> List[dict]:
+    """Rows of a CSV batch as dicts; ValueError if the header lacks a required column."""
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"header must name {', '.join(REQUIRED_COLUMNS)} (missing {', '.join(missing)})")
+    return list(reader)
+
+
+def read_json(text: str) -> List[dict]:
+    """Rows of a JSON batch: a list of objects, or {"requests": [...]}."""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("requests")
+    if not isinstance(data, list):
+        raise ValueError('expected a list of requests or {"requests": [...]}')
+    return data
+
+
+def _quantity(value) -> Tuple[Optional[int], Optional[str]]:
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None, "quantity must be a whole number"
+    try:
+        quantity = int(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        return None, "quantity must be a whole number"
+    if not 1 <= quantity <= MAX_STOCK:
+        return None, f"quantity must be between 1 and {MAX_STOCK}"
+    return quantity, None
+
+
+def _ordered_at(value, window: Tuple[date, date]) -> Tuple[Optional[datetime], Optional[str]]:
+    if _blank(value):
+        return None, None
+    try:
+        ordered_at = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None, "ordered_at must be an ISO timestamp"
+    if ordered_at.tzinfo is not None:
+        ordered_at = ordered_at.astimezone().replace(tzinfo=None)  # ordered_at is local time
+    first, end = window
+    if not first <= ordered_at.date() < end:
+        return None, f"ordered_at must be on or after {first} and before {end}"
+    return ordered_at, None
+
+
+def validate_orders(rows: Iterable[dict]) -> Tuple[List[Order], List[dict]]:
+    """
+    Loadable (dropoff_address, quantity, ordered_at) orders, with addresses
+    normalized, and {"row": n, "reason": ...} for each rejected row (n counts
+    data rows from 1).
+    """
+    rows = [row if isinstance(row, dict) else {} for row in rows]
+    addresses = check_addresses(
+        row.get("dropoff_address") if isinstance(row.get("dropoff_address"), str) else "" for row in rows
+    )
+    window = partition_window()
+    orders, rejected = [], []
+    for number, (row, (address, reason)) in enumerate(zip(rows, addresses), start=1):
+        if reason is None and not _blank(row.get("status")) and str(row["status"]).strip() != "pending":
+            reason = "only pending requests can be taken in"
+        if reason is None and not _blank(row.get("assigned_driver_id")):
+            reason = "assigned_driver_id must be empty"
+        if reason is None:
+            quantity, reason = _quantity(row.get("quantity"))
+        if reason is None:
+            ordered_at, reason = _ordered_at(row.get("ordered_at"), window)
+        if reason is None:
+            orders.append((address, quantity, ordered_at))
+        else:
+            rejected.append({"row": number, "reason": reason})
+    return orders, rejected
+
+
+def load_orders(orders: List[Order]) -> Optional[List[int]]:
+    """
+    Create any missing order_tracking months the batch needs, then load it
+    (models.load_delivery_requests). Returns the new request ids, or None.
+    """
+    if not orders:
+        return []
+    today = datetime.now().date()
+    days = [ordered_at.date() if ordered_at else today for _, _, ordered_at in orders]
+    if ensure_months(min(days), max(days)) is None:
+        return None
+    return load_delivery_requests(orders)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV (delivery_requests.csv format) or JSON batch")
+    parser.add_argument("--dry-run", action="store_true", help="validate the batch without loading it")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8-sig") as f:
+        text = f.read()
+    try:
+        rows = read_json(text) if args.path.endswith(".json") else read_csv(text)
+    except ValueError as e:
+        raise SystemExit(f"Unreadable batch: {e}")
+
+    orders, rejected = validate_orders(rows)
+    for rejection in rejected:
+        print(f"row {rejection['row']}: {rejection['reason']}")
+    if args.dry_run:
+        print(f"{len(orders)} request(s) would be loaded, {len(rejected)} rejected")
+        return
+
+    request_ids = load_orders(orders)
+    if request_ids is None:
+        raise SystemExit("Load failed; nothing was loaded (see app.log)")
+    print(f"Loaded {len(request_ids)} request(s), {len(rejected)} rejected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Latency histograms and counters with Prometheus text exposition.
+
+Samples are recorded in plain per-process lists under a lock, which keeps an
+observation around a microsecond. With METRICS_DIR set, every process also
+writes a snapshot of its series to METRICS_DIR/metrics-<pid>.json every
+METRICS_FLUSH_SECONDS, and /metrics sums the snapshots of all processes, so
+any worker can answer a scrape for the whole server. Snapshots of exited
+workers are kept, since their counts are cumulative; clear the directory
+when the server is (re)started.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+from config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+# Seconds; fine-grained at the low end where most queries and requests land
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Timer:
+    __slots__ = ("_metric", "_labels", "_started")
+
+    def __init__(self, metric, labels):
+        self._metric = metric
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metric.observe(time.perf_counter() - self._started, *self._labels)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, List[float]] = {}
+        registry.register(self)
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0]
+            series[0] += amount
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), list(values)] for labels, values in self._series.items()]
+
+    def reset(self) -> None:
+        # Also used right after fork, when another thread may have held the old lock
+        self._lock = threading.Lock()
+        self._series = {}
+
+
+class Histogram(Counter):
+    """Cumulative-bucket histogram; series values are per-bucket counts, +Inf count, then the sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.bounds, value)  # first bucket with value <= bound
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels) -> _Timer:
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric) -> None:
+        self._metrics.append(metric)
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def reset(self) -> None:
+        for metric in self._metrics:
+            metric.reset()
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+
+    def flush(self) -> None:
+        """Write this process's snapshot for the other workers to aggregate."""
+        path = self._snapshot_path()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def collect(self) -> dict:
+        """Series of every process (or only this one without METRICS_DIR), summed per label set."""
+        if not METRICS_DIR:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logging.error(f"Skipping unreadable metrics snapshot {path}: {e}")
+
+        merged = {metric.name: {} for metric in self._metrics}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                totals = merged.get(name)
+                if totals is None:
+                    continue
+                for labels, values in series:
+                    key = tuple(labels)
+                    current = totals.get(key)
+                    totals[key] = values if current is None else [a + b for a, b in zip(current, values)]
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        merged = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, values in sorted(merged[metric.name].items()):
+                pairs = [f'{n}="{_escape(v)}"' for n, v in zip(metric.labelnames, labels)]
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}{_labels(pairs)} {values[0]}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.bounds + (float("inf"),), values[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_pairs = pairs + [f'le="{le}"']
+                    lines.append(f"{metric.name}_bucket{_labels(bucket_pairs)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(pairs)} {values[-1]}")
+                lines.append(f"{metric.name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: List[str]) -> str:
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+registry = Registry()
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request handling time by endpoint", ("endpoint", "method", "status")
+)
+DB_FUNCTION_SECONDS = Histogram(
+    "db_function_duration_seconds", "Time spent in models functions holding a connection", ("function",)
+)
+DB_FUNCTION_ERRORS = Counter("db_function_errors_total", "Database errors raised out of models functions", ("function",))
+POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Time to check a connection out of the pool")
+PASSWORD_SECONDS = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt hash/check time including queueing for the password pool",
+    ("operation",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+_flusher = None
+
+
+def start_flusher(interval: float = METRICS_FLUSH_SECONDS):
+    """Write snapshots every `interval` seconds when METRICS_DIR is set (once per process)."""
+    global _flusher
+    if not METRICS_DIR or (_flusher is not None and _flusher.is_alive()):
+        return _flusher
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.flush()
+            except OSError as e:
+                logging.error(f"Metrics flush error: {e}")
+
+    _flusher = threading.Thread(target=run, name="metrics-flusher", daemon=True)
+    _flusher.start()
+    return _flusher
+
+
+def _after_fork_in_child() -> None:
+    # Counts recorded before the fork belong to the parent's snapshot
+    global _flusher
+    registry.reset()
+    _flusher = None
+    start_flusher()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
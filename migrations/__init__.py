@@ -0,0 +1,124 @@
+"""
+Versioned schema migrations.
+
+Each migration is a module in this package named `vNNNN_<description>.py`
+that defines:
+    VERSION      int, matches NNNN
+    DESCRIPTION  one-line summary
+    UP           DDL statements run in one transaction
+    INDEXES      [(index_name, ddl)] built with CREATE INDEX CONCURRENTLY after UP
+    DOWN         DDL statements run in one transaction on rollback
+
+Statements are written to be idempotent (IF [NOT] EXISTS), so a migration
+interrupted half-way can simply be applied again. A version is recorded in
+schema_migrations only after all of its indexes are built.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from typing import List, Optional
+
+import psycopg2
+
+MODULE_PATTERN = re.compile(r"^v(\d{4})_\w+$")
+
+VERSION_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def discover() -> list:
+    """All migration modules, ordered by version."""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = MODULE_PATTERN.match(info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        if module.VERSION != int(match.group(1)):
+            raise ValueError(f"{info.name} declares VERSION {module.VERSION}")
+        migrations.append(module)
+    migrations.sort(key=lambda m: m.VERSION)
+    return migrations
+
+
+def applied_versions(conn) -> List[int]:
+    with conn.cursor() as cur:
+        cur.execute(VERSION_TABLE_DDL)
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        versions = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return versions
+
+
+def _build_index(conn, name: str, ddl: str) -> None:
+    """Build one index concurrently, replacing a leftover INVALID build of it."""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT NOT i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = %s
+                """,
+                (name,),
+            )
+            row = cur.fetchone()
+            if row and row[0]:
+                logging.warning(f"Dropping invalid index {name} left by an interrupted build.")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cur.execute(ddl)
+    finally:
+        conn.autocommit = False
+
+
+def apply(conn, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest). Returns versions applied."""
+    done = set(applied_versions(conn))
+    applied = []
+    for migration in discover():
+        if migration.VERSION in done or (target is not None and migration.VERSION > target):
+            continue
+        with conn.cursor() as cur:
+            for statement in migration.UP:
+                cur.execute(statement)
+        conn.commit()
+        for name, ddl in migration.INDEXES:
+            _build_index(conn, name, ddl)
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                (migration.VERSION, migration.DESCRIPTION),
+            )
+        conn.commit()
+        logging.info(f"Applied migration {migration.VERSION}: {migration.DESCRIPTION}")
+        applied.append(migration.VERSION)
+    return applied
+
+
+def rollback(conn, target: int) -> List[int]:
+    """Roll back applied migrations newer than `target`, newest first. Returns versions rolled back."""
+    done = set(applied_versions(conn))
+    rolled_back = []
+    for migration in reversed(discover()):
+        if migration.VERSION not in done or migration.VERSION <= target:
+            continue
+        try:
+            with conn.cursor() as cur:
+                for statement in migration.DOWN:
+                    cur.execute(statement)
+                cur.execute("DELETE FROM schema_migrations WHERE version = %s", (migration.VERSION,))
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        logging.info(f"Rolled back migration {migration.VERSION}: {migration.DESCRIPTION}")
+        rolled_back.append(migration.VERSION)
+    return rolled_back
@@ -0,0 +1,48 @@
+"""
+Usage (from the repository root):
+    python -m migrations status
+    python -m migrations apply [--to VERSION]
+    python -m migrations rollback --to VERSION --yes
+"""
+import argparse
+import logging
+
+import psycopg2
+
+from config import DB_CONFIG
+from migrations import applied_versions, apply, discover, rollback
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Apply or roll back schema migrations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list migrations and whether they are applied")
+    apply_parser = sub.add_parser("apply", help="apply pending migrations")
+    apply_parser.add_argument("--to", type=int, help="stop after this version")
+    rollback_parser = sub.add_parser("rollback", help="roll back migrations newer than a version")
+    rollback_parser.add_argument("--to", type=int, required=True, help="version to keep (0 rolls back everything)")
+    rollback_parser.add_argument("--yes", action="store_true", help="confirm; rollbacks can drop tables")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.command == "status":
+            done = set(applied_versions(conn))
+            for migration in discover():
+                mark = "x" if migration.VERSION in done else " "
+                print(f"[{mark}] {migration.VERSION:04d} {migration.DESCRIPTION}")
+        elif args.command == "apply":
+            applied = apply(conn, args.to)
+            print(f"Applied: {applied or 'nothing to do'}")
+        elif args.command == "rollback":
+            if not args.yes:
+                parser.error("rollback needs --yes")
+            rolled_back = rollback(conn, args.to)
+            print(f"Rolled back: {rolled_back or 'nothing to do'}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Core tables plus the indexes the hot queries in models.py depend on."""
+from config import MAX_STOCK
+
+VERSION = 1
+DESCRIPTION = "drivers, delivery_requests and order_tracking with hot-path indexes"
+
+UP = [
+    f"""
+    CREATE TABLE IF NOT EXISTS drivers (
+        driver_id VARCHAR(32) PRIMARY KEY,
+        name TEXT NOT NULL,
+        current_stock INTEGER NOT NULL DEFAULT 0,
+        password_hash BYTEA NOT NULL,
+        CONSTRAINT drivers_stock_range CHECK (current_stock BETWEEN 0 AND {MAX_STOCK})
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS delivery_requests (
+        request_id SERIAL PRIMARY KEY,
+        dropoff_address TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        assigned_driver_id VARCHAR(32) REFERENCES drivers (driver_id),
+        ordered_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        start_time TIMESTAMP,
+        CONSTRAINT delivery_requests_quantity_positive CHECK (quantity > 0),
+        CONSTRAINT delivery_requests_status_valid CHECK (status IN ('pending', 'in-progress')),
+        CONSTRAINT delivery_requests_assignment CHECK (
+            (status = 'pending' AND assigned_driver_id IS NULL)
+            OR (status = 'in-progress' AND assigned_driver_id IS NOT NULL)
+        )
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_tracking (
+        history_id SERIAL PRIMARY KEY,
+        request_id INTEGER NOT NULL,
+        driver_id VARCHAR(32) REFERENCES drivers (driver_id),
+        dropoff_address TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        ordered_at TIMESTAMP NOT NULL,
+        completed_at TIMESTAMP,
+        status VARCHAR(20) NOT NULL,
+        CONSTRAINT order_tracking_status_valid CHECK (status IN ('completed', 'pending(*)')),
+        CONSTRAINT order_tracking_completed_at CHECK ((status = 'completed') = (completed_at IS NOT NULL))
+    )
+    """,
+]
+
+INDEXES = [
+    # view_unassigned_requests / dispatch: pending requests in age order
+    (
+        "delivery_requests_pending_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS delivery_requests_pending_idx
+            ON delivery_requests (ordered_at, request_id)
+            WHERE status = 'pending'
+        """,
+    ),
+    # count_active_deliveries / view_my_deliveries / accept_delivery cap check
+    (
+        "delivery_requests_driver_status_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS delivery_requests_driver_status_idx
+            ON delivery_requests (assigned_driver_id, status, ordered_at)
+        """,
+    ),
+    # order tracking keyset pages over delivery_requests
+    (
+        "delivery_requests_ordered_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS delivery_requests_ordered_idx
+            ON delivery_requests (ordered_at, request_id)
+        """,
+    ),
+    # view_unassigned_requests: resigned rows looked up per request
+    (
+        "order_tracking_resigned_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS order_tracking_resigned_idx
+            ON order_tracking (request_id, driver_id)
+            WHERE status = 'pending(*)'
+        """,
+    ),
+    # status / driver filters on the order tracking page
+    (
+        "order_tracking_status_driver_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS order_tracking_status_driver_idx
+            ON order_tracking (status, driver_id)
+        """,
+    ),
+    # order tracking keyset pages over history
+    (
+        "order_tracking_ordered_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS order_tracking_ordered_idx
+            ON order_tracking (ordered_at, request_id)
+        """,
+    ),
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS order_tracking",
+    "DROP TABLE IF EXISTS delivery_requests",
+    "DROP TABLE IF EXISTS drivers",
+]
@@ -0,0 +1,40 @@
+"""Publish a `created` order event for every statement that inserts delivery requests."""
+
+VERSION = 2
+DESCRIPTION = "NOTIFY order_events when delivery requests are inserted"
+
+UP = [
+    """
+    CREATE OR REPLACE FUNCTION notify_new_delivery_requests() RETURNS trigger AS $$
+    DECLARE
+        created_count INTEGER;
+        created_ids INTEGER[];
+    BEGIN
+        SELECT COUNT(*) INTO created_count FROM new_requests;
+        SELECT array_agg(request_id) INTO created_ids
+        FROM (SELECT request_id FROM new_requests ORDER BY request_id LIMIT 50) AS first_ids;
+        IF created_count > 0 THEN
+            -- One compact event per statement, so bulk COPY loads do not flood listeners
+            PERFORM pg_notify('order_events', json_build_object(
+                'type', 'created', 'count', created_count, 'request_ids', created_ids
+            )::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS delivery_requests_notify_created ON delivery_requests",
+    """
+    CREATE TRIGGER delivery_requests_notify_created
+        AFTER INSERT ON delivery_requests
+        REFERENCING NEW TABLE AS new_requests
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_new_delivery_requests()
+    """,
+]
+
+INDEXES = []
+
+DOWN = [
+    "DROP TRIGGER IF EXISTS delivery_requests_notify_created ON delivery_requests",
+    "DROP FUNCTION IF EXISTS notify_new_delivery_requests()",
+]
@@ -0,0 +1,120 @@
+"""
+Range-partition order_tracking by ordered_at month.
+
+The existing table is renamed, a partitioned table with the same columns
+takes its name, monthly partitions are created from the oldest row (of
+order_tracking or of the live delivery_requests, which are copied here when
+completed or resigned) through three months ahead, and the rows are copied
+over. partitions.py keeps creating months ahead and archives old ones;
+v0006 adds a DEFAULT partition for anything outside them.
+
+The primary key has to include the partition key, so it becomes
+(history_id, ordered_at). Indexes are created on the parent, which creates
+them on every partition; CREATE INDEX CONCURRENTLY does not work on
+partitioned tables, and the table is locked by the rename anyway.
+"""
+
+VERSION = 3
+DESCRIPTION = "partition order_tracking by ordered_at month"
+
+COLUMNS = """
+        history_id INTEGER NOT NULL DEFAULT nextval('order_tracking_history_id_seq'),
+        request_id INTEGER NOT NULL,
+        driver_id VARCHAR(32) REFERENCES drivers (driver_id),
+        dropoff_address TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        ordered_at TIMESTAMP NOT NULL,
+        completed_at TIMESTAMP,
+        status VARCHAR(20) NOT NULL,
+        CONSTRAINT order_tracking_status_valid CHECK (status IN ('completed', 'pending(*)')),
+        CONSTRAINT order_tracking_completed_at CHECK ((status = 'completed') = (completed_at IS NOT NULL))
+"""
+
+# Same definitions as v0001, minus CONCURRENTLY
+CREATE_INDEXES = """
+        CREATE INDEX order_tracking_resigned_idx
+            ON order_tracking (request_id, driver_id)
+            WHERE status = 'pending(*)';
+        CREATE INDEX order_tracking_status_driver_idx ON order_tracking (status, driver_id);
+        CREATE INDEX order_tracking_ordered_idx ON order_tracking (ordered_at, request_id);
+"""
+
+DROP_INDEXES = """
+        DROP INDEX IF EXISTS order_tracking_resigned_idx;
+        DROP INDEX IF EXISTS order_tracking_status_driver_idx;
+        DROP INDEX IF EXISTS order_tracking_ordered_idx;
+"""
+
+UP = [
+    f"""
+    DO $$
+    DECLARE
+        month TIMESTAMP;
+        last_month TIMESTAMP;
+    BEGIN
+        IF (SELECT relkind FROM pg_class WHERE oid = 'order_tracking'::regclass) = 'p' THEN
+            RETURN;  -- already partitioned
+        END IF;
+
+        ALTER TABLE order_tracking RENAME TO order_tracking_unpartitioned;
+        ALTER INDEX order_tracking_pkey RENAME TO order_tracking_unpartitioned_pkey;
+        ALTER SEQUENCE order_tracking_history_id_seq OWNED BY NONE;
+        {DROP_INDEXES}
+
+        CREATE TABLE order_tracking (
+            {COLUMNS},
+            PRIMARY KEY (history_id, ordered_at)
+        ) PARTITION BY RANGE (ordered_at);
+        ALTER SEQUENCE order_tracking_history_id_seq OWNED BY order_tracking.history_id;
+
+        SELECT date_trunc('month', COALESCE(
+                   LEAST(MIN(ordered_at), (SELECT MIN(ordered_at) FROM delivery_requests)), LOCALTIMESTAMP
+               )),
+               date_trunc('month', GREATEST(MAX(ordered_at), LOCALTIMESTAMP)) + INTERVAL '3 months'
+        INTO month, last_month
+        FROM order_tracking_unpartitioned;
+        WHILE month <= last_month LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF order_tracking FOR VALUES FROM (%L) TO (%L)',
+                'order_tracking_p' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month'
+            );
+            month := month + INTERVAL '1 month';
+        END LOOP;
+
+        INSERT INTO order_tracking SELECT * FROM order_tracking_unpartitioned;
+        DROP TABLE order_tracking_unpartitioned;
+        {CREATE_INDEXES}
+    END
+    $$
+    """,
+]
+
+INDEXES = []
+
+# Archived partitions are not restored; their rows stay in the export files
+DOWN = [
+    f"""
+    DO $$
+    BEGIN
+        IF (SELECT relkind FROM pg_class WHERE oid = 'order_tracking'::regclass) = 'r' THEN
+            RETURN;  -- not partitioned
+        END IF;
+
+        ALTER TABLE order_tracking RENAME TO order_tracking_partitioned;
+        ALTER INDEX order_tracking_pkey RENAME TO order_tracking_partitioned_pkey;
+        ALTER SEQUENCE order_tracking_history_id_seq OWNED BY NONE;
+        {DROP_INDEXES}
+
+        CREATE TABLE order_tracking (
+            {COLUMNS},
+            PRIMARY KEY (history_id)
+        );
+        ALTER SEQUENCE order_tracking_history_id_seq OWNED BY order_tracking.history_id;
+
+        INSERT INTO order_tracking SELECT * FROM order_tracking_partitioned;
+        DROP TABLE order_tracking_partitioned;
+        {CREATE_INDEXES}
+    END
+    $$
+    """,
+]
@@ -0,0 +1,53 @@
+"""Daily per-driver and per-city delivery rollups, kept current by rollups.record_*."""
+
+VERSION = 4
+DESCRIPTION = "driver_daily_stats and city_daily_stats rollup tables"
+
+UP = [
+    """
+    CREATE OR REPLACE FUNCTION delivery_city(address TEXT) RETURNS TEXT AS $$
+        -- "三鷹市下連雀1-1-1" -> "三鷹市"
+        SELECT COALESCE(substring(address FROM '^(.+?[市区町村])'), '(unknown)')
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS driver_daily_stats (
+        driver_id VARCHAR(32) NOT NULL,
+        day DATE NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 0,
+        resigned INTEGER NOT NULL DEFAULT 0,
+        bags INTEGER NOT NULL DEFAULT 0,
+        complete_seconds BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (driver_id, day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS city_daily_stats (
+        city TEXT NOT NULL,
+        day DATE NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 0,
+        resigned INTEGER NOT NULL DEFAULT 0,
+        bags INTEGER NOT NULL DEFAULT 0,
+        complete_seconds BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (city, day)
+    )
+    """,
+]
+
+INDEXES = [
+    # /stats range reads across all drivers / cities
+    (
+        "driver_daily_stats_day_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS driver_daily_stats_day_idx ON driver_daily_stats (day)",
+    ),
+    (
+        "city_daily_stats_day_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS city_daily_stats_day_idx ON city_daily_stats (day)",
+    ),
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS city_daily_stats",
+    "DROP TABLE IF EXISTS driver_daily_stats",
+    "DROP FUNCTION IF EXISTS delivery_city(TEXT)",
+]
@@ -0,0 +1,19 @@
+"""Partitions that partitions.maintain() detached for archiving and has not dropped yet."""
+
+VERSION = 5
+DESCRIPTION = "order_tracking_archive_queue of partitions being archived"
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS order_tracking_archive_queue (
+        partition_name TEXT PRIMARY KEY,
+        detached_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+INDEXES = []
+
+DOWN = [
+    "DROP TABLE IF EXISTS order_tracking_archive_queue",
+]
@@ -0,0 +1,51 @@
+"""
+A DEFAULT partition for order_tracking.
+
+Without it, completing or resigning a request dated outside every monthly
+partition (older than the first month v0003 created, or past the months
+created ahead) fails with "no partition of relation found". Rows land in
+order_tracking_default instead; partitions.ensure_partitions moves them into
+their month when that month's partition is created.
+"""
+
+VERSION = 6
+DESCRIPTION = "DEFAULT partition for order_tracking"
+
+UP = [
+    """
+    DO $$
+    BEGIN
+        IF (SELECT relkind FROM pg_class WHERE oid = 'order_tracking'::regclass) <> 'p' THEN
+            RETURN;  -- not partitioned
+        END IF;
+        CREATE TABLE IF NOT EXISTS order_tracking_default PARTITION OF order_tracking DEFAULT;
+    END
+    $$
+    """,
+]
+
+INDEXES = []
+
+# Rows in the DEFAULT partition get monthly partitions of their own first
+DOWN = [
+    """
+    DO $$
+    DECLARE
+        month TIMESTAMP;
+    BEGIN
+        IF to_regclass('order_tracking_default') IS NULL THEN
+            RETURN;
+        END IF;
+        ALTER TABLE order_tracking DETACH PARTITION order_tracking_default;
+        FOR month IN SELECT DISTINCT date_trunc('month', ordered_at) FROM order_tracking_default LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF order_tracking FOR VALUES FROM (%L) TO (%L)',
+                'order_tracking_p' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month'
+            );
+        END LOOP;
+        INSERT INTO order_tracking SELECT * FROM order_tracking_default;
+        DROP TABLE order_tracking_default;
+    END
+    $$
+    """,
+]
@@ -1,13 +1,41 @@
 import psycopg2
-from psycopg2 import pool
 from typing import Optional, List, Tuple
-from config import DB_CONFIG
+from config import (
+    DB_CONFIG,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_HEALTH_CHECK_AFTER,
+    DB_POOL_IDLE_TIMEOUT,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    USER_CACHE_SHARED_PATH,
+    UNASSIGNED_REQUESTS_LIMIT,
+    STATS_TOP_DRIVERS,
+    MAX_STOCK,
+)
+from db_pool import ConnectionPool, PoolTimeout
+from user_cache import UserCache
+from events import publish
+from rollups import record_completed, record_resigned
+from metrics import DB_FUNCTION_ERRORS, DB_FUNCTION_SECONDS, POOL_WAIT_SECONDS
+from query_profiler import connect_kwargs
+from prepared import PreparedStatement, execute_chain
 from flask_login import UserMixin
-import bcrypt
+from passwords import hash_password, check_password, needs_rehash, PasswordPoolBusy
+from helpers import MAX_ACTIVE_DELIVERIES
+import io
 import logging
 import re
-from psycopg2.extras import DictCursor, DictRow
+import time
+from psycopg2.extras import DictCursor, DictRow, execute_values
 from functools import wraps
+from contextlib import contextmanager
+from flask import g, has_request_context
+from psycopg2 import extensions
+import threading
+from datetime import datetime
 
 
 class User(UserMixin):
@@ -33,96 +61,181 @@ def with_db_connection(func):
     """
     Decorator to handle database connections automatically.
     Provides connection object as first argument to the decorated function.
+    Inside a Flask request this is the request's connection (see
+    get_connection); inside unit_of_work() the call runs under a savepoint.
     """
+    name = func.__name__
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        conn = get_connection()
-        if not conn:
-            logging.error(f"Failed to get database connection in {func.__name__}")
-            return None
+        unit = _current_unit()
+        if unit is not None:
+            conn = unit.begin_call()  # an error here aborts the unit
+        else:
+            conn = get_connection()
+            if not conn:
+                logging.error(f"Failed to get database connection in {name}")
+                return None
+        started = time.perf_counter()
         try:
             result = func(conn, *args, **kwargs)
             return result
         except psycopg2.Error as e:
-            logging.error(f"Database error in {func.__name__}: {e}")
+            logging.error(f"Database error in {name}: {e}")
+            DB_FUNCTION_ERRORS.inc(name)
             conn.rollback()
             return None
         finally:
-            return_connection(conn)
+            DB_FUNCTION_SECONDS.observe(time.perf_counter() - started, name)
+            if unit is not None:
+                unit.end_call()
+            else:
+                return_connection(conn)
     return wrapper
 
 
 # Configure logging
 logging.basicConfig(filename="app.log", level=logging.ERROR)
 
-# Database connection pool
-# conn_pool = psycopg2.pool.SimpleConnectionPool(1, 10, **DB_CONFIG)
-try:
-    conn_pool = psycopg2.pool.SimpleConnectionPool(1, 10, **DB_CONFIG)
-    logging.debug("Database connection pool initialized successfully.")
-except psycopg2.Error as e:
-    logging.error(f"Failed to initialize database connection pool: {e}")
-    conn_pool = None
+# Database connection pool (connections are opened lazily, per process)
+conn_pool = ConnectionPool(
+    connect_kwargs(DB_CONFIG),
+    minconn=DB_POOL_MIN,
+    maxconn=DB_POOL_MAX,
+    acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+)
 
+# Driver names for the Flask-Login user_loader
+user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, shared_path=USER_CACHE_SHARED_PATH)
 
-def get_connection() -> Optional[psycopg2.extensions.connection]:
-    """Get a database connection from the pool or create a new one"""
-    if conn_pool is None:
-        logging.warning("Connection pool is not initialized. Creating a single connection.")
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            logging.debug("Successfully created a single database connection.")
-            return conn
-        except psycopg2.Error as e:
-            logging.error(f"Failed to create a database connection: {e}")
-            return None
 
+def _checkout() -> Optional[psycopg2.extensions.connection]:
+    started = time.perf_counter()
     try:
-        conn = conn_pool.getconn()
-        if conn:
-            logging.debug("Successfully retrieved a database connection from the pool.")
-            return conn
-        else:
-            logging.error("Failed to get a database connection: Connection pool is empty.")
-            return None
-    except psycopg2.Error as e:
+        return conn_pool.getconn()
+    except (PoolTimeout, psycopg2.Error) as e:
         logging.error(f"Failed to get database connection: {e}")
         return None
+    finally:
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def get_connection() -> Optional[psycopg2.extensions.connection]:
+    """
+    Get a database connection from the pool.
+    During a Flask request every call returns the same connection, checked
+    out on first use and released by release_request_connection at teardown,
+    so a request takes at most one connection from the pool.
+    """
+    if not has_request_context():
+        return _checkout()
+    conn = g.get("db_connection")
+    if conn is None:
+        conn = _checkout()
+        if conn is not None:
+            g.db_connection = conn
+    return conn
 
 
 def return_connection(conn: psycopg2.extensions.connection) -> None:
-    """Return a database connection to the pool or close it"""
-    if conn_pool is None:
-        logging.warning("Connection pool is not initialized. Closing the single connection.")
-        try:
-            conn.close()
-            logging.debug("Successfully closed the single database connection.")
-        except psycopg2.Error as e:
-            logging.error(f"Failed to close the database connection: {e}")
+    """Return a database connection to the pool (the request's connection stays until teardown)"""
+    if has_request_context() and g.get("db_connection") is conn:
+        # A caller that swallowed an error must not leave the next one an aborted transaction
+        if not conn.closed and conn.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+            conn.rollback()
         return
+    try:
+        conn_pool.putconn(conn)
+    except psycopg2.Error as e:
+        logging.error(f"Failed to return database connection: {e}")
+
 
+def release_request_connection(exc=None) -> None:
+    """teardown_request hook (also called before bcrypt): hand the request's connection back to the pool."""
+    conn = g.pop("db_connection", None)
+    if conn is None:
+        return
     try:
         conn_pool.putconn(conn)
-        logging.debug("Successfully returned the database connection to the pool.")
     except psycopg2.Error as e:
         logging.error(f"Failed to return database connection: {e}")
 
 
-def hash_password(password: str) -> bytes:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode("utf-8"), salt)
+class UnitOfWork:
+    """
+    Connection stand-in that model functions receive inside unit_of_work().
+    Their commit() is deferred to the end of the unit, and their rollback()
+    only undoes their own call, by rolling back to the savepoint taken when
+    the call started. Everything else is delegated to the real connection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.depth = 0
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def begin_call(self) -> "UnitOfWork":
+        with self.connection.cursor() as cur:
+            cur.execute("SAVEPOINT model_call")
+        self.depth += 1
+        return self
+
+    def end_call(self) -> None:
+        self.depth -= 1
+        with self.connection.cursor() as cur:
+            if self.connection.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+                cur.execute("ROLLBACK TO SAVEPOINT model_call")  # the function swallowed an error
+            cur.execute("RELEASE SAVEPOINT model_call")
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        if self.depth:
+            with self.connection.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT model_call")
+        else:
+            self.connection.rollback()
+
+
+_units = threading.local()
+
 
+def _current_unit() -> Optional[UnitOfWork]:
+    return getattr(_units, "unit", None)
 
-def check_password(hashed_password: bytes, user_password: str) -> bool:
-    """Check if a password matches the hashed password"""
-    if isinstance(hashed_password, memoryview):
-        # Convert memoryview to bytes
-        hashed_password = hashed_password.tobytes()
-    elif isinstance(hashed_password, str):
-        # Convert string to bytes
-        hashed_password = hashed_password.encode("utf-8")
-    return bcrypt.checkpw(user_password.encode("utf-8"), hashed_password)
+
+@contextmanager
+def unit_of_work():
+    """
+    Run the model calls in the block as one transaction, committed when the
+    block exits normally and rolled back if it raises. A model call that
+    fails only undoes its own statements; check return values and raise to
+    abandon the whole unit. Only functions decorated with with_db_connection
+    take part: code that calls get_connection() directly and rolls back (for
+    example OrderTrackingPage) must not run inside a unit.
+    """
+    if _current_unit() is not None:
+        yield _current_unit()  # nested units join the outer one
+        return
+    conn = get_connection()
+    if conn is None:
+        raise PoolTimeout("no database connection for unit of work")
+    unit = _units.unit = UnitOfWork(conn)
+    try:
+        yield unit
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _units.unit = None
+        return_connection(conn)
 
 
 def validate_driver_id(driver_id: str) -> bool:
@@ -131,10 +244,29 @@ def validate_driver_id(driver_id: str) -> bool:
     return bool(driver_id and re.match(pattern, driver_id))
 
 
-@with_db_connection
-def register_driver(conn, driver_id: str, name: str, password: str) -> bool:
+def register_driver(driver_id: str, name: str, password: str) -> bool:
+    """Register a driver; the password is hashed before a connection is taken."""
+    _release_before_hashing()
     try:
         hashed_password = hash_password(password)
+    except (PasswordPoolBusy, TimeoutError) as e:
+        logging.error(f"Registration error: {e}")
+        return False
+    return bool(_insert_driver(driver_id, name, hashed_password))
+
+
+def _release_before_hashing() -> None:
+    """
+    Give the request's connection back before bcrypt runs, which can take up
+    to PASSWORD_TIMEOUT; a later model call in the request checks out another.
+    """
+    if has_request_context() and _current_unit() is None:
+        release_request_connection()
+
+
+@with_db_connection
+def _insert_driver(conn, driver_id: str, name: str, hashed_password: bytes) -> bool:
+    try:
         with conn.cursor() as cur:
             cur.execute("SELECT 1 FROM drivers WHERE driver_id = %s", (driver_id,))
             if cur.fetchone():
@@ -154,25 +286,71 @@ def register_driver(conn, driver_id: str, name: str, password: str) -> bool:
         return False
 
 
+def login_driver(driver_id: str, password: str) -> Optional[User]:
+    """
+    Check a driver's credentials.
+    No database connection is held while bcrypt runs, and hashes made with
+    an outdated cost are transparently replaced.
+    """
+    credentials = _fetch_credentials(driver_id)
+    if not credentials or not credentials[1]:
+        return None
+    name, password_hash = credentials
+    _release_before_hashing()
+    try:
+        if not check_password(password_hash, password):
+            return None
+        if needs_rehash(password_hash):
+            _update_password_hash(driver_id, hash_password(password))
+    except (PasswordPoolBusy, TimeoutError) as e:
+        logging.error(f"Login error: {e}")
+        return None
+    return User(driver_id, name)
+
+
 @with_db_connection
-def login_driver(conn, driver_id: str, password: str) -> Optional[User]:
+def _fetch_credentials(conn, driver_id: str) -> Optional[Tuple[str, bytes]]:
     try:
         with conn.cursor() as cur:
             cur.execute("SELECT name, password_hash FROM drivers WHERE driver_id = %s", (driver_id,))
             result = cur.fetchone()
-            if result and result[1] and check_password(result[1], password):
-                return User(driver_id, result[0])
-        return None
+            conn.rollback()
+            return tuple(result) if result else None
     except psycopg2.Error as e:
         logging.error(f"Login error: {e}")
         return None
 
 
+@with_db_connection
+def _update_password_hash(conn, driver_id: str, hashed_password: bytes) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE drivers SET password_hash = %s WHERE driver_id = %s", (hashed_password, driver_id))
+            conn.commit()
+            return True
+    except psycopg2.Error as e:
+        logging.error(f"Password rehash error: {e}")
+        conn.rollback()
+        return False
+
+
+# The *_QUERY statements are also run by models_async on psycopg 3, which accepts the
+# same %s and %(name)s placeholders
+UPDATE_STOCK_QUERY = "UPDATE drivers SET current_stock = %s WHERE driver_id = %s"
+MY_STOCK_QUERY = "SELECT current_stock FROM drivers WHERE driver_id = %s"
+DRIVER_NAME_QUERY = "SELECT name FROM drivers WHERE driver_id = %s"
+
+# Prepared once per pooled connection (see prepared.py)
+MY_STOCK = PreparedStatement("my_stock", MY_STOCK_QUERY)
+DRIVER_NAME = PreparedStatement("driver_name", DRIVER_NAME_QUERY)
+
+
 @with_db_connection
 def update_stock(conn, driver_id: str, new_stock: int) -> bool:
     try:
         with conn.cursor() as cur:
-            cur.execute("UPDATE drivers SET current_stock = %s WHERE driver_id = %s", (new_stock, driver_id))
+            cur.execute(UPDATE_STOCK_QUERY, (new_stock, driver_id))
+            publish(cur, "stock", None, driver_id, stock=new_stock)
             conn.commit()
             return True
     except psycopg2.Error as e:
@@ -180,77 +358,230 @@ def update_stock(conn, driver_id: str, new_stock: int) -> bool:
         return False
 
 
+# One round trip: the cap is checked by the UPDATE itself, so concurrent accepts and
+# restocks cannot interleave between a read and a write. Returns the new stock (NULL
+# when the increment was refused) next to the stock before the statement.
+ADD_STOCK_QUERY = """
+    WITH updated AS (
+        UPDATE drivers
+        SET current_stock = current_stock + %(amount)s
+        WHERE driver_id = %(driver_id)s
+        AND current_stock + %(amount)s BETWEEN 0 AND %(max_stock)s
+        RETURNING current_stock
+    )
+    SELECT u.current_stock, d.current_stock,
+           CASE WHEN u.current_stock IS NOT NULL THEN pg_notify('order_events', json_build_object(
+               'type', 'stock', 'request_id', NULL, 'driver_id', d.driver_id, 'stock', u.current_stock,
+               'txid', txid_current()
+           )::text) END
+    FROM drivers d
+    LEFT JOIN updated u ON TRUE
+    WHERE d.driver_id = %(driver_id)s
+"""
+
+
+ADD_STOCK = PreparedStatement("add_stock", ADD_STOCK_QUERY)
+
+
 @with_db_connection
-def view_my_stock(conn, driver_id: str) -> int:
-    """View current stock level"""
+def add_stock(conn, driver_id: str, amount: int) -> Optional[Tuple[bool, int]]:
+    """
+    Add `amount` bags to the driver's stock unless that would leave it outside
+    0..MAX_STOCK. Returns (True, new stock), (False, unchanged stock) when
+    refused, or None for an unknown driver or a database error.
+    """
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT current_stock FROM drivers WHERE driver_id = %s", (driver_id,))
+            ADD_STOCK.execute(cur, {"driver_id": driver_id, "amount": amount, "max_stock": MAX_STOCK})
             result = cur.fetchone()
-            return result[0] if result else 0
+            conn.commit()
+            if not result:
+                return None
+            new_stock, current_stock, _ = result
+            return (True, new_stock) if new_stock is not None else (False, current_stock)
     except psycopg2.Error as e:
-        logging.error(f"View stock error: {e}")
-        return 0
+        logging.error(f"Add stock error: {e}")
+        conn.rollback()
+        return None
+
+
+RESTOCK_LOCK_QUERY = """
+    SELECT driver_id FROM drivers WHERE driver_id = ANY(%s) ORDER BY driver_id FOR UPDATE
+"""
+
+RESTOCK_QUERY = """
+    WITH levels (driver_id, stock) AS (VALUES %s),
+    updated AS (
+        UPDATE drivers d
+        SET current_stock = levels.stock
+        FROM levels
+        WHERE d.driver_id = levels.driver_id
+        RETURNING d.driver_id, d.current_stock
+    )
+    SELECT driver_id, current_stock,
+           pg_notify('order_events', json_build_object(
+               'type', 'stock', 'request_id', NULL, 'driver_id', driver_id, 'stock', current_stock,
+               'txid', txid_current()
+           )::text)
+    FROM updated
+"""
 
 
 @with_db_connection
-def view_unassigned_requests(conn, driver_id: str) -> List[DictRow]:
+def restock_drivers(conn, levels: List[Tuple[str, int]]) -> Optional[dict]:
+    """
+    Set the stock of many drivers in one statement, e.g. after a depot reload.
+    `levels` are (driver_id, stock) pairs with 0 <= stock <= MAX_STOCK; a driver
+    listed twice gets the last level. Returns {driver_id: stock} for the drivers
+    updated (unknown ids are left out), or None on a database error.
+    Driver rows are locked in driver_id order, the order dispatch locks them in,
+    so a restock and a dispatch round cannot deadlock.
+    """
+    if not levels:
+        return {}
+    levels = sorted(dict(levels).items())
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:  # Use DictCursor
-            # Fetch unassigned requests (pending) from delivery_requests
-            cur.execute(
-                """
-                SELECT request_id, NULL AS driver_id, dropoff_address, quantity, ordered_at, 'pending' AS status
-                FROM delivery_requests
-                WHERE status = 'pending'
-                AND request_id NOT IN (
-                    SELECT request_id
-                    FROM order_tracking
-                    WHERE status = 'pending(*)' AND driver_id = %s
-                )
-                """,
-                (driver_id,),
-            )
-            unassigned_requests = cur.fetchall()
+        with conn.cursor() as cur:
+            cur.execute(RESTOCK_LOCK_QUERY, ([driver_id for driver_id, _ in levels],))
+            rows = execute_values(cur, RESTOCK_QUERY, levels, template="(%s, %s::int)", page_size=len(levels), fetch=True)
+            conn.commit()
+            return {driver_id: stock for driver_id, stock, _ in rows}
+    except psycopg2.Error as e:
+        logging.error(f"Restock error: {e}")
+        conn.rollback()
+        return None
 
-            cur.execute(
-                """
-                SELECT request_id, driver_id, dropoff_address, quantity, ordered_at, 'pending(*)' AS status
-                FROM order_tracking
-                WHERE status = 'pending(*)' AND driver_id != %s
-                """,
-                (driver_id,),
+
+RESERVE_REQUEST_IDS_QUERY = """
+    SELECT nextval(pg_get_serial_sequence('delivery_requests', 'request_id')), LOCALTIMESTAMP
+    FROM generate_series(1, %s)
+"""
+
+
+def _copy_text(value) -> str:
+    """A value for COPY's text format: backslash, tab and line breaks escaped."""
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+@with_db_connection
+def load_delivery_requests(conn, orders: List[Tuple[str, int, Optional[datetime]]]) -> Optional[List[int]]:
+    """
+    Insert validated pending requests, (dropoff_address, quantity, ordered_at)
+    with ordered_at None for now, with one COPY in one transaction. Ids are
+    reserved from the sequence first so they can be returned; the insert
+    trigger sends a single `created` event for the batch. Returns the new
+    request ids in order, or None on a database error (nothing is loaded).
+    """
+    if not orders:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(RESERVE_REQUEST_IDS_QUERY, (len(orders),))
+            reserved = cur.fetchall()
+            now = reserved[0][1]
+            data = io.StringIO("".join(
+                f"{request_id}\t{_copy_text(address)}\t{quantity}\t{ordered_at or now}\n"
+                for (request_id, _), (address, quantity, ordered_at) in zip(reserved, orders)
+            ))
+            cur.copy_expert(
+                "COPY delivery_requests (request_id, dropoff_address, quantity, ordered_at) FROM STDIN",
+                data,
+                size=1 << 16,
             )
-            resigned_requests = cur.fetchall()
+            conn.commit()
+            return [request_id for request_id, _ in reserved]
+    except psycopg2.Error as e:
+        logging.error(f"Load delivery requests error: {e}")
+        conn.rollback()
+        return None
+
+
+@with_db_connection
+def view_my_stock(conn, driver_id: str) -> Optional[int]:
+    """View current stock level (None on a database error)"""
+    try:
+        with conn.cursor() as cur:
+            MY_STOCK.execute(cur, (driver_id,))
+            result = cur.fetchone()
+            return result[0] if result else 0
+    except psycopg2.Error as e:
+        logging.error(f"View stock error: {e}")
+        return None
+
 
-            # Combine unassigned and resigned requests
-            all_requests = unassigned_requests + resigned_requests
+UNASSIGNED_REQUESTS_QUERY = """
+    SELECT r.request_id, t.driver_id, r.dropoff_address, r.quantity, r.ordered_at,
+           CASE WHEN t.driver_id IS NULL THEN 'pending' ELSE 'pending(*)' END AS status
+    FROM delivery_requests r
+    LEFT JOIN LATERAL (
+        -- Resigned by another driver: shown as pending(*)
+        SELECT o.driver_id
+        FROM order_tracking o
+        WHERE o.request_id = r.request_id
+        AND o.ordered_at = r.ordered_at  -- prunes to the request's month partition
+        AND o.status = 'pending(*)'
+        AND o.driver_id <> %(driver_id)s
+        LIMIT 1
+    ) t ON TRUE
+    WHERE r.status = 'pending'
+    AND (
+        t.driver_id IS NOT NULL
+        -- Hide requests this driver resigned, unless someone else resigned them too
+        OR NOT EXISTS (
+            SELECT 1
+            FROM order_tracking m
+            WHERE m.request_id = r.request_id
+            AND m.ordered_at = r.ordered_at
+            AND m.status = 'pending(*)'
+            AND m.driver_id = %(driver_id)s
+        )
+    )
+    AND (%(request_ids)s::int[] IS NULL OR r.request_id = ANY(%(request_ids)s::int[]))
+    ORDER BY r.ordered_at, r.request_id
+    LIMIT %(limit)s
+"""
+
+
+UNASSIGNED_REQUESTS = PreparedStatement("unassigned_requests", UNASSIGNED_REQUESTS_QUERY)
 
-            # Remove duplicates (keep the latest status for each request_id)
-            unique_requests = {}
-            for req in all_requests:
-                request_id = req["request_id"]
-                if request_id not in unique_requests or req["status"] == "pending(*)":
-                    unique_requests[request_id] = req
 
-            return list(unique_requests.values())
+@with_db_connection
+def view_unassigned_requests(
+    conn, driver_id: str, limit: int = UNASSIGNED_REQUESTS_LIMIT, request_ids: Optional[List[int]] = None
+) -> Optional[List[DictRow]]:
+    """
+    Pending requests (oldest first) merged with requests other drivers
+    resigned, in one query; None on a database error. Served by the partial indexes on
+    delivery_requests (status = 'pending') and order_tracking
+    (status = 'pending(*)'). `request_ids` restricts the result to those
+    requests, e.g. the nearest ones from geo.pending_index().
+    """
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:  # Use DictCursor
+            UNASSIGNED_REQUESTS.execute(
+                cur, {"driver_id": driver_id, "limit": limit, "request_ids": request_ids}
+            )
+            return cur.fetchall()
     except psycopg2.Error as e:
         logging.error(f"View unassigned requests error: {e}")
-        return []
+        return None
+
+
+ACTIVE_DELIVERY_COUNT = PreparedStatement(
+    "active_delivery_count",
+    """
+    SELECT COUNT(*)
+    FROM delivery_requests
+    WHERE assigned_driver_id = %s AND status = 'in-progress'
+    """,
+)
 
 
 @with_db_connection
 def count_active_deliveries(conn, driver_id: str) -> int:
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM delivery_requests
-                WHERE assigned_driver_id = %s AND status = 'in-progress'
-                """,
-                (driver_id,),
-            )
+            ACTIVE_DELIVERY_COUNT.execute(cur, (driver_id,))
             result = cur.fetchone()
             return result[0] if result else 0
     except psycopg2.Error as e:
@@ -278,106 +609,164 @@ def view_active_deliveries(conn) -> List[Tuple]:
         return []
 
 
+MY_DELIVERIES_QUERY = """
+    SELECT request_id, dropoff_address, quantity, ordered_at
+    FROM delivery_requests
+    WHERE assigned_driver_id = %s AND status = 'in-progress'
+    ORDER BY ordered_at
+"""
+
+
+MY_DELIVERIES = PreparedStatement("my_deliveries", MY_DELIVERIES_QUERY)
+
+
 @with_db_connection
-def view_my_deliveries(conn, driver_id: str) -> List[Tuple]:
+def view_my_deliveries(conn, driver_id: str) -> Optional[List[Tuple]]:
+    """The driver's in-progress deliveries (None on a database error)"""
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT request_id, dropoff_address, quantity, ordered_at
-                FROM delivery_requests
-                WHERE assigned_driver_id = %s AND status = 'in-progress'
-                ORDER BY ordered_at
-                """,
-                (driver_id,),
-            )
+            MY_DELIVERIES.execute(cur, (driver_id,))
             return cur.fetchall()
     except psycopg2.Error as e:
         logging.error(f"View my deliveries error: {e}")
-        return []
+        return None
+
+
+ACCEPT_DELIVERY_LOCK = """
+    SELECT current_stock FROM drivers WHERE driver_id = %(driver_id)s FOR UPDATE
+"""
+
+# Runs after ACCEPT_DELIVERY_LOCK in the same transaction (see accept_delivery)
+ACCEPT_DELIVERY_QUERY = f"""
+    WITH req AS (
+        SELECT r.request_id, r.quantity
+        FROM delivery_requests r
+        JOIN drivers d ON d.driver_id = %(driver_id)s
+        WHERE r.request_id = %(request_id)s
+        AND r.status = 'pending'
+        AND d.current_stock >= r.quantity
+        AND (
+            SELECT COUNT(*)
+            FROM delivery_requests a
+            WHERE a.assigned_driver_id = %(driver_id)s AND a.status = 'in-progress'
+        ) < {MAX_ACTIVE_DELIVERIES}
+        FOR UPDATE OF r SKIP LOCKED
+    ),
+    assigned AS (
+        UPDATE delivery_requests r
+        SET status = 'in-progress', assigned_driver_id = %(driver_id)s
+        FROM req
+        WHERE r.request_id = req.request_id
+        RETURNING r.request_id, r.quantity, r.ordered_at
+    ),
+    stock AS (
+        UPDATE drivers d
+        SET current_stock = d.current_stock - assigned.quantity
+        FROM assigned
+        WHERE d.driver_id = %(driver_id)s
+    ),
+    cleared AS (
+        -- Remove resigned order from order_tracking if it exists
+        DELETE FROM order_tracking o
+        USING assigned
+        WHERE o.request_id = assigned.request_id
+        AND o.ordered_at = assigned.ordered_at
+        AND o.status = 'pending(*)'
+    )
+    SELECT request_id,
+           pg_notify('order_events', json_build_object(
+               'type', 'accepted', 'request_id', request_id, 'driver_id', %(driver_id)s::text,
+               'txid', txid_current()
+           )::text)
+    FROM assigned
+"""
+
+
+ACCEPT_DELIVERY = (
+    PreparedStatement("accept_delivery_lock", ACCEPT_DELIVERY_LOCK),
+    PreparedStatement("accept_delivery", ACCEPT_DELIVERY_QUERY),
+)
 
 
 @with_db_connection
 def accept_delivery(conn, driver_id: str, request_id: int) -> bool:
+    """
+    Assign a pending request to the driver in one round trip.
+    The driver row is locked first so the delivery cap and stock check in the
+    second statement see any accept the same driver committed concurrently.
+    The request row is locked with SKIP LOCKED, so when two drivers race for it
+    the loser fails immediately instead of waiting.
+    """
     try:
         with conn.cursor() as cur:
-            # Check if request is still pending and driver has enough stock
-            cur.execute(
-                """
-                SELECT r.quantity, d.current_stock
-                FROM delivery_requests r, drivers d
-                WHERE r.request_id = %s
-                AND d.driver_id = %s
-                AND r.status = 'pending'
-                """,
-                (request_id, driver_id),
-            )
-
-            # Check if the driver already has 3 or more active deliveries
-            # active_deliveries = count_active_deliveries(conn, driver_id)  # Remove `conn` argument
-            active_deliveries = count_active_deliveries(driver_id)
-            if active_deliveries >= 3:
-                logging.error(f"Driver {driver_id} already has 3 active deliveries.")
-                return False
-
-            result = cur.fetchone()
-            if not result:
-                return False
-
-            needed_quantity, current_stock = result
-            if current_stock < needed_quantity:
+            params = {"driver_id": driver_id, "request_id": request_id}
+            execute_chain(cur, [(statement, params) for statement in ACCEPT_DELIVERY])
+            if not cur.fetchone():
+                conn.rollback()
+                logging.info(f"Driver {driver_id} could not accept request {request_id}.")
                 return False
 
-            # Update request and driver stock
-            cur.execute(
-                """
-                UPDATE delivery_requests
-                SET status = 'in-progress', assigned_driver_id = %s
-                WHERE request_id = %s AND status = 'pending'
-                """,
-                (driver_id, request_id),
-            )
-
-            cur.execute(
-                """
-                UPDATE drivers
-                SET current_stock = current_stock - %s
-                WHERE driver_id = %s
-                """,
-                (needed_quantity, driver_id),
-            )
-
-            # Remove resigned order from order_tracking if it exists
-            cur.execute(
-                """
-                DELETE FROM order_tracking
-                WHERE request_id = %s AND status = 'pending(*)'
-                """,
-                (request_id,),
-            )
-
             conn.commit()
             return True
     except psycopg2.Error as e:
         logging.error(f"Accept delivery error: {e}")
+        conn.rollback()
         return False
 
 
+ACTIVE_DELIVERY_QUERY = """
+    SELECT dropoff_address, quantity, ordered_at
+    FROM delivery_requests
+    WHERE request_id = %s
+    AND assigned_driver_id = %s
+    AND status = 'in-progress'
+"""
+
+RESTORE_STOCK_QUERY = """
+    UPDATE drivers
+    SET current_stock = current_stock + %s
+    WHERE driver_id = %s
+"""
+
+TRACK_RESIGNED_QUERY = """
+    INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
+    VALUES (%s, %s, %s, %s, %s, NULL, 'pending(*)')
+"""
+
+REQUEUE_REQUEST_QUERY = """
+    UPDATE delivery_requests
+    SET status = 'pending', assigned_driver_id = NULL
+    WHERE request_id = %s
+    AND assigned_driver_id = %s
+    AND status = 'in-progress'
+"""
+
+TRACK_COMPLETED_QUERY = """
+    INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
+    VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, 'completed')
+"""
+
+DELETE_DELIVERY_QUERY = """
+    DELETE FROM delivery_requests
+    WHERE request_id = %s
+    AND assigned_driver_id = %s
+    AND status = 'in-progress'
+"""
+
+ACTIVE_DELIVERY = PreparedStatement("active_delivery", ACTIVE_DELIVERY_QUERY)
+RESTORE_STOCK = PreparedStatement("restore_stock", RESTORE_STOCK_QUERY)
+TRACK_RESIGNED = PreparedStatement("track_resigned", TRACK_RESIGNED_QUERY)
+REQUEUE_REQUEST = PreparedStatement("requeue_request", REQUEUE_REQUEST_QUERY)
+TRACK_COMPLETED = PreparedStatement("track_completed", TRACK_COMPLETED_QUERY)
+DELETE_DELIVERY = PreparedStatement("delete_delivery", DELETE_DELIVERY_QUERY)
+
+
 @with_db_connection
 def resign_delivery(conn, driver_id: str, request_id: int) -> bool:
     try:
         with conn.cursor() as cur:
             # Fetch the delivery details
-            cur.execute(
-                """
-                SELECT dropoff_address, quantity, ordered_at
-                FROM delivery_requests
-                WHERE request_id = %s
-                AND assigned_driver_id = %s
-                AND status = 'in-progress'
-                """,
-                (request_id, driver_id),
-            )
+            ACTIVE_DELIVERY.execute(cur, (request_id, driver_id))
 
             result = cur.fetchone()
             if not result:
@@ -386,36 +775,16 @@ def resign_delivery(conn, driver_id: str, request_id: int) -> bool:
             dropoff_address, quantity, ordered_at = result
 
             # Restore the driver's stock
-            cur.execute(
-                """
-                UPDATE drivers
-                SET current_stock = current_stock + %s
-                WHERE driver_id = %s
-                """,
-                (quantity, driver_id),
-            )
+            RESTORE_STOCK.execute(cur, (quantity, driver_id))
 
             # Insert the delivery into order_tracking with status 'pending(*)'
-            cur.execute(
-                """
-                INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
-                VALUES (%s, %s, %s, %s, %s, NULL, 'pending(*)')
-                """,
-                (request_id, driver_id, dropoff_address, quantity, ordered_at),
-            )
+            TRACK_RESIGNED.execute(cur, (request_id, driver_id, dropoff_address, quantity, ordered_at))
 
             # Update the delivery_requests table to set status back to 'pending'
-            cur.execute(
-                """
-                UPDATE delivery_requests
-                SET status = 'pending', assigned_driver_id = NULL
-                WHERE request_id = %s
-                AND assigned_driver_id = %s
-                AND status = 'in-progress'
-                """,
-                (request_id, driver_id),
-            )
+            REQUEUE_REQUEST.execute(cur, (request_id, driver_id))
 
+            record_resigned(cur, driver_id, dropoff_address, ordered_at)
+            publish(cur, "resigned", request_id, driver_id, status="pending(*)")
             conn.commit()
             return True
     except psycopg2.Error as e:
@@ -428,16 +797,7 @@ def complete_delivery(conn, driver_id: str, request_id: int) -> bool:
     try:
         with conn.cursor() as cur:
             # Fetch the delivery details
-            cur.execute(
-                """
-                SELECT dropoff_address, quantity, ordered_at
-                FROM delivery_requests
-                WHERE request_id = %s
-                AND assigned_driver_id = %s
-                AND status = 'in-progress'
-                """,
-                (request_id, driver_id),
-            )
+            ACTIVE_DELIVERY.execute(cur, (request_id, driver_id))
 
             result = cur.fetchone()
             if not result:
@@ -446,28 +806,169 @@ def complete_delivery(conn, driver_id: str, request_id: int) -> bool:
             dropoff_address, quantity, ordered_at = result
 
             # Insert the delivery into order_tracking
-            cur.execute(
-                """
-                INSERT INTO order_tracking (request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, 'completed')
-                """,
-                (request_id, driver_id, dropoff_address, quantity, ordered_at),
-            )
+            TRACK_COMPLETED.execute(cur, (request_id, driver_id, dropoff_address, quantity, ordered_at))
 
             # Delete the delivery from delivery_requests
-            cur.execute(
-                """
-                DELETE FROM delivery_requests
-                WHERE request_id = %s
-                AND assigned_driver_id = %s
-                AND status = 'in-progress'
-                """,
-                (request_id, driver_id),
-            )
+            DELETE_DELIVERY.execute(cur, (request_id, driver_id))
 
+            record_completed(cur, driver_id, dropoff_address, quantity, ordered_at)
+            publish(cur, "completed", request_id, driver_id, status="completed")
             conn.commit()
             return True
     except psycopg2.Error as e:
         logging.error(f"Complete delivery error: {e}")
         conn.rollback()
         return False
+
+
+ORDER_TRACKING_STATUSES = ("pending", "in-progress", "completed", "pending(*)")
+
+
+class OrderTrackingPage:
+    """
+    One keyset page of the order tracking view, newest first.
+    Rows are read lazily through a server-side (named) cursor, so iterating
+    the page never holds more than `itersize` rows in memory. After iteration
+    `next_cursor` holds the (ordered_at, request_id, source, history_id) key
+    of the following page, or None when this was the last one, and `error` is True if the rows stopped
+    because of a database error rather than the end of the page.
+
+    A resigned request appears as its live delivery_requests row and as one
+    or more order_tracking rows with the same (ordered_at, request_id), so
+    the key also carries source (0 live, 1 order_tracking) and the
+    order_tracking history_id (0 for live rows) to stay unique.
+    """
+
+    def __init__(
+        self,
+        page_size: int,
+        before: Optional[Tuple[datetime, int, int, int]] = None,
+        status: Optional[str] = None,
+        driver_id: Optional[str] = None,
+    ):
+        self.page_size = page_size
+        self.before = before
+        self.status = status if status in ORDER_TRACKING_STATUSES else None
+        self.driver_id = driver_id or None
+        self.next_cursor = None
+        self.row_count = 0
+        self.error = False
+
+    def _query(self) -> Tuple[str, list]:
+        conditions = []
+        params = []
+        if self.before:
+            conditions.append("(ordered_at, request_id, source, history_id) < (%s, %s, %s, %s)")
+            params.extend(self.before)
+        if self.status:
+            conditions.append("status = %s")
+            params.append(self.status)
+        if self.driver_id:
+            conditions.append("driver_id = %s")
+            params.append(self.driver_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Fetch one extra row to know whether a next page exists
+        params.append(self.page_size + 1)
+        query = f"""
+            SELECT request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status,
+                   source, history_id
+            FROM (
+                SELECT request_id, assigned_driver_id AS driver_id, dropoff_address, quantity,
+                       ordered_at, NULL::timestamp AS completed_at, status, 0 AS source, 0 AS history_id
+                FROM delivery_requests
+                WHERE status IN ('pending', 'in-progress')
+                UNION ALL
+                SELECT request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status,
+                       1 AS source, history_id
+                FROM order_tracking
+            ) AS orders
+            {where}
+            ORDER BY ordered_at DESC, request_id DESC, source DESC, history_id DESC
+            LIMIT %s
+        """
+        return query, params
+
+    def __iter__(self):
+        conn = get_connection()
+        if not conn:
+            logging.error("Failed to get database connection in OrderTrackingPage")
+            self.error = True
+            return
+        try:
+            query, params = self._query()
+            with conn.cursor(name="order_tracking_page", cursor_factory=DictCursor) as cur:
+                cur.itersize = min(self.page_size + 1, 1000)
+                cur.execute(query, params)
+                last = None
+                for row in cur:
+                    if self.row_count == self.page_size:
+                        self.next_cursor = (
+                            last["ordered_at"], last["request_id"], last["source"], last["history_id"]
+                        )
+                        break
+                    self.row_count += 1
+                    last = row
+                    yield row
+            conn.rollback()  # End the read-only transaction holding the named cursor
+        except psycopg2.Error as e:
+            logging.error(f"Order tracking error: {e}")
+            self.error = True
+            conn.rollback()
+        finally:
+            return_connection(conn)
+
+
+@with_db_connection
+def delivery_stats(conn, since, driver_id: Optional[str] = None) -> dict:
+    """
+    Totals since `since` (a date) from the daily rollups: per city, and per
+    driver (the STATS_TOP_DRIVERS busiest, or one driver day by day).
+    """
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            totals = """
+                SUM(completed) AS completed, SUM(resigned) AS resigned, SUM(bags) AS bags,
+                ROUND(SUM(resigned)::numeric / NULLIF(SUM(completed) + SUM(resigned), 0), 4)::float8 AS resign_rate,
+                ROUND(SUM(complete_seconds)::numeric / NULLIF(SUM(completed), 0))::float8 AS avg_complete_seconds
+            """
+            cur.execute(
+                f"""
+                SELECT city, {totals}
+                FROM city_daily_stats
+                WHERE day >= %s
+                GROUP BY city
+                ORDER BY city
+                """,
+                (since,),
+            )
+            cities = [dict(row) for row in cur.fetchall()]
+            if driver_id:
+                cur.execute(
+                    f"""
+                    SELECT to_char(day, 'YYYY-MM-DD') AS day, {totals}
+                    FROM driver_daily_stats
+                    WHERE driver_id = %s AND day >= %s
+                    GROUP BY day
+                    ORDER BY day
+                    """,
+                    (driver_id, since),
+                )
+            else:
+                cur.execute(
+                    f"""
+                    SELECT driver_id, {totals}
+                    FROM driver_daily_stats
+                    WHERE day >= %s
+                    GROUP BY driver_id
+                    ORDER BY completed DESC, driver_id
+                    LIMIT %s
+                    """,
+                    (since, STATS_TOP_DRIVERS),
+                )
+            drivers = [dict(row) for row in cur.fetchall()]
+        conn.rollback()
+        return {"cities": cities, "drivers": drivers}
+    except psycopg2.Error as e:
+        logging.error(f"Delivery stats error: {e}")
+        conn.rollback()
+        return None
@@ -0,0 +1,230 @@
+"""
+Async variants of the driver-facing model functions, on psycopg 3.
+
+The functions mirror their namesakes in models and run the same SQL
+constants, so both paths stay in step. They take a connection from an
+AsyncConnectionPool only for the duration of the queries, which is what lets
+one ASGI process (asgi.py) keep thousands of idle long-poll and SSE clients
+on a handful of connections. The sync models module is unchanged and keeps
+serving the WSGI app and the background jobs.
+
+The pool is created closed; asgi.py opens it on lifespan startup. Rows from
+view_unassigned_requests are dicts rather than psycopg2 DictRows.
+"""
+import logging
+import time
+from functools import wraps
+from typing import List, Optional, Tuple
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from config import (
+    ASYNC_DB_POOL_MAX,
+    ASYNC_DB_POOL_MIN,
+    DB_CONFIG,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    UNASSIGNED_REQUESTS_LIMIT,
+)
+from events import notify_args
+from metrics import DB_FUNCTION_ERRORS, DB_FUNCTION_SECONDS, POOL_WAIT_SECONDS
+from models import (
+    ACCEPT_DELIVERY_LOCK,
+    ACCEPT_DELIVERY_QUERY,
+    ACTIVE_DELIVERY_QUERY,
+    DELETE_DELIVERY_QUERY,
+    MY_DELIVERIES_QUERY,
+    MY_STOCK_QUERY,
+    REQUEUE_REQUEST_QUERY,
+    RESTORE_STOCK_QUERY,
+    TRACK_COMPLETED_QUERY,
+    TRACK_RESIGNED_QUERY,
+    UNASSIGNED_REQUESTS_QUERY,
+    UPDATE_STOCK_QUERY,
+)
+from rollups import completed_args, resigned_args, rollups_ready_async
+
+pool = AsyncConnectionPool(
+    make_conninfo(**{key: value for key, value in DB_CONFIG.items() if value}),
+    min_size=ASYNC_DB_POOL_MIN,
+    max_size=ASYNC_DB_POOL_MAX,
+    timeout=DB_POOL_ACQUIRE_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    open=False,
+)
+
+
+async def open_pool() -> None:
+    await pool.open()
+
+
+async def close_pool() -> None:
+    await pool.close()
+
+
+def with_async_connection(func):
+    """
+    Async counterpart of models.with_db_connection: passes a pooled connection
+    as the first argument, returns None on a pool timeout or database error.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            conn = await pool.getconn()
+        except (PoolTimeout, psycopg.Error) as e:
+            logging.error(f"Failed to get async database connection in {name}: {e}")
+            return None
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        try:
+            return await func(conn, *args, **kwargs)
+        except psycopg.Error as e:
+            logging.error(f"Database error in {name}: {e}")
+            DB_FUNCTION_ERRORS.inc(name)
+            await conn.rollback()
+            return None
+        finally:
+            DB_FUNCTION_SECONDS.observe(time.perf_counter() - started, name)
+            await pool.putconn(conn)
+    return wrapper
+
+
+@with_async_connection
+async def update_stock(conn, driver_id: str, new_stock: int) -> bool:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(UPDATE_STOCK_QUERY, (new_stock, driver_id))
+            await cur.execute(*notify_args("stock", None, driver_id, stock=new_stock))
+        await conn.commit()
+        return True
+    except psycopg.Error as e:
+        logging.error(f"Update stock error: {e}")
+        await conn.rollback()
+        return False
+
+
+@with_async_connection
+async def view_my_stock(conn, driver_id: str) -> Optional[int]:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(MY_STOCK_QUERY, (driver_id,))
+            result = await cur.fetchone()
+        await conn.rollback()
+        return result[0] if result else 0
+    except psycopg.Error as e:
+        logging.error(f"View stock error: {e}")
+        await conn.rollback()
+        return None
+
+
+@with_async_connection
+async def view_unassigned_requests(
+    conn, driver_id: str, limit: int = UNASSIGNED_REQUESTS_LIMIT, request_ids: Optional[List[int]] = None
+) -> Optional[List[dict]]:
+    """See models.view_unassigned_requests."""
+    try:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                UNASSIGNED_REQUESTS_QUERY, {"driver_id": driver_id, "limit": limit, "request_ids": request_ids}
+            )
+            rows = await cur.fetchall()
+        await conn.rollback()
+        return rows
+    except psycopg.Error as e:
+        logging.error(f"View unassigned requests error: {e}")
+        await conn.rollback()
+        return None
+
+
+@with_async_connection
+async def view_my_deliveries(conn, driver_id: str) -> Optional[List[Tuple]]:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(MY_DELIVERIES_QUERY, (driver_id,))
+            rows = await cur.fetchall()
+        await conn.rollback()
+        return rows
+    except psycopg.Error as e:
+        logging.error(f"View my deliveries error: {e}")
+        await conn.rollback()
+        return None
+
+
+@with_async_connection
+async def accept_delivery(conn, driver_id: str, request_id: int) -> bool:
+    """
+    See models.accept_delivery. psycopg 3 binds parameters server-side, which
+    rules out two statements in one execute, so this takes two round trips.
+    """
+    params = {"driver_id": driver_id, "request_id": request_id}
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(ACCEPT_DELIVERY_LOCK, params)
+            await cur.execute(ACCEPT_DELIVERY_QUERY, params)
+            if not await cur.fetchone():
+                await conn.rollback()
+                logging.info(f"Driver {driver_id} could not accept request {request_id}.")
+                return False
+        await conn.commit()
+        return True
+    except psycopg.Error as e:
+        logging.error(f"Accept delivery error: {e}")
+        await conn.rollback()
+        return False
+
+
+@with_async_connection
+async def resign_delivery(conn, driver_id: str, request_id: int) -> bool:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(ACTIVE_DELIVERY_QUERY, (request_id, driver_id))
+            result = await cur.fetchone()
+            if not result:
+                await conn.rollback()
+                return False
+
+            dropoff_address, quantity, ordered_at = result
+            await cur.execute(RESTORE_STOCK_QUERY, (quantity, driver_id))
+            await cur.execute(TRACK_RESIGNED_QUERY, (request_id, driver_id, dropoff_address, quantity, ordered_at))
+            await cur.execute(REQUEUE_REQUEST_QUERY, (request_id, driver_id))
+            if await rollups_ready_async(cur):
+                await cur.execute(*resigned_args(driver_id, dropoff_address, ordered_at))
+            await cur.execute(*notify_args("resigned", request_id, driver_id, status="pending(*)"))
+        await conn.commit()
+        return True
+    except psycopg.Error as e:
+        logging.error(f"Resign delivery error: {e}")
+        await conn.rollback()
+        return False
+
+
+@with_async_connection
+async def complete_delivery(conn, driver_id: str, request_id: int) -> bool:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(ACTIVE_DELIVERY_QUERY, (request_id, driver_id))
+            result = await cur.fetchone()
+            if not result:
+                await conn.rollback()
+                return False
+
+            dropoff_address, quantity, ordered_at = result
+            await cur.execute(TRACK_COMPLETED_QUERY, (request_id, driver_id, dropoff_address, quantity, ordered_at))
+            await cur.execute(DELETE_DELIVERY_QUERY, (request_id, driver_id))
+            if await rollups_ready_async(cur):
+                await cur.execute(*completed_args(driver_id, dropoff_address, quantity, ordered_at))
+            await cur.execute(*notify_args("completed", request_id, driver_id, status="completed"))
+        await conn.commit()
+        return True
+    except psycopg.Error as e:
+        logging.error(f"Complete delivery error: {e}")
+        await conn.rollback()
+        return False
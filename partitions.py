@@ -0,0 +1,414 @@
+"""
+Monthly partitions of order_tracking (see migrations/v0003).
+
+maintain() keeps partitions created ORDER_TRACKING_PARTITIONS_AHEAD months
+ahead of today, and archives months older than ORDER_TRACKING_RETENTION_MONTHS:
+the partition is detached, exported with COPY to a gzipped CSV in
+ORDER_TRACKING_ARCHIVE_DIR, and dropped. A month is kept while it still has
+resigned `pending(*)` rows or live delivery requests, because those rows are
+still read and written through the parent table.
+
+A partition this job detaches is recorded in order_tracking_archive_queue
+(migration v0005) until it is dropped, so a run interrupted after the detach
+is finished by the next one. Detached partitions that are not queued, such
+as those left with --keep-detached, are never touched. Nothing runs against
+a database where order_tracking is not partitioned yet (migration v0003).
+
+Rows dated outside every monthly partition go to order_tracking_default
+(migration v0006); creating their month moves them out of it. The app
+creates months ahead every PARTITION_CREATE_INTERVAL_SECONDS, which is cheap;
+archiving is opt-in via PARTITION_MAINTENANCE_INTERVAL_SECONDS.
+
+Usage:
+    python partitions.py status
+    python partitions.py maintain [--dry-run] [--keep-detached] [--create-only]
+"""
+import argparse
+import gzip
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import sql
+
+from config import (
+    ORDER_TRACKING_ARCHIVE_DIR,
+    ORDER_TRACKING_PARTITIONS_AHEAD,
+    ORDER_TRACKING_RETENTION_MONTHS,
+    PARTITION_CREATE_INTERVAL_SECONDS,
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+)
+from models import get_connection, return_connection
+
+PARENT = "order_tracking"
+DEFAULT_PARTITION = "order_tracking_default"
+PARTITION_PATTERN = re.compile(r"^order_tracking_p(\d{4})_(\d{2})$")
+
+# Arbitrary key for pg_try_advisory_lock so only one process maintains partitions
+MAINTENANCE_LOCK_KEY = 72_640_002
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_PATTERN.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(cur) -> bool:
+    """True once migration v0003 has been applied."""
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", (PARENT,))
+    return cur.fetchone()[0]
+
+
+def attached_partitions(cur) -> List[str]:
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+        """,
+        (PARENT,),
+    )
+    return [row[0] for row in cur.fetchall() if partition_month(row[0])]
+
+
+def detached_partitions(cur) -> List[str]:
+    """Monthly partition tables that are no longer attached, queued for archiving or kept."""
+    cur.execute(
+        """
+        SELECT relname
+        FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND relname LIKE 'order\\_tracking\\_p%'
+        ORDER BY relname
+        """
+    )
+    return [row[0] for row in cur.fetchall() if partition_month(row[0])]
+
+
+def has_archive_queue(cur) -> bool:
+    """True once migration v0005 has been applied."""
+    cur.execute("SELECT to_regclass('order_tracking_archive_queue') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def queued_partitions(cur) -> List[str]:
+    """Partitions this job detached for archiving and has not dropped yet."""
+    cur.execute("SELECT partition_name FROM order_tracking_archive_queue ORDER BY partition_name")
+    return [row[0] for row in cur.fetchall()]
+
+
+def has_default_partition(cur) -> bool:
+    """True once migration v0006 has been applied."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (DEFAULT_PARTITION,))
+    return cur.fetchone()[0]
+
+
+def _create_partition(cur, month: date, from_default: bool) -> None:
+    """
+    Create one month's partition. Rows of that month already in the DEFAULT
+    partition would make the CREATE fail, so they are set aside and put back
+    through the parent in the same transaction.
+    """
+    bounds = (month, add_months(month, 1))
+    moved = False
+    if from_default:
+        cur.execute(
+            sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE ordered_at >= %s AND ordered_at < %s)").format(
+                sql.Identifier(DEFAULT_PARTITION)
+            ),
+            bounds,
+        )
+        moved = cur.fetchone()[0]
+    if moved:
+        cur.execute(
+            sql.SQL(
+                """
+                CREATE TEMP TABLE order_tracking_moving ON COMMIT DROP AS
+                WITH moved AS (DELETE FROM {} WHERE ordered_at >= %s AND ordered_at < %s RETURNING *)
+                SELECT * FROM moved
+                """
+            ).format(sql.Identifier(DEFAULT_PARTITION)),
+            bounds,
+        )
+    cur.execute(
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+            sql.Identifier(partition_name(month)), sql.Identifier(PARENT)
+        ),
+        bounds,
+    )
+    if moved:
+        cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM order_tracking_moving").format(sql.Identifier(PARENT)))
+        cur.execute("DROP TABLE order_tracking_moving")
+
+
+def ensure_partitions(cur, first: date, last: date) -> List[str]:
+    """Create the monthly partitions covering first..last (inclusive); returns the new ones."""
+    existing = set(attached_partitions(cur))
+    from_default = has_default_partition(cur)
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            _create_partition(cur, month, from_default)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def partition_window(today: Optional[date] = None) -> Tuple[date, date]:
+    """[first, end) of the months order history may be dated in: retention back, partitions ahead."""
+    this_month = month_start(today or datetime.now().date())
+    return (
+        add_months(this_month, -ORDER_TRACKING_RETENTION_MONTHS),
+        add_months(this_month, ORDER_TRACKING_PARTITIONS_AHEAD + 1),
+    )
+
+
+def ensure_months(first: date, last: date) -> Optional[List[str]]:
+    """
+    ensure_partitions on a pooled connection, committed; a no-op before
+    migration v0003. Returns the partitions created, or None on error.
+    """
+    conn = get_connection()
+    if not conn:
+        logging.error("Failed to get database connection in ensure_months")
+        return None
+    try:
+        with conn.cursor() as cur:
+            created = ensure_partitions(cur, first, last) if is_partitioned(cur) else []
+        conn.commit()
+        return created
+    except psycopg2.Error as e:
+        logging.error(f"Partition creation error: {e}")
+        conn.rollback()
+        return None
+    finally:
+        return_connection(conn)
+
+
+def _still_in_use(cur, month: date) -> bool:
+    cur.execute(
+        sql.SQL(
+            """
+            SELECT EXISTS (SELECT 1 FROM {} WHERE status = 'pending(*)')
+                OR EXISTS (SELECT 1 FROM delivery_requests WHERE ordered_at >= %s AND ordered_at < %s)
+            """
+        ).format(sql.Identifier(partition_name(month))),
+        (month, add_months(month, 1)),
+    )
+    return cur.fetchone()[0]
+
+
+def export_partition(cur, name: str, archive_dir: str) -> str:
+    """COPY a (detached) partition to <archive_dir>/<name>.csv.gz; returns the file path."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wb") as f:
+        cur.copy_expert(
+            sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name)).as_string(cur),
+            f,
+        )
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def archive_partition(conn, name: str, archive_dir: str, keep_detached: bool = False) -> str:
+    """
+    Detach (if attached), export and drop one partition; each step commits on its own.
+    Until the drop the partition is queued, unless it is to be kept detached.
+    """
+    with conn.cursor() as cur:
+        if name in attached_partitions(cur):
+            # Detached first so the parent stops planning around it before the slow export
+            cur.execute(
+                sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(PARENT), sql.Identifier(name))
+            )
+            if not keep_detached:
+                cur.execute(
+                    "INSERT INTO order_tracking_archive_queue (partition_name) VALUES (%s) ON CONFLICT DO NOTHING",
+                    (name,),
+                )
+            conn.commit()
+        path = export_partition(cur, name, archive_dir)
+        conn.rollback()
+        if not keep_detached:
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            cur.execute("DELETE FROM order_tracking_archive_queue WHERE partition_name = %s", (name,))
+            conn.commit()
+    return path
+
+
+def maintain(
+    ahead: int = ORDER_TRACKING_PARTITIONS_AHEAD,
+    retention_months: int = ORDER_TRACKING_RETENTION_MONTHS,
+    archive_dir: str = ORDER_TRACKING_ARCHIVE_DIR,
+    keep_detached: bool = False,
+    dry_run: bool = False,
+    archive: bool = True,
+) -> Optional[dict]:
+    """
+    Create future partitions and, unless archive is False, archive expired ones.
+    Returns a summary dict, or None if the database was unavailable.
+    """
+    conn = get_connection()
+    if not conn:
+        logging.error("Failed to get database connection in partition maintenance")
+        return None
+
+    this_month = month_start(datetime.now().date())
+    cutoff = add_months(this_month, -retention_months)
+    summary = {"created": [], "archived": [], "kept": [], "dry_run": dry_run}
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return {"skipped": True}
+            try:
+                if not is_partitioned(cur):
+                    return {"skipped": True, "reason": f"{PARENT} is not partitioned (migration v0003)"}
+                summary["created"] = ensure_partitions(cur, this_month, add_months(this_month, ahead))
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                if not archive:
+                    return summary
+                if not has_archive_queue(cur):
+                    summary["skipped"] = True
+                    summary["reason"] = "order_tracking_archive_queue is missing (migration v0005)"
+                    return summary
+
+                expired = [name for name in attached_partitions(cur) if partition_month(name) < cutoff]
+                for name in expired:
+                    if _still_in_use(cur, partition_month(name)):
+                        summary["kept"].append(name)
+                        continue
+                    if not dry_run:
+                        archive_partition(conn, name, archive_dir, keep_detached)
+                    summary["archived"].append(name)
+                if not dry_run:
+                    # Finish archives this job detached but was interrupted before dropping
+                    detached = set(detached_partitions(cur))
+                    for name in queued_partitions(cur):
+                        if name in detached:
+                            archive_partition(conn, name, archive_dir)
+                            summary["archived"].append(name)
+                        else:  # dropped by hand meanwhile
+                            cur.execute("DELETE FROM order_tracking_archive_queue WHERE partition_name = %s", (name,))
+                            conn.commit()
+            finally:
+                conn.rollback()  # the session-level lock outlives the transaction
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_KEY,))
+                conn.commit()
+        if summary["kept"]:
+            logging.warning(f"Expired partitions still in use, not archived: {summary['kept']}")
+        logging.info(f"Partition maintenance: {summary}")
+        return summary
+    except (psycopg2.Error, OSError) as e:
+        logging.error(f"Partition maintenance error: {e}")
+        conn.rollback()
+        return None
+    finally:
+        return_connection(conn)
+
+
+def status() -> List[tuple]:
+    """(partition, rows estimate, attached) for every monthly partition table."""
+    conn = get_connection()
+    if not conn:
+        logging.error("Failed to get database connection in partition status")
+        return []
+    try:
+        with conn.cursor() as cur:
+            attached = set(attached_partitions(cur))
+            names = sorted(attached | set(detached_partitions(cur)))
+            cur.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)", (names,))
+            estimates = dict(cur.fetchall())
+        conn.rollback()
+        return [(name, max(estimates.get(name, 0), 0), name in attached) for name in names]
+    except psycopg2.Error as e:
+        logging.error(f"Partition status error: {e}")
+        conn.rollback()
+        return []
+    finally:
+        return_connection(conn)
+
+
+def run_forever(interval: float, archive: bool = True, stop: Optional[threading.Event] = None) -> None:
+    """Run maintenance every `interval` seconds until `stop` is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        maintain(archive=archive)
+        stop.wait(interval)
+
+
+def start_background_maintenance(
+    create_interval: float = PARTITION_CREATE_INTERVAL_SECONDS,
+    archive_interval: float = PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+) -> List[threading.Thread]:
+    """
+    Start daemon threads creating months ahead and, if an archive interval is
+    configured, archiving expired ones. Either skips a round while the other
+    (or another process) holds the maintenance lock.
+    """
+    threads = []
+    for interval, archive, name in (
+        (create_interval, False, "partition-create-ahead"),
+        (archive_interval, True, "partition-maintenance"),
+    ):
+        if interval > 0:
+            thread = threading.Thread(target=run_forever, args=(interval, archive), name=name, daemon=True)
+            thread.start()
+            threads.append(thread)
+    return threads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "maintain"])
+    parser.add_argument("--ahead", type=int, default=ORDER_TRACKING_PARTITIONS_AHEAD, help="months to create ahead")
+    parser.add_argument("--retention", type=int, default=ORDER_TRACKING_RETENTION_MONTHS, help="months to keep attached")
+    parser.add_argument("--archive-dir", default=ORDER_TRACKING_ARCHIVE_DIR)
+    parser.add_argument("--keep-detached", action="store_true", help="leave archived partitions as detached tables")
+    parser.add_argument("--dry-run", action="store_true", help="report without creating or archiving")
+    parser.add_argument("--create-only", action="store_true", help="create months ahead without archiving")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    if args.command == "status":
+        for name, rows, attached in status():
+            print(f"{name:28} {rows:>12,} {'attached' if attached else 'detached'}")
+    else:
+        print(
+            maintain(
+                args.ahead, args.retention, args.archive_dir, args.keep_detached, args.dry_run,
+                archive=not args.create_only,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Password hashing on a bounded process pool.
+
+bcrypt is deliberately slow, so running it on request threads stalls every
+other route during a login storm. Hashes and checks are submitted to a
+small pool of worker processes instead; callers block only their own
+request. This module must stay light to import since every worker process
+imports it.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Union
+
+import bcrypt
+
+from config import BCRYPT_ROUNDS, PASSWORD_MAX_PENDING, PASSWORD_TIMEOUT, PASSWORD_WORKERS
+from metrics import PASSWORD_SECONDS
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many password operations are already queued."""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    """Start the pool lazily, once per (possibly forked) web worker."""
+    global _executor, _executor_pid
+    if PASSWORD_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # forkserver children do not inherit the web worker's threads or sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next call starts a fresh one; other threads may have done it already."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(func, *args):
+    executor = _get_executor()
+    if executor is None:
+        return func(*args)
+    if not _pending.acquire(timeout=PASSWORD_TIMEOUT):
+        raise PasswordPoolBusy("Too many password operations in flight")
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    # The slot is held until the job is done or cancelled, not just until this caller
+    # stops waiting, so PASSWORD_MAX_PENDING bounds the bcrypt work actually queued
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        return future.result(timeout=PASSWORD_TIMEOUT)
+    except TimeoutError:
+        future.cancel()  # drops it if still queued; a running hash finishes and then frees its slot
+        raise
+    except BrokenProcessPool as e:
+        # A worker died (OOM kill, segfault); every pending and later submit would fail the same way
+        logging.error(f"Password worker pool broke, restarting it: {e}")
+        _discard_executor(executor)
+        raise PasswordPoolBusy("Password workers restarting") from e
+
+
+def _to_bytes(hashed_password: Union[bytes, memoryview, str]) -> bytes:
+    if isinstance(hashed_password, memoryview):
+        return hashed_password.tobytes()
+    if isinstance(hashed_password, str):
+        return hashed_password.encode("utf-8")
+    return hashed_password
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> bytes:
+    """Hash a password using bcrypt"""
+    with PASSWORD_SECONDS.time("hash"):
+        return _run(_hash, password.encode("utf-8"), rounds)
+
+
+def check_password(hashed_password: Union[bytes, memoryview, str], user_password: str) -> bool:
+    """Check if a password matches the hashed password"""
+    with PASSWORD_SECONDS.time("check"):
+        return _run(_check, user_password.encode("utf-8"), _to_bytes(hashed_password))
+
+
+def needs_rehash(hashed_password: Union[bytes, memoryview, str], rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True if the hash was made with a different cost than the configured one."""
+    try:
+        # bcrypt hashes look like $2b$12$<salt+hash>
+        return int(_to_bytes(hashed_password).split(b"$")[2]) != rounds
+    except (IndexError, ValueError):
+        logging.error("Unrecognised password hash format.")
+        return False
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,166 @@
+"""
+Server-side prepared statements for the hot queries in models.
+
+A PreparedStatement wraps one of the SQL constants. The first time a pooled
+connection runs it, the statement is sent as PREPARE <name> AS ... (with the
+%s / %(name)s placeholders rewritten to $1, $2, ...); after that only
+EXECUTE <name>(...) goes over the wire, so Postgres parses and plans it once
+per connection instead of once per call. After five executions Postgres may
+also switch to a cached generic plan when it is no costlier than custom ones.
+
+Which statements a connection has prepared is tracked in a WeakKeyDictionary
+keyed by the connection object, so a connection the pool discards or
+recycles takes its entries with it and its replacement prepares afresh.
+Prepared statements outlive transaction rollbacks; they belong to the
+session. Set DB_PREPARED_STATEMENTS=false behind a transaction-pooling proxy
+(e.g. PgBouncer in transaction mode), where a session is not pinned to one
+server connection; the plain SQL is then sent as before.
+
+Counts of PREPAREs and EXECUTEs per statement are exported at /metrics and
+returned by stats() (/prepared_stats).
+"""
+import re
+import threading
+import weakref
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from config import DB_PREPARED_STATEMENTS
+from metrics import Counter
+
+PREPARED_EXECUTIONS = Counter(
+    "db_prepared_statement_total", "Prepared statement use by statement and step", ("statement", "step")
+)
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+_prepared = weakref.WeakKeyDictionary()  # connection -> names prepared on its session
+_prepared_lock = threading.Lock()
+_registry = {}  # name -> PreparedStatement
+
+
+def to_positional(sql: str) -> Tuple[str, Optional[List[str]], int]:
+    """
+    Rewrite psycopg placeholders to $n. Returns the new SQL, the parameter
+    names in $n order for %(name)s style (None for %s style), and the count.
+    """
+    names = []
+    positional = 0
+
+    def replace(match):
+        nonlocal positional
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            positional += 1
+            return f"${positional}"
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    rewritten = _PLACEHOLDER.sub(replace, sql)
+    if names and positional:
+        raise ValueError("cannot mix %s and %(name)s placeholders in one statement")
+    return rewritten, (names or None), len(names) or positional
+
+
+class PreparedStatement:
+    def __init__(self, name: str, sql: str):
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+            raise ValueError(f"invalid prepared statement name {name!r}")
+        if name in _registry:
+            raise ValueError(f"prepared statement {name!r} is already registered")
+        self.name = name
+        self.sql = sql
+        body, self.param_names, count = to_positional(sql)
+        self.prepare_sql = f"PREPARE {name} AS {body}"
+        self.execute_sql = f"EXECUTE {name}({', '.join(['%s'] * count)})" if count else f"EXECUTE {name}"
+        _registry[name] = self
+
+    def __repr__(self) -> str:
+        return f"PreparedStatement({self.name!r})"
+
+    def _args(self, params) -> Sequence:
+        if self.param_names is None:
+            return tuple(params or ())
+        return tuple(params[name] for name in self.param_names)
+
+    def execute(self, cur, params=None) -> None:
+        """Run on `cur`, preparing it first if this connection has not yet."""
+        execute_chain(cur, [(self, params)])
+
+
+def execute_chain(cur, calls: Iterable[Tuple[PreparedStatement, object]]) -> None:
+    """
+    Run several statements in one round trip (results are those of the last),
+    preparing any the connection has not seen in the same message.
+    """
+    calls = list(calls)
+    if not DB_PREPARED_STATEMENTS:
+        cur.execute(";".join(stmt.sql for stmt, _ in calls), _merge(calls))
+        return
+
+    conn = cur.connection  # used by one thread at a time, like any pooled connection
+    with _prepared_lock:
+        known = _prepared.get(conn, set())
+    if known is None:
+        known = _session_statements(cur)
+    with _prepared_lock:
+        _prepared[conn] = known
+    missing = [stmt for stmt in dict.fromkeys(stmt for stmt, _ in calls) if stmt.name not in known]
+    args = [value for stmt, params in calls for value in stmt._args(params)]
+    # PREPARE carries no client-side placeholders; escape its % when the message is formatted
+    sql = [stmt.prepare_sql.replace("%", "%%") if args else stmt.prepare_sql for stmt in missing]
+    sql.extend(stmt.execute_sql for stmt, _ in calls)
+    try:
+        cur.execute(";".join(sql), args or None)
+    except Exception:
+        if missing:
+            # Which of the PREPAREs ran is unknown; ask the server on next use
+            with _prepared_lock:
+                _prepared[conn] = None
+        raise
+    known.update(stmt.name for stmt in missing)
+    for stmt in missing:
+        PREPARED_EXECUTIONS.inc(stmt.name, "prepare")
+    for stmt, _ in calls:
+        PREPARED_EXECUTIONS.inc(stmt.name, "execute")
+
+
+def _session_statements(cur) -> set:
+    """Ask the server what a connection has prepared, when a failed round trip left it unknown."""
+    cur.execute("SELECT name FROM pg_prepared_statements")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _merge(calls) -> object:
+    """Parameters for the plain-SQL fallback: one dict, or all positional values in order."""
+    if any(stmt.param_names is not None for stmt, _ in calls):
+        merged = {}
+        for _, params in calls:
+            merged.update(params)
+        return merged
+    return [value for _, params in calls for value in (params or ())]
+
+
+def forget(conn) -> None:
+    """Drop what is known about a connection, e.g. after DISCARD ALL or DEALLOCATE ALL on it."""
+    with _prepared_lock:
+        _prepared.pop(conn, None)
+
+
+def stats() -> dict:
+    """Registered statements, this process's PREPARE/EXECUTE counts and connections tracked."""
+    counts = {}
+    for (name, step), values in PREPARED_EXECUTIONS.snapshot():
+        counts.setdefault(name, {})[step] = values[0]
+    with _prepared_lock:
+        connections = len(_prepared)
+    return {
+        "enabled": DB_PREPARED_STATEMENTS,
+        "connections": connections,
+        "statements": {
+            name: {"prepare": counts.get(name, {}).get("prepare", 0), "execute": counts.get(name, {}).get("execute", 0)}
+            for name in sorted(_registry)
+        },
+    }
@@ -0,0 +1,178 @@
+"""
+Opt-in slow-query capture for pooled connections.
+
+With SLOW_QUERY_MS > 0 the pool opens ProfiledConnection objects, whose
+cursors time every execute(). A statement over the threshold is logged with
+its normalized SQL, redacted parameters, duration and the calling function.
+A SLOW_QUERY_EXPLAIN_SAMPLE fraction of them is also explained inside a
+savepoint that is rolled back; the plans are kept in a per-process ring
+buffer shown at /admin/slow_queries. Only plain reads are re-run under
+EXPLAIN (ANALYZE, BUFFERS). Anything that writes or locks rows (INSERT,
+UPDATE, DELETE, SELECT ... FOR UPDATE, nextval(), pg_notify()) gets a plain
+EXPLAIN instead: a rollback would not undo the row locks it waits on,
+sequence increments or the doubled work.
+
+Only single statements in a transaction are explained: multi-statement
+strings cannot be wrapped in EXPLAIN, and autocommit connections have no
+savepoints.
+"""
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List
+
+import psycopg2
+from psycopg2 import extensions
+
+from config import SLOW_QUERY_BUFFER_SIZE, SLOW_QUERY_EXPLAIN_SAMPLE, SLOW_QUERY_MS
+from metrics import Counter
+
+logger = logging.getLogger("slow_queries")
+logger.setLevel(logging.WARNING)
+
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("function",))
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_READ = re.compile(r"^\(*\s*(?:select|with|values|table)\b", re.I)
+_WRITE = re.compile(
+    r"\b(?:insert|update|delete|merge|truncate|copy|nextval|setval|pg_notify|for\s+(?:key\s+)?share)\b", re.I
+)
+
+_samples = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_samples_lock = threading.Lock()
+
+
+def normalize_sql(query, cur) -> str:
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif hasattr(query, "as_string"):
+        query = query.as_string(cur)  # psycopg2.sql.Composed and friends
+    return _WHITESPACE.sub(" ", _COMMENTS.sub(" ", query)).strip()
+
+
+def redact(params):
+    """Parameter shapes without values: types, and lengths for sequences."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact_value(value) for key, value in params.items()}
+    return [redact_value(value) for value in params]
+
+
+def redact_value(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def _caller() -> str:
+    """Nearest frame outside this module and psycopg2, as module.function."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module != __name__ and not module.startswith("psycopg2"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _explainable(cur, sql: str) -> bool:
+    conn = cur.connection
+    if conn.autocommit or conn.info.transaction_status != extensions.TRANSACTION_STATUS_INTRANS:
+        return False
+    return ";" not in sql.rstrip(";")
+
+
+def _read_only(sql: str) -> bool:
+    """True for a query that only reads, so re-running it under ANALYZE is harmless."""
+    return bool(_READ.match(sql)) and not _WRITE.search(sql)
+
+
+def _explain(cur, query, params, analyze: bool) -> str:
+    """EXPLAIN (ANALYZE if asked) the statement inside a savepoint that is always rolled back."""
+    plain = extensions.cursor(cur.connection)
+    try:
+        plain.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain = b"EXPLAIN (ANALYZE, BUFFERS) " if analyze else b"EXPLAIN "
+            plain.execute(explain + plain.mogrify(query, params))
+            return "\n".join(row[0] for row in plain.fetchall())
+        finally:
+            plain.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            plain.execute("RELEASE SAVEPOINT slow_query_explain")
+    except psycopg2.Error as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        plain.close()
+
+
+def _record(cur, query, params, seconds: float) -> None:
+    function = _caller()
+    sql = normalize_sql(query, cur)
+    redacted = redact(params)
+    SLOW_QUERIES.inc(function)
+    logger.warning(f"Slow query {seconds * 1000:.1f} ms in {function}: {sql} params={redacted}")
+
+    if random.random() >= SLOW_QUERY_EXPLAIN_SAMPLE or not _explainable(cur, sql):
+        return
+    plan = _explain(cur, query, params, analyze=_read_only(sql))
+    with _samples_lock:
+        _samples.append({
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "function": function,
+            "duration_ms": round(seconds * 1000, 2),
+            "sql": sql,
+            "params": redacted,
+            "plan": plan,
+        })
+
+
+class _ProfilingMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        result = super().execute(query, vars)
+        seconds = time.perf_counter() - started
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            _record(self, query, vars, seconds)
+        return result
+
+
+_profiled_classes = {}
+
+
+def _profiled(cursor_class):
+    cls = _profiled_classes.get(cursor_class)
+    if cls is None:
+        cls = type(f"Profiled{cursor_class.__name__}", (_ProfilingMixin, cursor_class), {})
+        _profiled_classes[cursor_class] = cls
+    return cls
+
+
+class ProfiledConnection(extensions.connection):
+    """Connection whose cursors, of whatever cursor_factory, time their statements."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory or extensions.cursor
+        return super().cursor(*args, cursor_factory=_profiled(factory), **kwargs)
+
+
+def connect_kwargs(dsn_kwargs: dict) -> dict:
+    """Connection arguments for the pool: profiled when SLOW_QUERY_MS is set."""
+    if SLOW_QUERY_MS <= 0:
+        return dsn_kwargs
+    return {**dsn_kwargs, "connection_factory": ProfiledConnection}
+
+
+def recent_samples() -> List[dict]:
+    """Sampled slow statements with plans, newest first (this process only)."""
+    with _samples_lock:
+        return list(reversed(_samples))
+
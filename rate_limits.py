@@ -0,0 +1,198 @@
+"""
+Rate limits for the hot driver endpoints, shared by every worker on the host.
+
+Flask-Limiter counts hits in a storage backend; its in-memory backend is per
+process, so N workers would allow N times the limit. MmapStorage (storage
+URI mmap:///path/to/file) keeps fixed-window counters in a file-backed
+shared memory map instead: a hash table of 8-slot buckets, each bucket
+guarded by a thread lock plus a POSIX record lock on its stripe of the file.
+A hit costs a hash, two uncontended lock calls and a few struct reads, a
+few microseconds, with no external service.
+
+The table has RATE_LIMIT_SLOTS slots. A key that finds its bucket full of
+live counters takes over the one expiring soonest, so under extreme key
+churn a client can occasionally get a fresh window early; it is never
+limited by somebody else's count.
+
+Routes opt in with @limit_per_driver_and_ip(...), which applies one limit
+keyed by the logged-in driver (falling back to the client address) and one
+keyed by the client address alone. The limit strings come from config.py; an
+empty string disables that limit.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from flask_login import current_user
+from limits.storage import Storage
+
+from config import RATE_LIMIT_SLOTS, RATE_LIMIT_STORAGE_URI
+
+SLOT = struct.Struct("<Qdq")  # key hash (0 = empty), window end (epoch seconds), count
+BUCKET_SLOTS = 8
+LOCK_STRIPES = 256
+
+
+class MmapStorage(Storage):
+    """Fixed-window counters in a shared memory-mapped file (see module docstring)."""
+
+    STORAGE_SCHEME = ["mmap"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        self.path = urlparse(uri).path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        wanted = RATE_LIMIT_SLOTS * SLOT.size
+        if os.fstat(self._fd).st_size < wanted:
+            os.ftruncate(self._fd, wanted)
+        # Workers started with another RATE_LIMIT_SLOTS still agree on the table size
+        size = os.fstat(self._fd).st_size
+        self._buckets = size // (SLOT.size * BUCKET_SLOTS)
+        self._map = mmap.mmap(self._fd, self._buckets * BUCKET_SLOTS * SLOT.size)
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        os.register_at_fork(after_in_child=self._reset_locks)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def _reset_locks(self) -> None:
+        # Another thread may have held a lock at fork time
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _locate(self, key: str):
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        bucket = digest % self._buckets
+        return digest or 1, bucket * BUCKET_SLOTS * SLOT.size, bucket % LOCK_STRIPES
+
+    def _locked(self, stripe: int):
+        return _BucketLock(self._locks[stripe], self._fd, stripe)
+
+    def _find(self, digest: int, offset: int, now: float):
+        """(offset, window end, count) of the key's live slot, or None."""
+        for slot in range(offset, offset + BUCKET_SLOTS * SLOT.size, SLOT.size):
+            key_hash, expires, count = SLOT.unpack_from(self._map, slot)
+            if key_hash == digest and expires > now:
+                return slot, expires, count
+        return None
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        digest, offset, stripe = self._locate(key)
+        now = time.time()
+        with self._locked(stripe):
+            found = self._find(digest, offset, now)
+            if found:
+                slot, expires, count = found
+                SLOT.pack_into(self._map, slot, digest, expires, count + amount)
+                return count + amount
+            # Start a window in a free or expired slot, else in the one expiring soonest
+            victim, soonest = offset, None
+            for slot in range(offset, offset + BUCKET_SLOTS * SLOT.size, SLOT.size):
+                key_hash, expires, _ = SLOT.unpack_from(self._map, slot)
+                if key_hash == 0 or expires <= now:
+                    victim = slot
+                    break
+                if soonest is None or expires < soonest:
+                    victim, soonest = slot, expires
+            SLOT.pack_into(self._map, victim, digest, now + expiry, amount)
+            return amount
+
+    def get(self, key: str) -> int:
+        digest, offset, stripe = self._locate(key)
+        with self._locked(stripe):
+            found = self._find(digest, offset, time.time())
+        return found[2] if found else 0
+
+    def get_expiry(self, key: str) -> float:
+        digest, offset, stripe = self._locate(key)
+        now = time.time()
+        with self._locked(stripe):
+            found = self._find(digest, offset, now)
+        return found[1] if found else now
+
+    def clear(self, key: str) -> None:
+        digest, offset, stripe = self._locate(key)
+        with self._locked(stripe):
+            found = self._find(digest, offset, time.time())
+            if found:
+                SLOT.pack_into(self._map, found[0], 0, 0.0, 0)
+
+    def reset(self) -> int:
+        """Clear every counter; returns how many were live."""
+        now = time.time()
+        cleared = 0
+        empty = bytes(BUCKET_SLOTS * SLOT.size)
+        for bucket in range(self._buckets):
+            offset = bucket * BUCKET_SLOTS * SLOT.size
+            with self._locked(bucket % LOCK_STRIPES):
+                cleared += sum(
+                    1 for _, expires, count in SLOT.iter_unpack(self._map[offset:offset + len(empty)])
+                    if expires > now and count
+                )
+                self._map[offset:offset + len(empty)] = empty
+        return cleared
+
+    def check(self) -> bool:
+        return not self._map.closed
+
+
+class _BucketLock:
+    """Thread lock for this process, plus a record lock on one byte per stripe for the others."""
+
+    __slots__ = ("_lock", "_fd", "_stripe")
+
+    def __init__(self, lock: threading.Lock, fd: int, stripe: int):
+        self._lock = lock
+        self._fd = fd
+        self._stripe = stripe
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._stripe)
+        except OSError:
+            self._lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._stripe)
+        finally:
+            self._lock.release()
+
+
+def driver_key() -> str:
+    """Rate limit key for the logged-in driver, or the client address before login."""
+    if current_user.is_authenticated:
+        return f"driver:{current_user.id}"
+    return f"ip:{get_remote_address()}"
+
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy="fixed-window",
+    headers_enabled=True,
+)
+
+
+def limit_per_driver_and_ip(per_driver: str, per_ip: str):
+    """Apply a per-driver and a per-address limit to a view; empty strings are skipped."""
+    def decorator(view):
+        if per_driver:
+            view = limiter.limit(per_driver, key_func=driver_key)(view)
+        if per_ip:
+            view = limiter.limit(per_ip, key_func=get_remote_address)(view)
+        return view
+    return decorator
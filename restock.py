@@ -0,0 +1,72 @@
+"""
+Bulk stock reload for depot staff.
+
+Sets the stock of every driver in a CSV (driver_id,stock, header optional)
+with one batched UPDATE (models.restock_drivers), which also sends a stock
+event per driver so open pages refresh. Levels must be 0..MAX_STOCK; a file
+with any invalid line is rejected as a whole. The same loader backs
+POST /api/v1/restock.
+
+Usage:
+    python restock.py levels.csv [--dry-run]
+"""
+import argparse
+import csv
+from typing import Iterable, List, Tuple
+
+from config import MAX_STOCK
+from models import restock_drivers
+
+
+def validate_levels(pairs: Iterable[Tuple[object, object]]) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """Checked (driver_id, stock) pairs, and an error message per rejected pair."""
+    levels, errors = [], []
+    for number, (driver_id, stock) in enumerate(pairs, start=1):
+        try:
+            stock = int(stock)
+        except (TypeError, ValueError):
+            errors.append(f"#{number}: stock {stock!r} is not a number")
+            continue
+        if not isinstance(driver_id, str) or not driver_id:
+            errors.append(f"#{number}: missing driver_id")
+        elif not 0 <= stock <= MAX_STOCK:
+            errors.append(f"#{number}: stock for {driver_id} must be between 0 and {MAX_STOCK}")
+        else:
+            levels.append((driver_id, stock))
+    return levels, errors
+
+
+def read_levels(path: str) -> List[Tuple[str, str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.reader(f) if row]
+    if rows and rows[0][:2] == ["driver_id", "stock"]:
+        rows = rows[1:]
+    return [(row[0].strip(), row[1].strip() if len(row) > 1 else None) for row in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV of driver_id,stock")
+    parser.add_argument("--dry-run", action="store_true", help="validate the file without updating")
+    args = parser.parse_args()
+
+    levels, errors = validate_levels(read_levels(args.path))
+    if errors:
+        for error in errors:
+            print(error)
+        raise SystemExit(f"{len(errors)} invalid line(s); nothing updated")
+    if args.dry_run:
+        print(f"{len(levels)} driver(s) would be restocked")
+        return
+
+    updated = restock_drivers(levels)
+    if updated is None:
+        raise SystemExit("Restock failed; see app.log")
+    unknown = sorted({driver_id for driver_id, _ in levels} - set(updated))
+    print(f"Restocked {len(updated)} driver(s)")
+    if unknown:
+        print(f"Unknown driver ids: {', '.join(unknown)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Daily delivery statistics per driver and per city (see migrations/v0004).
+
+complete_delivery and resign_delivery call record_completed/record_resigned
+on their own cursor, so a rollup row changes in the same transaction as the
+order_tracking row it counts. Reports read the rollups instead of scanning
+order_tracking.
+
+backfill() rebuilds closed days (before today) from order_tracking, e.g.
+after a bulk load with delivery_requests.py. Today is left to the
+incremental updates, which is what lets the backfill upsert without locking
+out concurrent completions. Resigned rows are deleted from order_tracking
+when the request is accepted again, so past resigns can only be counted from
+the ones still pending; backfill never lowers a resigned count. Those rows
+carry no resign time, so both paths count a resign on the request's order
+day and a completion on its completion day.
+
+Until migration v0004 is applied the record_* calls do nothing (logged once),
+so completing and resigning keep working on an older schema.
+
+Usage:
+    python rollups.py backfill [--since 2025-01-01]
+"""
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+import psycopg2
+
+from config import DB_CONFIG
+
+UPSERT_COLUMNS = """
+    completed = {table}.completed + EXCLUDED.completed,
+    resigned = {table}.resigned + EXCLUDED.resigned,
+    bags = {table}.bags + EXCLUDED.bags,
+    complete_seconds = {table}.complete_seconds + EXCLUDED.complete_seconds
+"""
+
+# Time to complete, measured the same way as completed_at - ordered_at in the backfill
+SECONDS = "COALESCE(EXTRACT(EPOCH FROM LOCALTIMESTAMP - %(ordered_at)s::timestamp)::bigint, 0)"
+# The day a change is counted on: the given one (a resign's order day), else today
+DAY = "COALESCE(%(day)s::date, LOCALTIMESTAMP::date)"
+
+RECORD_QUERY = f"""
+    WITH by_driver AS (
+        INSERT INTO driver_daily_stats (driver_id, day, completed, resigned, bags, complete_seconds)
+        VALUES (%(driver_id)s, {DAY}, %(completed)s, %(resigned)s, %(bags)s, {SECONDS})
+        ON CONFLICT (driver_id, day) DO UPDATE SET {UPSERT_COLUMNS.format(table="driver_daily_stats")}
+    )
+    INSERT INTO city_daily_stats (city, day, completed, resigned, bags, complete_seconds)
+    VALUES (delivery_city(%(address)s), {DAY}, %(completed)s, %(resigned)s, %(bags)s, {SECONDS})
+    ON CONFLICT (city, day) DO UPDATE SET {UPSERT_COLUMNS.format(table="city_daily_stats")}
+"""
+
+
+def completed_args(driver_id: str, address: str, quantity: int, ordered_at: datetime) -> tuple:
+    return RECORD_QUERY, {
+        "driver_id": driver_id, "address": address, "completed": 1, "resigned": 0, "bags": quantity,
+        "ordered_at": ordered_at, "day": None,
+    }
+
+
+def resigned_args(driver_id: str, address: str, ordered_at: datetime) -> tuple:
+    return RECORD_QUERY, {
+        "driver_id": driver_id, "address": address, "completed": 0, "resigned": 1, "bags": 0, "ordered_at": None,
+        "day": ordered_at,
+    }
+
+
+READY_QUERY = "SELECT to_regclass('driver_daily_stats') IS NOT NULL AND to_regclass('city_daily_stats') IS NOT NULL"
+
+_ready = False
+_warned = False
+
+
+def _note_ready(ready: bool) -> bool:
+    global _ready, _warned
+    _ready = ready
+    if not ready and not _warned:
+        logging.warning("Rollup tables are missing (migration v0004); completions and resigns are not counted")
+        _warned = True
+    return ready
+
+
+def rollups_ready(cur) -> bool:
+    """True once migration v0004 has been applied; only checked until it has."""
+    if _ready:
+        return True
+    cur.execute(READY_QUERY)
+    return _note_ready(cur.fetchone()[0])
+
+
+async def rollups_ready_async(cur) -> bool:
+    """rollups_ready on a psycopg 3 async cursor."""
+    if _ready:
+        return True
+    await cur.execute(READY_QUERY)
+    return _note_ready((await cur.fetchone())[0])
+
+
+def record_completed(cur, driver_id: str, address: str, quantity: int, ordered_at: datetime) -> None:
+    """Count a completion in today's rollups; part of the caller's transaction."""
+    if rollups_ready(cur):
+        cur.execute(*completed_args(driver_id, address, quantity, ordered_at))
+
+
+def record_resigned(cur, driver_id: str, address: str, ordered_at: datetime) -> None:
+    """Count a resign on its order day; part of the caller's transaction."""
+    if rollups_ready(cur):
+        cur.execute(*resigned_args(driver_id, address, ordered_at))
+
+
+BACKFILL_QUERIES = [
+    (
+        "driver_daily_stats completed",
+        """
+        INSERT INTO driver_daily_stats (driver_id, day, completed, bags, complete_seconds)
+        SELECT driver_id, completed_at::date, COUNT(*), SUM(quantity),
+               SUM(EXTRACT(EPOCH FROM completed_at - ordered_at))::bigint
+        FROM order_tracking
+        WHERE status = 'completed' AND driver_id IS NOT NULL
+        AND completed_at >= %(since)s AND completed_at < CURRENT_DATE
+        GROUP BY 1, 2
+        ON CONFLICT (driver_id, day) DO UPDATE
+        SET completed = EXCLUDED.completed, bags = EXCLUDED.bags, complete_seconds = EXCLUDED.complete_seconds
+        """,
+    ),
+    (
+        "city_daily_stats completed",
+        """
+        INSERT INTO city_daily_stats (city, day, completed, bags, complete_seconds)
+        SELECT delivery_city(dropoff_address), completed_at::date, COUNT(*), SUM(quantity),
+               SUM(EXTRACT(EPOCH FROM completed_at - ordered_at))::bigint
+        FROM order_tracking
+        WHERE status = 'completed'
+        AND completed_at >= %(since)s AND completed_at < CURRENT_DATE
+        GROUP BY 1, 2
+        ON CONFLICT (city, day) DO UPDATE
+        SET completed = EXCLUDED.completed, bags = EXCLUDED.bags, complete_seconds = EXCLUDED.complete_seconds
+        """,
+    ),
+    # Resign rows carry no resign time; they are counted on their order day, as in resigned_args
+    (
+        "driver_daily_stats resigned",
+        """
+        INSERT INTO driver_daily_stats (driver_id, day, resigned)
+        SELECT driver_id, ordered_at::date, COUNT(*)
+        FROM order_tracking
+        WHERE status = 'pending(*)' AND driver_id IS NOT NULL
+        AND ordered_at >= %(since)s AND ordered_at < CURRENT_DATE
+        GROUP BY 1, 2
+        ON CONFLICT (driver_id, day) DO UPDATE
+        SET resigned = GREATEST(driver_daily_stats.resigned, EXCLUDED.resigned)
+        """,
+    ),
+    (
+        "city_daily_stats resigned",
+        """
+        INSERT INTO city_daily_stats (city, day, resigned)
+        SELECT delivery_city(dropoff_address), ordered_at::date, COUNT(*)
+        FROM order_tracking
+        WHERE status = 'pending(*)'
+        AND ordered_at >= %(since)s AND ordered_at < CURRENT_DATE
+        GROUP BY 1, 2
+        ON CONFLICT (city, day) DO UPDATE
+        SET resigned = GREATEST(city_daily_stats.resigned, EXCLUDED.resigned)
+        """,
+    ),
+]
+
+
+def backfill(conn, since: Optional[date] = None) -> dict:
+    """Recompute rollups for closed days from `since` (default: all history). Returns rows upserted per step."""
+    counts = {}
+    with conn.cursor() as cur:
+        for label, query in BACKFILL_QUERIES:
+            cur.execute(query, {"since": since or date.min})
+            counts[label] = cur.rowcount
+    conn.commit()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        for label, rows in backfill(conn, args.since).items():
+            print(f"{label:30} {rows:>10,} rows")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Versioned JSON API for the driver app, under /api/v1.
+
+List responses are compact: {"columns": [...], "rows": [[...], ...]}.
+Every GET carries a weak ETag derived from the data version the order event
+listener keeps (events.DataVersions) plus the query string, so a poll whose
+If-None-Match still matches is answered 304 before any query runs.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from functools import wraps
+
+from flask import Blueprint, Response, abort, request
+from flask_login import current_user, login_required
+
+from config import (
+    ADMIN_DRIVER_IDS,
+    INTAKE_MAX_ROWS,
+    MAX_STOCK,
+    ORDER_TRACKING_MAX_PAGE_SIZE,
+    ORDER_TRACKING_PAGE_SIZE,
+    RATE_LIMIT_UNASSIGNED_PER_DRIVER,
+    RATE_LIMIT_UNASSIGNED_PER_IP,
+    RESTOCK_MAX_DRIVERS,
+    UNASSIGNED_REQUESTS_LIMIT,
+)
+from events import hub
+from helpers import clamp_page_size, parse_tracking_cursor
+from intake import load_orders, read_csv, read_json, validate_orders
+from models import (
+    OrderTrackingPage,
+    add_stock,
+    restock_drivers,
+    view_my_deliveries,
+    view_my_stock,
+    view_unassigned_requests,
+)
+from rate_limits import limit_per_driver_and_ip
+from restock import validate_levels
+
+API_VERSION = 1
+
+api = Blueprint("api", __name__, url_prefix=f"/api/v{API_VERSION}")
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_response(data, status: int = 200) -> Response:
+    body = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=json_default)
+    return Response(body, status=status, mimetype="application/json")
+
+
+def table(columns, rows) -> dict:
+    return {"columns": list(columns), "rows": [list(row) for row in rows]}
+
+
+def conditional(per_driver: bool):
+    """
+    Answer 304 when If-None-Match matches the current data version.
+    `per_driver` views change with the driver's own events, the others with any event.
+    Only 200 responses get the ETag, so a failed query is never cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not hub.connected:
+                hub.start()
+                return view(*args, **kwargs)  # versions are unreliable without the listener
+
+            version = hub.versions.current(current_user.id if per_driver else None)
+            key = f"{API_VERSION}|{request.path}|{request.query_string.decode()}|{current_user.id}|{version}"
+            etag = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+@api.route("/stock")
+@login_required
+@conditional(per_driver=True)
+def stock():
+    stock = view_my_stock(current_user.id)
+    if stock is None:
+        return json_response({"error": "database unavailable"}, 503)
+    return json_response({"stock": stock})
+
+
+@api.route("/stock", methods=["POST"])
+@login_required
+def add_to_stock():
+    """{"add": n} adds n bags in one conditional statement; 409 if that would pass MAX_STOCK."""
+    amount = (request.get_json(silent=True) or {}).get("add")
+    if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+        return json_response({"error": "add must be a positive integer"}, 400)
+    result = add_stock(current_user.id, amount)
+    if result is None:
+        return json_response({"error": "stock update failed"}, 503)
+    applied, stock = result
+    if not applied:
+        return json_response({"error": f"stock cannot exceed {MAX_STOCK}", "stock": stock}, 409)
+    return json_response({"stock": stock})
+
+
+@api.route("/restock", methods=["POST"])
+@login_required
+def restock():
+    """
+    Depot reload: {"stock": {"<driver_id>": level, ...}} sets every listed
+    driver's stock in one statement. Rejected as a whole if any level is invalid.
+    """
+    if current_user.id not in ADMIN_DRIVER_IDS:
+        abort(403)
+    levels = (request.get_json(silent=True) or {}).get("stock")
+    if not isinstance(levels, dict) or not levels:
+        return json_response({"error": "stock must map driver ids to levels"}, 400)
+    if len(levels) > RESTOCK_MAX_DRIVERS:
+        return json_response({"error": f"at most {RESTOCK_MAX_DRIVERS} drivers per request"}, 413)
+    checked, errors = validate_levels(levels.items())
+    if errors:
+        return json_response({"error": "invalid levels", "details": errors}, 400)
+    updated = restock_drivers(checked)
+    if updated is None:
+        return json_response({"error": "restock failed"}, 503)
+    return json_response({"updated": updated, "unknown": sorted(set(levels) - set(updated))})
+
+
+@api.route("/requests", methods=["POST"])
+@login_required
+def intake_requests():
+    """
+    Bulk intake: a CSV body (text/csv, delivery_requests.csv format) or a JSON
+    list of requests. Valid rows are loaded in one transaction and invalid ones
+    listed with a reason; ?dry_run=1 only validates. 422 if no row is valid.
+    """
+    if current_user.id not in ADMIN_DRIVER_IDS:
+        abort(403)
+    text = request.get_data(as_text=True)
+    try:
+        rows = read_csv(text) if request.mimetype == "text/csv" else read_json(text)
+    except ValueError as e:
+        return json_response({"error": f"unreadable batch: {e}"}, 400)
+    if len(rows) > INTAKE_MAX_ROWS:
+        return json_response({"error": f"at most {INTAKE_MAX_ROWS} requests per batch"}, 413)
+    orders, rejected = validate_orders(rows)
+    if not orders:
+        return json_response({"loaded": 0, "rejected": rejected}, 422)
+    if request.args.get("dry_run") in ("1", "true"):
+        return json_response({"loaded": 0, "valid": len(orders), "rejected": rejected})
+    request_ids = load_orders(orders)
+    if request_ids is None:
+        return json_response({"error": "intake failed; nothing was loaded"}, 503)
+    return json_response({"loaded": len(request_ids), "request_ids": request_ids, "rejected": rejected}, 201)
+
+
+@api.route("/unassigned_requests")
+@limit_per_driver_and_ip(RATE_LIMIT_UNASSIGNED_PER_DRIVER, RATE_LIMIT_UNASSIGNED_PER_IP)
+@login_required
+@conditional(per_driver=False)
+def unassigned_requests():
+    limit = clamp_page_size(request.args.get("limit"), UNASSIGNED_REQUESTS_LIMIT, UNASSIGNED_REQUESTS_LIMIT)
+    rows = view_unassigned_requests(current_user.id, limit)
+    if rows is None:
+        return json_response({"error": "database unavailable"}, 503)
+    columns = ("request_id", "driver_id", "dropoff_address", "quantity", "ordered_at", "status")
+    return json_response(table(columns, rows))
+
+
+@api.route("/my_deliveries")
+@login_required
+@conditional(per_driver=True)
+def my_deliveries():
+    rows = view_my_deliveries(current_user.id)
+    if rows is None:
+        return json_response({"error": "database unavailable"}, 503)
+    return json_response(table(("request_id", "dropoff_address", "quantity", "ordered_at"), rows))
+
+
+@api.route("/order_tracking")
+@login_required
+@conditional(per_driver=False)
+def order_tracking():
+    page = OrderTrackingPage(
+        page_size=clamp_page_size(
+            request.args.get("per_page"), ORDER_TRACKING_PAGE_SIZE, ORDER_TRACKING_MAX_PAGE_SIZE
+        ),
+        before=parse_tracking_cursor(
+            request.args.get("before"),
+            request.args.get("before_id"),
+            request.args.get("before_source"),
+            request.args.get("before_row"),
+        ),
+        status=request.args.get("status"),
+        driver_id=request.args.get("driver_id"),
+    )
+    columns = ("request_id", "driver_id", "dropoff_address", "quantity", "ordered_at", "completed_at", "status")
+    data = table(columns, ([row[column] for column in columns] for row in page))
+    if page.error:
+        return json_response({"error": "database unavailable"}, 503)
+    data["next"] = (
+        {
+            "before": page.next_cursor[0].isoformat(),
+            "before_id": page.next_cursor[1],
+            "before_source": page.next_cursor[2],
+            "before_row": page.next_cursor[3],
+        }
+        if page.next_cursor
+        else None
+    )
+    return json_response(data)
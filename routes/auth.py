@@ -1,6 +1,6 @@
 from flask import Blueprint, request, session, redirect, url_for, flash, render_template
-from flask_login import LoginManager, login_user, logout_user, login_required
-from models import login_driver
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from models import login_driver, user_cache
 
 auth = Blueprint("auth", __name__)
 
@@ -29,6 +29,7 @@ def login():
 @auth.route("/logout")
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()  # Log out the user
     session.clear()  # Clear the session
     flash("You have been logged out.", "info")
@@ -1,5 +1,5 @@
 # routes/delivery.py
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, render_template, redirect, url_for, flash, request, stream_template, Response, jsonify
 from flask_login import login_required, current_user
 from models import (
     view_unassigned_requests,
@@ -7,32 +7,135 @@ from models import (
     accept_delivery,
     resign_delivery,
     complete_delivery,
-    get_connection,
-    return_connection,
+    OrderTrackingPage,
+    ORDER_TRACKING_STATUSES,
+)
+from events import hub, sse_stream
+from geo import pending_index
+from routing import distance_matrix, plan_route
+from rate_limits import limit_per_driver_and_ip
+from helpers import parse_tracking_cursor, clamp_page_size, format_error_response, format_success_response
+from config import (
+    ORDER_TRACKING_PAGE_SIZE,
+    ORDER_TRACKING_MAX_PAGE_SIZE,
+    NEAREST_REQUESTS_DEFAULT,
+    NEAREST_REQUESTS_MAX,
+    RATE_LIMIT_ACCEPT_PER_DRIVER,
+    RATE_LIMIT_ACCEPT_PER_IP,
+    RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER,
+    RATE_LIMIT_DELIVERY_UPDATE_PER_IP,
+    RATE_LIMIT_UNASSIGNED_PER_DRIVER,
+    RATE_LIMIT_UNASSIGNED_PER_IP,
 )
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import DictCursor
-import logging
 
 delivery = Blueprint("delivery", __name__)
 
 
+def parse_point(lat, lon, near):
+    """(lat, lon) from query values, or from geocoding a `near` address; None if neither works."""
+    if lat and lon:
+        try:
+            return float(lat), float(lon)
+        except ValueError:
+            return None
+    if near:
+        return pending_index().geocoder.geocode(near)
+    return None
+
+
 @delivery.route("/unassigned_requests")
+@limit_per_driver_and_ip(RATE_LIMIT_UNASSIGNED_PER_DRIVER, RATE_LIMIT_UNASSIGNED_PER_IP)
 @login_required
 def view_unassigned_requests_route():
-    requests = view_unassigned_requests(current_user.id)  # Pass current_user.id
-    return render_template("unassigned_requests.html", requests=requests)
+    point = parse_point(request.args.get("lat"), request.args.get("lon"), request.args.get("near"))
+    if point is None:
+        requests = view_unassigned_requests(current_user.id)  # Pass current_user.id
+        if requests is None:
+            flash("Could not load requests; please try again.", "error")
+        return render_template("unassigned_requests.html", requests=requests or [], distances=None)
+
+    k = clamp_page_size(request.args.get("k"), NEAREST_REQUESTS_DEFAULT, NEAREST_REQUESTS_MAX)
+    requests, distances = nearest_unassigned(current_user.id, point, k)
+    if requests is None:
+        flash("Could not load requests; please try again.", "error")
+    return render_template("unassigned_requests.html", requests=requests or [], distances=distances)
+
+
+def nearest_unassigned(driver_id: str, point, k: int):
+    """
+    Up to k requests this driver may take, nearest to point first, and the
+    distance of every request considered; (None, distances) on a database error.
+    Some of the index's nearest may be hidden for this driver or already taken,
+    so rings further out are fetched until k pass or the index runs out.
+    """
+    distances, found = {}, []
+    batch = 2 * k
+    while len(found) < k:
+        nearest = pending_index().nearest(point[0], point[1], batch, exclude=set(distances))
+        if not nearest:
+            break
+        distances.update(nearest)
+        # limit covers the whole batch, so the query's ordered_at LIMIT cannot cut near ones
+        rows = view_unassigned_requests(driver_id, limit=len(nearest), request_ids=[rid for rid, _ in nearest])
+        if rows is None:
+            return None, distances
+        found += rows
+        if len(nearest) < batch:
+            break
+        batch *= 2
+    found.sort(key=lambda req: distances[req["request_id"]])
+    return found[:k], distances
+
+
+@delivery.route("/nearest_requests")
+@limit_per_driver_and_ip(RATE_LIMIT_UNASSIGNED_PER_DRIVER, RATE_LIMIT_UNASSIGNED_PER_IP)
+@login_required
+def nearest_requests():
+    """JSON list of the k pending requests nearest to ?lat=&lon= (or ?near=<address>)"""
+    point = parse_point(request.args.get("lat"), request.args.get("lon"), request.args.get("near"))
+    if point is None:
+        return jsonify(format_error_response("Give lat and lon, or a known address in near.")), 400
+    k = clamp_page_size(request.args.get("k"), NEAREST_REQUESTS_DEFAULT, NEAREST_REQUESTS_MAX)
+    nearest = pending_index().nearest(point[0], point[1], k)
+    return jsonify(
+        format_success_response([{"request_id": rid, "distance_m": round(dist)} for rid, dist in nearest])
+    )
+
+
+def planned_deliveries(driver_id: str):
+    """The driver's active deliveries in visiting order, each paired with its leg distance in meters."""
+    deliveries = view_my_deliveries(driver_id)
+    if deliveries is None:
+        flash("Could not load your deliveries; please try again.", "error")
+        return []
+    if not deliveries:
+        return []
+    start = parse_point(request.args.get("lat"), request.args.get("lon"), request.args.get("near"))
+    order, legs = plan_route(distance_matrix(), [row[1] for row in deliveries], start)
+    return [(deliveries[i], leg) for i, leg in zip(order, legs)]
 
 
 @delivery.route("/my_deliveries")
 @login_required
 def view_my_deliveries_route():
-    my_deliveries = view_my_deliveries(current_user.id)
-    return render_template("my_deliveries.html", my_deliveries=my_deliveries)
+    stops = planned_deliveries(current_user.id)
+    return render_template("my_deliveries.html", my_deliveries=[row for row, _ in stops], legs=[leg for _, leg in stops])
+
+
+@delivery.route("/my_route")
+@login_required
+def my_route():
+    """JSON visiting order for the driver's active deliveries, optionally from ?lat=&lon= or ?near="""
+    stops = [
+        {"request_id": row[0], "dropoff_address": row[1], "quantity": row[2], "distance_m": round(leg) if leg is not None else None}
+        for row, leg in planned_deliveries(current_user.id)
+    ]
+    return jsonify(format_success_response(stops))
 
 
 @delivery.route("/accept_delivery/<int:request_id>")
+@limit_per_driver_and_ip(RATE_LIMIT_ACCEPT_PER_DRIVER, RATE_LIMIT_ACCEPT_PER_IP)
 @login_required
 def accept_delivery_route(request_id):
     if accept_delivery(current_user.id, request_id):
@@ -43,6 +146,7 @@ def accept_delivery_route(request_id):
 
 
 @delivery.route("/resign_delivery/<int:request_id>")
+@limit_per_driver_and_ip(RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER, RATE_LIMIT_DELIVERY_UPDATE_PER_IP)
 @login_required
 def resign_delivery_route(request_id):
     if resign_delivery(current_user.id, request_id):
@@ -53,6 +157,7 @@ def resign_delivery_route(request_id):
 
 
 @delivery.route("/complete_delivery/<int:request_id>")
+@limit_per_driver_and_ip(RATE_LIMIT_DELIVERY_UPDATE_PER_DRIVER, RATE_LIMIT_DELIVERY_UPDATE_PER_IP)
 @login_required
 def complete_delivery_route(request_id):
     if complete_delivery(current_user.id, request_id):
@@ -65,56 +170,35 @@ def complete_delivery_route(request_id):
 @delivery.route("/order_tracking")
 @login_required
 def order_tracking():
-    """View all orders with their current status"""
-    conn = get_connection()
-    if not conn:
-        flash("Failed to connect to the database. Please try again later.", "error")
-        return redirect(url_for("stock.dashboard"))
-
-    try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:  # Use DictCursor
-            # Fetch unassigned requests (pending)
-            cur.execute(
-                """
-                SELECT request_id, NULL AS driver_id, dropoff_address, quantity, ordered_at, NULL AS completed_at, 'pending' AS status
-                FROM delivery_requests
-                WHERE status = 'pending'
-                """
-            )
-            unassigned_requests = cur.fetchall()
-            logging.info(f"Fetched unassigned requests: {unassigned_requests}")
-
-            # Fetch active deliveries (in-progress)
-            cur.execute(
-                """
-                SELECT request_id, assigned_driver_id AS driver_id, dropoff_address, quantity, ordered_at, NULL AS completed_at, 'in-progress' AS status
-                FROM delivery_requests
-                WHERE status = 'in-progress'
-                """
-            )
-            active_deliveries = cur.fetchall()
-            logging.info(f"Fetched active deliveries: {active_deliveries}")
-
-            # Fetch completed deliveries from order_tracking
-            cur.execute(
-                """
-                SELECT request_id, driver_id, dropoff_address, quantity, ordered_at, completed_at, status
-                FROM order_tracking
-                """
-            )
-            completed_deliveries = cur.fetchall()
-            logging.info(f"Fetched completed deliveries: {completed_deliveries}")
-
-            # Combine all results
-            all_orders = unassigned_requests + active_deliveries + completed_deliveries
-            logging.info(f"All orders: {all_orders}")
-
-            # Pass the current time to the template for elapsed time calculation
-            now = datetime.now()
-            return render_template("order_tracking.html", orders=all_orders, now=now)
-    except psycopg2.Error as e:
-        logging.error(f"Error fetching order tracking data: {e}")
-        flash("An error occurred while fetching order data. Please try again later.", "error")
-        return redirect(url_for("stock.dashboard"))
-    finally:
-        return_connection(conn)
+    """View orders with their current status, one keyset page at a time"""
+    page = OrderTrackingPage(
+        page_size=clamp_page_size(
+            request.args.get("per_page"), ORDER_TRACKING_PAGE_SIZE, ORDER_TRACKING_MAX_PAGE_SIZE
+        ),
+        before=parse_tracking_cursor(
+            request.args.get("before"),
+            request.args.get("before_id"),
+            request.args.get("before_source"),
+            request.args.get("before_row"),
+        ),
+        status=request.args.get("status"),
+        driver_id=request.args.get("driver_id"),
+    )
+    # Rows are rendered as they arrive from the server-side cursor
+    return stream_template(
+        "order_tracking.html",
+        orders=page,
+        statuses=ORDER_TRACKING_STATUSES,
+        now=datetime.now(),
+    )
+
+
+@delivery.route("/events")
+@login_required
+def order_events():
+    """Server-Sent Events feed of order changes for live page updates"""
+    return Response(
+        sse_stream(hub.subscribe()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
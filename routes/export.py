@@ -0,0 +1,85 @@
+import logging
+
+import psycopg
+from flask import Blueprint, Response, jsonify, request
+from flask_login import current_user, login_required
+
+from config import ADMIN_DRIVER_IDS
+from export import FORMATS, TABLES, export_chunks, export_slots, parse_time
+from helpers import format_error_response
+from models import release_request_connection
+
+export = Blueprint("export", __name__)
+
+
+@export.route("/export")
+@login_required
+def export_route():
+    """
+    Stream a table as CSV or Parquet straight from COPY ... TO STDOUT.
+    ?table=order_tracking|delivery_requests|drivers&format=csv|parquet
+    &since=&until= (ISO dates, until exclusive)&driver_id=&status=.
+    Drivers outside ADMIN_DRIVER_IDS only get their own rows, and not drivers.
+    """
+    table = request.args.get("table", "order_tracking")
+    fmt = request.args.get("format", "csv")
+    driver_id = request.args.get("driver_id") or None
+    if current_user.id not in ADMIN_DRIVER_IDS:
+        if table == "drivers":
+            return jsonify(format_error_response("Not allowed.")), 403
+        driver_id = current_user.id
+    if table not in TABLES or fmt not in FORMATS:
+        return jsonify(format_error_response("Unknown table or format.")), 400
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        chunks = export_chunks(
+            table, fmt, since=since, until=until, driver_id=driver_id, status=request.args.get("status") or None
+        )
+    except ValueError as e:
+        return jsonify(format_error_response(str(e))), 400
+    except RuntimeError as e:
+        return jsonify(format_error_response(str(e))), 501
+
+    if not export_slots.acquire(blocking=False):
+        return jsonify(format_error_response("Too many exports running; try again shortly.")), 503
+    def finish():
+        # Runs once the server closes the response, even if it never iterated it
+        chunks.close()
+        export_slots.release()
+
+    # The export has its own connection; give back the pooled one load_user may have taken
+    release_request_connection()
+    try:
+        # Connect and run COPY now, so a failure is still a proper error response
+        first = next(chunks, b"")
+    except psycopg.Error as e:
+        finish()
+        logging.error(f"Export error: {e}")
+        return jsonify(format_error_response("Export is unavailable.")), 503
+    except BaseException:
+        # e.g. pyarrow.ArrowInvalid or OSError from the Parquet writer; the slot must not leak
+        finish()
+        raise
+
+    def stream():
+        # Runs after the request context is gone; only the export's own connection is used
+        try:
+            yield first
+            yield from chunks
+        except psycopg.Error as e:
+            # Headers are gone; the client sees a truncated body
+            logging.error(f"Export error after {table} stream started: {e}")
+
+    filename = f"{table}.{'csv' if fmt == 'csv' else 'parquet'}"
+    response = Response(
+        stream(),
+        mimetype=FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
+    response.call_on_close(finish)
+    return response
@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from flask import Blueprint, jsonify, request
+from flask_login import login_required
+
+from config import STATS_DEFAULT_DAYS, STATS_MAX_DAYS
+from helpers import clamp_page_size, format_error_response, format_success_response
+from models import delivery_stats
+
+stats = Blueprint("stats", __name__)
+
+
+@stats.route("/stats")
+@login_required
+def delivery_stats_route():
+    """Delivery totals over the last ?days= days, read from the daily rollups only"""
+    days = clamp_page_size(request.args.get("days"), STATS_DEFAULT_DAYS, STATS_MAX_DAYS)
+    since = date.today() - timedelta(days=days - 1)
+    result = delivery_stats(since, request.args.get("driver_id") or None)
+    if result is None:
+        return jsonify(format_error_response("Statistics are unavailable.")), 503
+    return jsonify(format_success_response({"since": since.isoformat(), "days": days, **result}))
@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, request
 from flask_login import login_required, current_user
-from models import update_stock, view_my_stock
-from helpers import flash_error, flash_success, validate_stock_update, log_activity, log_error
+from models import add_stock, view_my_stock
+from helpers import flash_error, flash_success, log_activity, log_error
+from config import MAX_STOCK
 
 stock = Blueprint("stock", __name__)
 
@@ -12,21 +13,21 @@ def update_stock_route():
     if request.method == "POST":
         try:
             new_stock = int(request.form["new_stock"])
-            current_stock = view_my_stock(current_user.id)
-
-            # Validate stock update
-            is_valid, error_message = validate_stock_update(current_stock, new_stock)
-            if not is_valid:
-                flash_error(error_message)
+            if new_stock <= 0:
+                flash_error("Please enter a number greater than 0.")
                 return redirect(url_for("stock.update_stock_route"))
 
-            # Update stock
-            if update_stock(current_user.id, current_stock + new_stock):
-                log_activity("STOCK_UPDATE", current_user.id, f"Added {new_stock} items")
-                flash_success(f"Stock updated successfully! New stock: {current_stock + new_stock}")
-            else:
+            # The cap is enforced by the same statement that adds the stock
+            result = add_stock(current_user.id, new_stock)
+            if result is None:
                 log_error("STOCK_UPDATE_FAILED", current_user.id, f"Failed to add {new_stock} items")
                 flash_error("Failed to update stock.")
+            elif not result[0]:
+                flash_error(f"The total stock cannot exceed {MAX_STOCK}. Current stock: {result[1]}")
+                return redirect(url_for("stock.update_stock_route"))
+            else:
+                log_activity("STOCK_UPDATE", current_user.id, f"Added {new_stock} items")
+                flash_success(f"Stock updated successfully! New stock: {result[1]}")
 
             return redirect(url_for("dashboard"))
 
@@ -36,4 +37,7 @@ def update_stock_route():
 
     # Handle GET request
     current_stock = view_my_stock(current_user.id)
+    if current_stock is None:
+        flash_error("Could not load your stock; please try again.")
+        return redirect(url_for("dashboard"))
     return render_template("update_stock.html", current_stock=current_stock)
@@ -0,0 +1,165 @@
+"""
+Visiting order for a driver's active deliveries.
+
+Distances between every pair of known addresses (data/geocodes.csv) are
+precomputed once into a float32 matrix on disk and memory-mapped, so every
+worker process shares the same pages. Planning a route is then a handful of
+table lookups: with at most a few stops every visiting order is tried, which
+takes microseconds.
+
+Distances are great-circle meters between geocoded points; there is no road
+network here, so they rank orders rather than predict drive times.
+
+Usage:
+    python routing.py build             # (re)build the matrix from the geocode table
+"""
+import argparse
+import logging
+import math
+import os
+import threading
+from itertools import permutations
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import DISTANCE_MATRIX_PATH, GEOCODES_PATH, ROUTE_EXACT_MAX_STOPS
+from geo import Geocoder
+
+EARTH_RADIUS_METERS = 6_371_000.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; works elementwise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
+
+
+def _addresses_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".addresses"
+
+
+def build_matrix(geocoder: Geocoder, path: str = DISTANCE_MATRIX_PATH) -> int:
+    """Write the pairwise distance matrix and its address list; returns the number of addresses."""
+    addresses = geocoder.addresses()
+    coords = np.array([geocoder.geocode(a) for a in addresses], dtype=np.float64).reshape(-1, 2)
+    lat, lon = coords[:, 0], coords[:, 1]
+    matrix = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :]).astype(np.float32)
+
+    # Replace both files atomically so a worker never maps a half-written matrix
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, matrix)
+    with open(f"{tmp}.addresses", "w", encoding="utf-8") as f:
+        f.write("\n".join(addresses) + "\n")
+    os.replace(f"{tmp}.addresses", _addresses_path(path))
+    os.replace(tmp, path)
+    return len(addresses)
+
+
+class DistanceMatrix:
+    """Memory-mapped pairwise distances between the addresses of the geocode table."""
+
+    def __init__(self, geocoder: Geocoder, path: str = DISTANCE_MATRIX_PATH):
+        self.geocoder = geocoder
+        if self._stale(path):
+            count = build_matrix(geocoder, path)
+            logging.info(f"Built distance matrix for {count} addresses at {path}")
+        with open(_addresses_path(path), encoding="utf-8") as f:
+            addresses = [line.rstrip("\n") for line in f if line.strip()]
+        self.matrix = np.load(path, mmap_mode="r")
+        if self.matrix.shape != (len(addresses), len(addresses)):
+            raise ValueError(f"Distance matrix {path} does not match its address list; rebuild it")
+        self._index = {address: i for i, address in enumerate(addresses)}
+
+    @staticmethod
+    def _stale(path: str) -> bool:
+        if not (os.path.exists(path) and os.path.exists(_addresses_path(path))):
+            return True
+        return os.path.getmtime(path) < os.path.getmtime(GEOCODES_PATH)
+
+    def index_of(self, address: str) -> Optional[int]:
+        key = self.geocoder.resolve(address)
+        return self._index.get(key) if key is not None else None
+
+
+def _path_length(order: Sequence[int], legs: np.ndarray, start_legs: Optional[np.ndarray]) -> float:
+    total = float(start_legs[order[0]]) if start_legs is not None else 0.0
+    for a, b in zip(order, order[1:]):
+        total += float(legs[a, b])
+    return total
+
+
+def _greedy_order(legs: np.ndarray, start_legs: Optional[np.ndarray]) -> List[int]:
+    remaining = list(range(len(legs)))
+    current = int(np.argmin(start_legs)) if start_legs is not None else 0
+    order = [current]
+    remaining.remove(current)
+    while remaining:
+        current = min(remaining, key=lambda j: legs[current, j])
+        order.append(current)
+        remaining.remove(current)
+    return order
+
+
+def plan_route(
+    matrix: DistanceMatrix, addresses: Sequence[str], start: Optional[Tuple[float, float]] = None
+) -> Tuple[List[int], List[Optional[float]]]:
+    """
+    Visiting order for `addresses` as indexes into it, plus the length of each
+    leg in meters (the first leg is from `start`, or None without one).
+    Without a start the shortest open path from any stop is chosen. Addresses
+    that cannot be geocoded keep their relative order at the end, with None legs.
+    """
+    known, unknown = [], []
+    for i, address in enumerate(addresses):
+        index = matrix.index_of(address)
+        (known if index is not None else unknown).append((i, index))
+    if not known:
+        return [i for i, _ in unknown], [None] * len(unknown)
+
+    rows = np.fromiter((index for _, index in known), dtype=np.intp, count=len(known))
+    legs = np.asarray(matrix.matrix[np.ix_(rows, rows)], dtype=np.float64)
+    start_legs = None
+    if start is not None:
+        coords = np.array([matrix.geocoder.geocode(addresses[i]) for i, _ in known], dtype=np.float64)
+        start_legs = haversine(start[0], start[1], coords[:, 0], coords[:, 1])
+
+    if len(known) <= ROUTE_EXACT_MAX_STOPS:
+        best = min(permutations(range(len(known))), key=lambda order: _path_length(order, legs, start_legs))
+    else:
+        best = _greedy_order(legs, start_legs)
+
+    order = [known[k][0] for k in best]
+    distances = [float(start_legs[best[0]]) if start_legs is not None else None]
+    distances += [float(legs[a, b]) for a, b in zip(best, best[1:])]
+    return order + [i for i, _ in unknown], distances + [None] * len(unknown)
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def distance_matrix() -> DistanceMatrix:
+    """The process-wide distance matrix, mapped on first use."""
+    global _matrix
+    with _matrix_lock:
+        if _matrix is None:
+            _matrix = DistanceMatrix(Geocoder())
+        return _matrix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--path", default=DISTANCE_MATRIX_PATH)
+    args = parser.parse_args()
+
+    count = build_matrix(Geocoder(), args.path)
+    print(f"{count} addresses, {count * count:,} distances written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+// Live page updates from the /events Server-Sent Events feed.
+// The page is rendered once; order events are applied as small deltas.
+
+function showRefreshBanner(message) {
+    let banner = document.getElementById("live-banner");
+    if (!banner) {
+        banner = document.createElement("div");
+        banner.id = "live-banner";
+        banner.className = "alert alert-info";
+        document.querySelector("h1").insertAdjacentElement("afterend", banner);
+    }
+    banner.innerHTML = "";
+    banner.appendChild(document.createTextNode(message + " "));
+    const link = document.createElement("a");
+    link.href = window.location.href;
+    link.textContent = "Refresh";
+    banner.appendChild(link);
+}
+
+function rowsFor(requestId) {
+    return document.querySelectorAll(`tr[data-request-id="${requestId}"]`);
+}
+
+function setCell(row, column, text) {
+    const cell = row.querySelector(`[data-col="${column}"]`);
+    if (cell) {
+        cell.textContent = text;
+        cell.classList.remove("pending-alarm");
+    }
+}
+
+const handlers = {
+    unassigned: function (event) {
+        switch (event.type) {
+            case "accepted":
+                rowsFor(event.request_id).forEach((row) => row.remove());
+                break;
+            case "created":
+            case "resigned":
+            case "resync":
+                showRefreshBanner("New requests are available.");
+                break;
+        }
+    },
+    tracking: function (event) {
+        switch (event.type) {
+            case "accepted":
+                rowsFor(event.request_id).forEach((row) => {
+                    if (row.dataset.status === "pending" || row.dataset.status === "pending(*)") {
+                        row.dataset.status = "in-progress";
+                        setCell(row, "status", "in-progress");
+                        setCell(row, "driver", event.driver_id);
+                    }
+                });
+                break;
+            case "completed":
+                rowsFor(event.request_id).forEach((row) => {
+                    if (row.dataset.status === "in-progress") {
+                        row.dataset.status = "completed";
+                        setCell(row, "status", "completed");
+                    }
+                });
+                break;
+            case "created":
+            case "resigned":
+            case "resync":
+                showRefreshBanner("Orders have changed.");
+                break;
+        }
+    },
+};
+
+document.addEventListener("DOMContentLoaded", function () {
+    const page = document.body.dataset.livePage;
+    const handle = handlers[page];
+    if (!handle || !window.EventSource) {
+        return;
+    }
+    const source = new EventSource(document.body.dataset.eventsUrl);
+    source.onmessage = function (message) {
+        handle(JSON.parse(message.data));
+    };
+});
@@ -0,0 +1,253 @@
+"""
+Every writer must publish an order event, or conditional GETs (routes/api.py
+`conditional`) keep answering 304 with stale data.
+
+Each write path below runs against a real database and must advance the
+data versions of a stub hub, which is fed from its own LISTEN connection
+instead of the background listener thread. The tests insert and delete their
+own drivers and requests, so point DB_* at a disposable database with all
+migrations applied and set RUN_DB_TESTS=1; otherwise they are skipped.
+
+    RUN_DB_TESTS=1 python -m unittest discover -s tests -t .
+"""
+import os
+import select
+import unittest
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extensions
+
+from config import DB_CONFIG
+from events import CHANNEL, DataVersions
+
+RUN = os.getenv("RUN_DB_TESTS") == "1"
+DRIVER = "T901"
+OTHER_DRIVER = "T902"
+ADDRESS = "三鷹市下連雀1-1-1"
+
+
+class StubHub:
+    """Stands in for events.hub: always connected, versions advanced only by drain()."""
+
+    connected = True
+
+    def __init__(self):
+        self.versions = DataVersions()
+        self._conn = psycopg2.connect(**DB_CONFIG)
+        self._conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+
+    def start(self) -> None:
+        pass
+
+    def drain(self, timeout: float = 1.0) -> int:
+        """Feed the notifications received so far to the versions; returns how many there were."""
+        received = 0
+        while select.select([self._conn], [], [], timeout) != ([], [], []):
+            self._conn.poll()
+            while self._conn.notifies:
+                self.versions.observe(self._conn.notifies.pop(0).payload)
+                received += 1
+            timeout = 0.05  # the rest of one commit's notifications arrive together
+        return received
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+@unittest.skipUnless(RUN, "set RUN_DB_TESTS=1 with DB_* pointing at a disposable database")
+class WritesAdvanceVersionsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import routes.api
+        from app import app
+
+        cls.app = app
+        app.session_cleared = True  # app.clear_session would otherwise log the test client out
+        cls.api = routes.api
+        cls.admin = psycopg2.connect(**DB_CONFIG)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.admin.close()
+
+    def setUp(self):
+        self.request_ids = []
+        self._cleanup()
+        with self.admin.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO drivers (driver_id, name, password_hash, current_stock) VALUES (%s, %s, %s, 0)",
+                [(DRIVER, "test driver", b""), (OTHER_DRIVER, "other test driver", b"")],
+            )
+        self.admin.commit()
+        self.hub = StubHub()
+        self._real_hub, self.api.hub = self.api.hub, self.hub
+
+    def tearDown(self):
+        self.api.hub = self._real_hub
+        self.hub.close()
+        self._cleanup()
+
+    def _cleanup(self):
+        with self.admin.cursor() as cur:
+            cur.execute(
+                "SELECT request_id FROM delivery_requests WHERE assigned_driver_id = ANY(%s) OR request_id = ANY(%s)",
+                ([DRIVER, OTHER_DRIVER], self.request_ids),
+            )
+            request_ids = [row[0] for row in cur.fetchall()] + self.request_ids
+            cur.execute("DELETE FROM order_tracking WHERE request_id = ANY(%s)", (request_ids,))
+            cur.execute("DELETE FROM delivery_requests WHERE request_id = ANY(%s)", (request_ids,))
+            cur.execute("DELETE FROM driver_daily_stats WHERE driver_id = ANY(%s)", ([DRIVER, OTHER_DRIVER],))
+            cur.execute("DELETE FROM drivers WHERE driver_id = ANY(%s)", ([DRIVER, OTHER_DRIVER],))
+        self.admin.commit()
+
+    def _pending_request(self, quantity: int = 1) -> int:
+        with self.admin.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO delivery_requests (dropoff_address, quantity, status, ordered_at)
+                VALUES (%s, %s, 'pending', LOCALTIMESTAMP) RETURNING request_id
+                """,
+                (ADDRESS, quantity),
+            )
+            request_id = cur.fetchone()[0]
+        self.admin.commit()
+        self.request_ids.append(request_id)
+        self.hub.drain()  # the insert trigger's own event
+        return request_id
+
+    def _set_stock(self, driver_id: str, stock: int) -> None:
+        with self.admin.cursor() as cur:
+            cur.execute("UPDATE drivers SET current_stock = %s WHERE driver_id = %s", (stock, driver_id))
+        self.admin.commit()
+
+    def assertAdvances(self, write, driver_id=DRIVER):
+        """Run write() and check it moved both the shared and the driver's version."""
+        self.hub.drain(timeout=0.05)
+        shared, own = self.hub.versions.current(), self.hub.versions.current(driver_id)
+        result = write()
+        self.assertTrue(result, f"write returned {result!r}")
+        self.assertGreater(self.hub.drain(), 0, "no order event was published")
+        self.assertNotEqual(self.hub.versions.current(), shared)
+        if driver_id:
+            self.assertNotEqual(self.hub.versions.current(driver_id), own)
+
+    def test_update_stock(self):
+        import models
+
+        self.assertAdvances(lambda: models.update_stock(DRIVER, 4))
+
+    def test_add_stock(self):
+        import models
+
+        self.assertAdvances(lambda: models.add_stock(DRIVER, 2)[0])
+
+    def test_restock(self):
+        import models
+
+        self.assertAdvances(lambda: models.restock_drivers([(DRIVER, 5)]))
+
+    def test_accept(self):
+        import models
+
+        self._set_stock(DRIVER, 5)
+        request_id = self._pending_request()
+        self.assertAdvances(lambda: models.accept_delivery(DRIVER, request_id))
+
+    def test_resign(self):
+        import models
+
+        self._set_stock(DRIVER, 5)
+        request_id = self._pending_request()
+        self.assertTrue(models.accept_delivery(DRIVER, request_id))
+        self.assertAdvances(lambda: models.resign_delivery(DRIVER, request_id))
+
+    def test_complete(self):
+        import models
+
+        self._set_stock(DRIVER, 5)
+        request_id = self._pending_request()
+        self.assertTrue(models.accept_delivery(DRIVER, request_id))
+        self.assertAdvances(lambda: models.complete_delivery(DRIVER, request_id))
+
+    def test_intake(self):
+        from intake import load_orders
+
+        def load():
+            request_ids = load_orders([(ADDRESS, 1, datetime.now())])
+            self.request_ids += request_ids or []
+            return request_ids
+
+        self.assertAdvances(load, driver_id=None)
+
+    def test_dispatch(self):
+        import dispatch
+
+        # Only the test driver has stock during the round; the others' stock is put back after
+        with self.admin.cursor() as cur:
+            cur.execute("SELECT driver_id, current_stock FROM drivers WHERE current_stock > 0 AND driver_id <> %s", (DRIVER,))
+            stocks = cur.fetchall()
+            cur.execute("UPDATE drivers SET current_stock = 0 WHERE driver_id = ANY(%s)", ([d for d, _ in stocks],))
+        self.admin.commit()
+        try:
+            self._set_stock(DRIVER, 5)
+            self._pending_request()
+            self.assertAdvances(lambda: dispatch.dispatch_round(limit=1000)["assigned"])
+        finally:
+            with self.admin.cursor() as cur:
+                cur.executemany("UPDATE drivers SET current_stock = %s WHERE driver_id = %s", [(s, d) for d, s in stocks])
+            self.admin.commit()
+
+    def _get(self, client, path, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return client.get(path, headers=headers, base_url="https://localhost")  # the session cookie is Secure
+
+    def _client(self):
+        from flask_login import FlaskLoginClient
+
+        from models import User
+
+        self.app.test_client_class = FlaskLoginClient
+        return self.app.test_client(user=User(DRIVER, "test driver"))
+
+    def test_conditional_get(self):
+        import models
+
+        client = self._client()
+        first = self._get(client, "/api/v1/stock")
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+
+        # Unchanged data: 304 with the same ETag
+        again = self._get(client, "/api/v1/stock", etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], etag)
+
+        # Another driver's write leaves this driver's stock version alone
+        self.assertTrue(models.update_stock(OTHER_DRIVER, 3))
+        self.hub.drain()
+        self.assertEqual(self._get(client, "/api/v1/stock", etag).status_code, 304)
+
+        # The driver's own write: full response with a new ETag
+        self.assertTrue(models.update_stock(DRIVER, 6))
+        self.hub.drain()
+        changed = self._get(client, "/api/v1/stock", etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json(), {"stock": 6})
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_failed_read_has_no_etag(self):
+        client = self._client()
+        real, self.api.view_my_stock = self.api.view_my_stock, lambda driver_id: None
+        try:
+            response = self._get(client, "/api/v1/stock")
+        finally:
+            self.api.view_my_stock = real
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn("ETag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
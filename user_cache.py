@@ -0,0 +1,121 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class UserCache:
+    """
+    Bounded LRU cache of driver names with TTL expiry, used by the
+    Flask-Login user_loader so steady-state requests need no query.
+
+    If `shared_path` is set, entries are also written to a SQLite file that
+    every worker on the host reads on a local miss, so a name loaded by one
+    worker is reused by the others and invalidations reach all of them
+    (local copies still live for at most `ttl` seconds).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, shared_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_path = shared_path
+        self._entries = OrderedDict()  # driver_id -> (name, expires_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _shared(self) -> Optional[sqlite3.Connection]:
+        if not self.shared_path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.shared_path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users (driver_id TEXT PRIMARY KEY, name TEXT, expires_at REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, driver_id: str) -> Optional[str]:
+        """Return the cached name, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(driver_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(driver_id)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[driver_id]
+
+        name = self._get_shared(driver_id, now)
+        with self._lock:
+            if name is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._put_local(driver_id, name, now)
+        return name
+
+    def set(self, driver_id: str, name: str) -> None:
+        now = time.time()
+        self._put_local(driver_id, name, now)
+        try:
+            shared = self._shared()
+            if shared:
+                shared.execute(
+                    "INSERT OR REPLACE INTO users (driver_id, name, expires_at) VALUES (?, ?, ?)",
+                    (driver_id, name, now + self.ttl),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Shared user cache write failed: {e}")
+
+    def invalidate(self, driver_id: str) -> None:
+        with self._lock:
+            self._entries.pop(driver_id, None)
+        try:
+            shared = self._shared()
+            if shared:
+                shared.execute("DELETE FROM users WHERE driver_id = ?", (driver_id,))
+        except sqlite3.Error as e:
+            logging.error(f"Shared user cache invalidation failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+            }
+
+    def _put_local(self, driver_id: str, name: str, now: float) -> None:
+        with self._lock:
+            self._entries[driver_id] = (name, now + self.ttl)
+            self._entries.move_to_end(driver_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, driver_id: str, now: float) -> Optional[str]:
+        try:
+            shared = self._shared()
+            if not shared:
+                return None
+            row = shared.execute(
+                "SELECT name FROM users WHERE driver_id = ? AND expires_at > ?", (driver_id, now)
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Shared user cache read failed: {e}")
+            return None